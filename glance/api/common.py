@@ -13,14 +13,50 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+import hashlib
+import uuid
+
+import webob.exc
+
 from glance.common import exception
+from glance.common import utils
 from glance.openstack.common import log as logging
+from glance.openstack.common import timeutils
 
 LOG = logging.getLogger(__name__)
 
 
 def size_checked_iter(response, image_meta, expected_size, image_iter,
                       notifier):
+    """
+    Wrap an image body iterator so that the number of bytes sent is
+    checked against the expected image size, and an image.send
+    notification is sent once the response is complete.
+
+    A utils.FileWrapper of the expected length is returned as is, so
+    that the server can still send it with sendfile(); the notification
+    then reports the bytes the wrapper actually sent. This needs the
+    server to run hooks once the response is sent, otherwise the
+    wrapper is iterated over like any other body.
+    """
+    posthooks = response.request.environ.get('eventlet.posthooks')
+    if (posthooks is not None and
+            isinstance(image_iter, utils.FileWrapper) and
+            image_iter.length == expected_size):
+        def notify_file_sent_hook(env):
+            image_send_notification(image_iter.bytes_sent, expected_size,
+                                    image_meta, response.request, notifier)
+
+        posthooks.append((notify_file_sent_hook, (), {}))
+        return image_iter
+
+    return _size_checked_iter(response, image_meta, expected_size,
+                              image_iter, notifier)
+
+
+def _size_checked_iter(response, image_meta, expected_size, image_iter,
+                       notifier):
     image_id = image_meta['id']
     bytes_written = 0
 
@@ -29,9 +65,9 @@ def size_checked_iter(response, image_meta, expected_size, image_iter,
                                 image_meta, response.request, notifier)
 
     # Add hook to process after response is fully sent
-    if 'eventlet.posthooks' in response.request.environ:
-        response.request.environ['eventlet.posthooks'].append(
-            (notify_image_sent_hook, (), {}))
+    posthooks = response.request.environ.get('eventlet.posthooks')
+    if posthooks is not None:
+        posthooks.append((notify_image_sent_hook, (), {}))
 
     try:
         for chunk in image_iter:
@@ -42,6 +78,11 @@ def size_checked_iter(response, image_meta, expected_size, image_iter,
                 "for image %(image_id)s: %(err)s") % locals()
         LOG.error(msg)
         raise
+    finally:
+        # Without hooks, notify once the body has been written, or the
+        # client has gone away
+        if posthooks is None:
+            notify_image_sent_hook(None)
 
     if expected_size != bytes_written:
         msg = _("Backend storage for image %(image_id)s "
@@ -76,3 +117,197 @@ def image_send_notification(bytes_written, expected_size, image_meta, request,
         msg = _("An error occurred during image.send"
                 " notification: %(err)s") % locals()
         LOG.error(msg)
+
+
+def make_etag(*parts):
+    """
+    Build an entity tag from the given values, which are hashed in
+    order, so that any change to one of them gives a different tag.
+    Lists and tuples are hashed element by element.
+    """
+    md5 = hashlib.md5()
+
+    def _update(part):
+        if isinstance(part, (list, tuple)):
+            for item in part:
+                _update(item)
+        else:
+            if isinstance(part, datetime.datetime):
+                part = timeutils.isotime(part)
+            if not isinstance(part, str):
+                part = unicode(part).encode('utf-8')
+            md5.update(part)
+        md5.update('\0')
+
+    for part in parts:
+        _update(part)
+    return md5.hexdigest()
+
+
+def get_last_modified(timestamp):
+    """
+    Return the time a resource was last modified as an HTTP date would
+    give it, i.e. a naive UTC datetime truncated to whole seconds.
+
+    :param timestamp: A datetime, an ISO 8601 string or None
+    :retval a datetime, or None if timestamp is empty or cannot be parsed
+    """
+    if not timestamp:
+        return None
+    if not isinstance(timestamp, datetime.datetime):
+        try:
+            timestamp = timeutils.parse_isotime(timestamp)
+        except ValueError:
+            return None
+    return timeutils.normalize_time(timestamp).replace(microsecond=0)
+
+
+def check_not_modified(request, etag=None, last_modified=None,
+                       headers=None):
+    """
+    Raise a 304 Not Modified error if the If-None-Match or, failing that,
+    If-Modified-Since header of a GET or HEAD request shows that the copy
+    of the resource the client holds is still current. This is meant to
+    be called before the response body is built.
+
+    An If-Modified-Since header is only evaluated when the request has no
+    If-None-Match header, and only to whole second precision, so an entity
+    tag should be preferred where one is available.
+
+    :param request: The WSGI/Webob Request object
+    :param etag: Current entity tag of the resource, if any
+    :param last_modified: Time the resource was last modified, as returned
+                          by get_last_modified(), if known
+    :param headers: Headers to send with the 304 response, by default the
+                    ETag and Last-Modified headers of the resource
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return
+
+    headers = dict(headers or {})
+    if etag is not None:
+        headers.setdefault('ETag', '"%s"' % etag)
+    if last_modified is not None:
+        headers.setdefault('Last-Modified', last_modified.strftime(
+                '%a, %d %b %Y %H:%M:%S GMT'))
+
+    if 'If-None-Match' in request.headers:
+        if etag is None or etag not in request.if_none_match:
+            return
+    elif last_modified is not None and request.if_modified_since:
+        if_modified_since = timeutils.normalize_time(
+                request.if_modified_since)
+        if last_modified > if_modified_since:
+            return
+    else:
+        return
+
+    raise webob.exc.HTTPNotModified(request=request, headers=headers)
+
+
+def get_byte_ranges(request, image_size, etag=None):
+    """
+    Return the byte ranges of an image requested through the Range header
+    of a GET request as a sorted list of (start, stop) tuples, where stop
+    is non-inclusive, or None if the whole image should be sent.
+
+    Ranges the image cannot satisfy are dropped; if none are left a
+    416 Requested Range Not Satisfiable error is raised. An If-Range
+    header that does not match etag causes the Range header to be
+    ignored, as does a Range header that cannot be parsed.
+
+    :param request: The WSGI/Webob Request object
+    :param image_size: Size of the image data in bytes
+    :param etag: Entity tag of the image data, i.e. its checksum
+    """
+    if request.method != 'GET' or 'Range' not in request.headers:
+        return None
+
+    if not image_size:
+        return None
+
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range.strip('"') != etag:
+        return None
+
+    byte_range = request.range
+    if byte_range is None:
+        return None
+
+    ranges = []
+    for start, stop in byte_range.ranges:
+        if start < 0:
+            # A suffix range, e.g. 'bytes=-500' for the last 500 bytes
+            start = max(image_size + start, 0)
+            stop = image_size
+        elif stop is None or stop > image_size:
+            stop = image_size
+        if start < stop:
+            ranges.append((start, stop))
+
+    if not ranges:
+        msg = _("None of the requested byte ranges can be satisfied")
+        raise webob.exc.HTTPRequestRangeNotSatisfiable(
+                explanation=msg, request=request, content_type='text/plain',
+                headers={'Content-Range': 'bytes */%d' % image_size})
+
+    return sorted(ranges)
+
+
+def get_partial_content(ranges, image_size, read_range,
+                        content_type='application/octet-stream'):
+    """
+    Build the body of a 206 Partial Content response serving the given
+    byte ranges of an image.
+
+    A single range is returned as is, while several ranges are wrapped
+    in a multipart/byteranges body. The first range is read straight
+    away so that errors opening the image data surface before the
+    response starts; the data for any further range is only read as the
+    body is consumed.
+
+    :param ranges: list of (start, stop) tuples from get_byte_ranges()
+    :param image_size: Size of the image data in bytes
+    :param read_range: Callable taking start and stop offsets and
+                       returning an iterator over that part of the image
+    :param content_type: Content-Type of the image data
+    :retval tuple of (headers, body iterator, body length in bytes)
+    """
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers = {
+            'Content-Type': content_type,
+            'Content-Range': 'bytes %d-%d/%d' % (start, stop - 1, image_size),
+        }
+        return headers, read_range(start, stop), stop - start
+
+    boundary = uuid.uuid4().hex
+    parts = []
+    for start, stop in ranges:
+        part_headers = ('--%s\r\n'
+                        'Content-Type: %s\r\n'
+                        'Content-Range: bytes %d-%d/%d\r\n'
+                        '\r\n' % (boundary, content_type, start,
+                                  stop - 1, image_size))
+        parts.append((part_headers, start, stop))
+    closing = '--%s--\r\n' % boundary
+
+    body_size = len(closing)
+    for part_headers, start, stop in parts:
+        body_size += len(part_headers) + (stop - start) + len('\r\n')
+
+    first_part = read_range(parts[0][1], parts[0][2])
+
+    def multipart_iter():
+        for index, (part_headers, start, stop) in enumerate(parts):
+            yield part_headers
+            part_iter = first_part if index == 0 else read_range(start, stop)
+            for chunk in part_iter:
+                yield chunk
+            yield '\r\n'
+        yield closing
+
+    headers = {
+        'Content-Type': 'multipart/byteranges; boundary=%s' % boundary,
+    }
+    return headers, multipart_iter(), body_size
@@ -26,18 +26,25 @@ the local cached copy of the image file is returned.
 
 import re
 
+import eventlet.event
+import eventlet.timeout
 import webob
+import webob.dec
 
+from glance.api import common
 from glance.api.v1 import images
 from glance.common import exception
 from glance.common import utils
 from glance.common import wsgi
 from glance import image_cache
+from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 from glance import registry
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+
 PATTERNS = {
     ('v1', 'GET'): re.compile(r'^/v1/images/([^\/]+)$'),
     ('v1', 'DELETE'): re.compile(r'^/v1/images/([^\/]+)$'),
@@ -51,6 +58,10 @@ class CacheFilter(wsgi.Middleware):
     def __init__(self, app):
         self.cache = image_cache.ImageCache()
         self.serializer = images.ImageSerializer()
+        # Maps the ids of images that requests are fetching from the
+        # store into the cache to events sent once those requests have
+        # started writing the image file, or have failed to
+        self.cache_fills = {}
         LOG.info(_("Initialized image cache middleware"))
         super(CacheFilter, self).__init__(app)
 
@@ -90,11 +101,19 @@ class CacheFilter(wsgi.Middleware):
 
         self._stash_request_info(request, image_id, method)
 
-        if request.method != 'GET' or not self.cache.is_cached(image_id):
+        if request.method != 'GET':
             return None
 
-        LOG.debug(_("Cache hit for image '%s'"), image_id)
-        image_iterator = self.get_from_cache(image_id)
+        if self.cache.is_cached(image_id):
+            LOG.debug(_("Cache hit for image '%s'"), image_id)
+            image_iterator = self.get_from_cache(image_id)
+        elif self._link_by_checksum(request, image_id):
+            LOG.debug(_("Cache hit by checksum for image '%s'"), image_id)
+            image_iterator = self.get_from_cache(image_id)
+        else:
+            image_iterator = self._join_cache_fill(request, image_id)
+            if image_iterator is None:
+                return None
         method = getattr(self, '_process_%s_request' % version)
 
         try:
@@ -106,6 +125,105 @@ class CacheFilter(wsgi.Middleware):
             LOG.error(msg)
             self.cache.delete_cached_image(image_id)
 
+    @webob.dec.wsgify
+    def __call__(self, request):
+        try:
+            response = self.process_request(request)
+            if response:
+                return response
+            response = request.get_response(self.application)
+            return self.process_response(response)
+        finally:
+            self._end_cache_fill(request)
+
+    def _link_by_checksum(self, request, image_id):
+        """
+        Called on a cache miss when the cache stores the data of images
+        with the same checksum only once, to cache the image without
+        fetching it from the store if an image with the same data is
+        already cached under another ID. The registry checksum is not
+        trusted for that: the cache only links images whose data it
+        hashed to the same checksum before.
+        """
+        if not self.cache.dedup:
+            return False
+
+        try:
+            image_meta = registry.get_image_metadata(request.context,
+                                                     image_id)
+        except (exception.NotFound, exception.Forbidden):
+            # Let the images resource report the error
+            return False
+
+        if image_meta['deleted']:
+            return False
+        return self.cache.link_image(image_id, image_meta['checksum'])
+
+    def _join_cache_fill(self, request, image_id):
+        """
+        Called on a cache miss, so that concurrent requests for the same
+        image fetch it from the store only once. If another request is
+        fetching the image into the cache, we wait for it to start
+        writing and return an iterator that follows the image file as
+        it is cached. Otherwise we return None, and the request goes on
+        to fetch the image, making later requests wait for it.
+
+        Byte range requests are always passed on to the store.
+        """
+        if request.range:
+            return None
+
+        cache_fill = self.cache_fills.get(image_id)
+        if cache_fill:
+            LOG.debug(_("Waiting for another request to start caching "
+                        "image '%s'"), image_id)
+            with eventlet.timeout.Timeout(CONF.image_cache_follow_timeout,
+                                          False):
+                cache_fill.wait()
+
+        if self.cache.is_cached(image_id):
+            LOG.debug(_("Cache hit for image '%s'"), image_id)
+            return self.get_from_cache(image_id)
+
+        image_iterator = self.cache.get_following_iter(image_id)
+        if image_iterator is None and not cache_fill:
+            cache_fill = eventlet.event.Event()
+            self.cache_fills[image_id] = cache_fill
+            request.environ['api.cache.fill'] = cache_fill
+        return image_iterator
+
+    def _end_cache_fill(self, request):
+        """
+        Called once this request has been handled. If its response
+        caches the image, the requests waiting for it are woken once
+        the image file is being written, which only happens when the
+        server iterates over the response body, or at the latest once
+        the response has been sent. Otherwise they are woken now.
+        """
+        if 'api.cache.fill' not in request.environ:
+            return
+
+        posthooks = request.environ.get('eventlet.posthooks')
+        if request.environ.get('api.cache.fill.caching'):
+            if posthooks is not None:
+                posthooks.append((lambda env: self._wake_cache_fill(request),
+                                  (), {}))
+            # NOTE: without posthooks, the waiters give up after
+            # image_cache_follow_timeout if the body is never read
+        else:
+            self._wake_cache_fill(request)
+
+    def _wake_cache_fill(self, request):
+        """
+        Wakes up the requests waiting for this request to start caching
+        its image, if they have not been woken yet
+        """
+        cache_fill = request.environ.pop('api.cache.fill', None)
+        if cache_fill:
+            image_id = request.environ['api.cache.image_id']
+            del self.cache_fills[image_id]
+            cache_fill.send()
+
     @staticmethod
     def _stash_request_info(request, image_id, method):
         """
@@ -136,7 +254,18 @@ class CacheFilter(wsgi.Middleware):
         if image_meta['deleted']:
             raise exception.NotFound()
 
+        # Answer a conditional GET before any cached image data is read
+        checksum = image_meta.get('checksum')
+        headers = {'ETag': checksum.encode('utf-8')} if checksum else None
+        common.check_not_modified(request, checksum,
+                                  images.get_last_modified(image_meta),
+                                  headers)
+
         if not image_meta['size']:
+            if not isinstance(image_iterator, utils.FileWrapper):
+                # The image is still being cached, so the size of the
+                # cached file is not known yet: fetch it from the store
+                return None
             # override image size metadata with the actual cached
             # file size, see LP Bug #900959
             image_meta['size'] = self.cache.get_image_size(image_id)
@@ -146,13 +275,54 @@ class CacheFilter(wsgi.Middleware):
             'image_iterator': image_iterator,
             'image_meta': image_meta,
         }
+
+        byte_ranges = common.get_byte_ranges(request, image_meta['size'],
+                                             image_meta['checksum'])
+        if byte_ranges:
+            headers, image_iterator, size = self._get_partial_content(
+                    image_id, byte_ranges, image_meta['size'])
+            raw_response['image_iterator'] = image_iterator
+            raw_response['partial_content'] = {'headers': headers,
+                                               'size': size}
+
         return self.serializer.show(response, raw_response)
 
     def _process_v2_request(self, request, image_id, image_iterator):
         response = webob.Response(request=request)
         response.app_iter = image_iterator
+        if not isinstance(image_iterator, utils.FileWrapper):
+            # The image is still being cached, so its size is not
+            # known yet and it is sent without a Content-Length
+            return response
+
+        # NOTE: the server can only send the cached file with sendfile()
+        # if the length of the response is known up front
+        image_size = self.cache.get_image_size(image_id)
+        response.headers['Content-Length'] = str(image_size)
+
+        # NOTE: no metadata is fetched for v2 cache hits, so a conditional
+        # If-Range request can never match and is served in full
+        byte_ranges = common.get_byte_ranges(request, image_size)
+        if byte_ranges:
+            headers, image_iterator, size = self._get_partial_content(
+                    image_id, byte_ranges, image_size)
+            response.status_int = 206
+            response.app_iter = image_iterator
+            response.headers.update(headers)
+            response.headers['Content-Length'] = str(size)
         return response
 
+    def _get_partial_content(self, image_id, byte_ranges, image_size):
+        """
+        Build a 206 Partial Content body for the requested byte ranges
+        by seeking directly into the cached image file
+        """
+        def read_range(start, stop):
+            return self.get_from_cache(image_id, start, stop)
+
+        return common.get_partial_content(byte_ranges, image_size,
+                                          read_range)
+
     def process_response(self, resp):
         """
         We intercept the response coming back from the main
@@ -184,6 +354,11 @@ class CacheFilter(wsgi.Middleware):
         return resp
 
     def _process_GET_response(self, resp, image_id):
+        if self.get_status_code(resp) == 206:
+            # A partial response holds only some of the image data,
+            # so there is nothing complete we could cache from it
+            return resp
+
         image_checksum = resp.headers.get('Content-MD5', None)
 
         if not image_checksum:
@@ -193,8 +368,14 @@ class CacheFilter(wsgi.Middleware):
         if not image_checksum:
             LOG.error(_("Checksum header is missing."))
 
+        request = resp.request
+        opened = None
+        if request is not None and 'api.cache.fill' in request.environ:
+            request.environ['api.cache.fill.caching'] = True
+            opened = lambda: self._wake_cache_fill(request)
+
         resp.app_iter = self.cache.get_caching_iter(image_id, image_checksum,
-                                                    resp.app_iter)
+                                                    resp.app_iter, opened)
         return resp
 
     def get_status_code(self, response):
@@ -206,9 +387,16 @@ class CacheFilter(wsgi.Middleware):
             return response.status_int
         return response.status
 
-    def get_from_cache(self, image_id):
-        """Called if cache hit"""
-        with self.cache.open_for_read(image_id) as cache_file:
-            chunks = utils.chunkiter(cache_file)
-            for chunk in chunks:
-                yield chunk
+    def get_from_cache(self, image_id, start=0, stop=None):
+        """
+        Called if cache hit. The cached file is only opened once the
+        returned FileWrapper is iterated over or sent.
+
+        :param image_id: Image ID
+        :param start: Offset of the first byte to return
+        :param stop: Offset one past the last byte to return, or None
+                     to read to the end of the cached file
+        """
+        length = None if stop is None else stop - start
+        return utils.FileWrapper(lambda: self.cache.open_for_read(image_id),
+                                 start, length)
@@ -19,6 +19,8 @@
 
 import json
 import os.path
+import time
+import weakref
 
 from glance.common import exception
 from glance.common import utils
@@ -32,6 +34,7 @@ LOG = logging.getLogger(__name__)
 policy_opts = [
     cfg.StrOpt('policy_file', default='policy.json'),
     cfg.StrOpt('policy_default_rule', default='default'),
+    cfg.IntOpt('policy_file_check_interval', default=5),
 ]
 
 CONF = cfg.CONF
@@ -52,18 +55,31 @@ class Enforcer(object):
         self.policy_path = self._find_policy_file()
         self.policy_file_mtime = None
         self.policy_file_contents = None
+        self.check_interval = CONF.policy_file_check_interval
+        self.rules = None
+        self.rules_checked_at = None
+        # Decisions already made for each request context, which are
+        # forgotten along with the context
+        self.decisions = weakref.WeakKeyDictionary()
 
     def set_rules(self, rules):
         """Create a new Rules object based on the provided dict of rules"""
-        rules_obj = policy.Rules(rules, self.default_rule)
-        policy.set_rules(rules_obj)
+        self.rules = policy.Rules(rules, self.default_rule)
+        self.decisions = weakref.WeakKeyDictionary()
+        policy.set_rules(self.rules)
 
     def load_rules(self):
         """Set the rules found in the json file on disk"""
         if self.policy_path:
+            contents = self.policy_file_contents
             rules = self._read_policy_file()
+            if self.rules is not None and rules is contents:
+                # The file has not changed since the rules were set
+                return
             rule_type = ""
         else:
+            if self.rules is not None:
+                return
             rules = DEFAULT_RULES
             rule_type = "default "
 
@@ -73,6 +89,23 @@ class Enforcer(object):
 
         self.set_rules(rules)
 
+    def _refresh_rules(self):
+        """
+        Load the rules if they have not been loaded, or if the policy file
+        has not been checked for changes in the last check_interval
+        seconds, and make them the rules in use.
+        """
+        now = time.time()
+        if (self.rules is None or self.rules_checked_at is None or
+                now - self.rules_checked_at >= self.check_interval):
+            self.load_rules()
+            self.rules_checked_at = now
+
+        # NOTE: The rules in use are global, and another enforcer with
+        # different rules may have replaced ours since they were set
+        if policy._rules is not self.rules:
+            policy.set_rules(self.rules)
+
     @staticmethod
     def _find_policy_file():
         """Locate the policy json data file"""
@@ -109,7 +142,32 @@ class Enforcer(object):
            :raises: `glance.common.exception.Forbidden`
            :returns: A non-False value if access is allowed.
         """
-        self.load_rules()
+        self._refresh_rules()
+        result = self._decide(context, rule, target)
+
+        # If it is False, raise the exception if requested, as
+        # policy.check() does
+        if result is False and args:
+            exc = args[0]
+            raise exc(*args[1:], **kwargs)
+
+        return result
+
+    def _decide(self, context, rule, target):
+        """
+        Evaluate a rule, or return the result of its previous evaluation
+        for the same context and target.
+        """
+        try:
+            key = (rule, tuple(context.roles), context.user, context.tenant,
+                   tuple(sorted(target.items())))
+            decisions = self.decisions.setdefault(context, {})
+            return decisions[key]
+        except TypeError:
+            # Targets with unhashable values are not memoized
+            key = None
+        except KeyError:
+            pass
 
         credentials = {
             'roles': context.roles,
@@ -117,7 +175,10 @@ class Enforcer(object):
             'tenant': context.tenant,
         }
 
-        return policy.check(rule, target, credentials, *args, **kwargs)
+        result = policy.check(rule, target, credentials)
+        if key is not None:
+            decisions[key] = result
+        return result
 
     def enforce(self, context, action, target):
         """Verifies that the action is valid on the target in this context.
@@ -44,6 +44,7 @@ from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 from glance import registry
 from glance.store import (get_from_backend,
+                          get_range_from_backend,
                           get_size_from_backend,
                           safe_delete_from_backend,
                           schedule_delayed_delete_from_backend,
@@ -159,7 +160,9 @@ class Controller(controller.BaseController):
         except exception.Invalid, e:
             raise HTTPBadRequest(explanation="%s" % e)
 
-        return dict(images=images)
+        etag = get_images_etag(req, images)
+        common.check_not_modified(req, etag)
+        return dict(images=images, etag=etag)
 
     def detail(self, req):
         """
@@ -198,7 +201,10 @@ class Controller(controller.BaseController):
                 del image['location']
         except exception.Invalid, e:
             raise HTTPBadRequest(explanation="%s" % e)
-        return dict(images=images)
+
+        etag = get_images_etag(req, images)
+        common.check_not_modified(req, etag)
+        return dict(images=images, etag=etag)
 
     def _get_query_params(self, req):
         """
@@ -244,6 +250,11 @@ class Controller(controller.BaseController):
         """
         self._enforce(req, 'get_image')
         image_meta = self.get_image_meta_or_404(req, id)
+        # NOTE: the ETag of an image is the checksum of its data, which
+        # does not change with its metadata, so only the time of the last
+        # update can tell whether the metadata the client holds is current
+        common.check_not_modified(
+                req, last_modified=get_last_modified(image_meta))
         del image_meta['location']
         return {
             'image_meta': image_meta
@@ -285,6 +296,15 @@ class Controller(controller.BaseController):
         image_size = int(image_size) if image_size else None
         return image_data, image_size
 
+    @staticmethod
+    def _get_range_from_store(context, where, offset, length):
+        try:
+            image_data, range_size = get_range_from_backend(context, where,
+                                                            offset, length)
+        except exception.NotFound, e:
+            raise HTTPNotFound(explanation="%s" % e)
+        return image_data
+
     def show(self, req, id):
         """
         Returns an iterator that can be used to retrieve an image's
@@ -294,24 +314,52 @@ class Controller(controller.BaseController):
         :param id: The opaque image identifier
 
         :raises HTTPNotFound if image is not available to user
+        :raises HTTPNotModified if the client already has the image data
         """
         self._enforce(req, 'get_image')
         self._enforce(req, 'download_image')
         image_meta = self.get_active_image_meta_or_404(req, id)
+        # Answer a conditional GET before any image data is opened
+        checksum = image_meta.get('checksum')
+        headers = {'ETag': checksum.encode('utf-8')} if checksum else None
+        common.check_not_modified(req, checksum,
+                                  get_last_modified(image_meta), headers)
+        byte_ranges = common.get_byte_ranges(req, image_meta.get('size'),
+                                             image_meta.get('checksum'))
+        partial_content = None
 
         if image_meta.get('size') == 0:
             image_iterator = iter([])
+        elif byte_ranges:
+            location = image_meta['location']
+
+            def read_range(start, stop):
+                image_iterator = self._get_range_from_store(
+                        req.context, location, start, stop - start)
+                if not isinstance(image_iterator, utils.FileWrapper):
+                    image_iterator = utils.cooperative_iter(image_iterator)
+                return image_iterator
+
+            headers, image_iterator, size = common.get_partial_content(
+                    byte_ranges, image_meta['size'], read_range)
+            partial_content = {'headers': headers, 'size': size}
         else:
             image_iterator, size = self._get_from_store(req.context,
                                                         image_meta['location'])
-            image_iterator = utils.cooperative_iter(image_iterator)
+            # NOTE: a FileWrapper already schedules after each chunk, and
+            # must reach the server unwrapped to be sent with sendfile()
+            if not isinstance(image_iterator, utils.FileWrapper):
+                image_iterator = utils.cooperative_iter(image_iterator)
             image_meta['size'] = size or image_meta['size']
 
         del image_meta['location']
-        return {
+        result = {
             'image_iterator': image_iterator,
             'image_meta': image_meta,
         }
+        if partial_content:
+            result['partial_content'] = partial_content
+        return result
 
     def _reserve(self, req, image_meta):
         """
@@ -928,6 +976,11 @@ class ImageSerializer(wsgi.JSONResponseSerializer):
         if image_meta['checksum'] is not None:
             response.headers['ETag'] = image_meta['checksum'].encode('utf-8')
 
+    def _inject_last_modified_header(self, response, image_meta):
+        last_modified = get_last_modified(image_meta)
+        if last_modified is not None:
+            response.last_modified = last_modified
+
     def _inject_image_meta_headers(self, response, image_meta):
         """
         Given a response and mapping of image metadata, injects
@@ -954,24 +1007,48 @@ class ImageSerializer(wsgi.JSONResponseSerializer):
         self._inject_image_meta_headers(response, image_meta)
         self._inject_location_header(response, image_meta)
         self._inject_checksum_header(response, image_meta)
+        self._inject_last_modified_header(response, image_meta)
+        return response
+
+    def index(self, response, result):
+        # The ETag of the listing is worked out by the controller, which
+        # answers conditional requests with it
+        result = dict(result)
+        etag = result.pop('etag', None)
+        self.default(response, result)
+        if etag is not None:
+            response.etag = etag
         return response
 
+    def detail(self, response, result):
+        return self.index(response, result)
+
     def show(self, response, result):
         image_meta = result['image_meta']
         image_id = image_meta['id']
 
         image_iter = result['image_iterator']
-        # image_meta['size'] should be an int, but could possibly be a str
-        expected_size = int(image_meta['size'])
+        partial_content = result.get('partial_content')
+        if partial_content:
+            expected_size = partial_content['size']
+        else:
+            # image_meta['size'] should be an int, but could possibly be a str
+            expected_size = int(image_meta['size'])
         response.app_iter = common.size_checked_iter(
                 response, image_meta, expected_size, image_iter, self.notifier)
         # Using app_iter blanks content-length, so we set it here...
-        response.headers['Content-Length'] = str(image_meta['size'])
+        response.headers['Content-Length'] = str(expected_size)
         response.headers['Content-Type'] = 'application/octet-stream'
+        response.headers['Accept-Ranges'] = 'bytes'
+        if partial_content:
+            response.status_int = 206
+            for k, v in partial_content['headers'].items():
+                response.headers[k] = v
 
         self._inject_image_meta_headers(response, image_meta)
         self._inject_location_header(response, image_meta)
         self._inject_checksum_header(response, image_meta)
+        self._inject_last_modified_header(response, image_meta)
 
         return response
 
@@ -993,6 +1070,30 @@ class ImageSerializer(wsgi.JSONResponseSerializer):
         return response
 
 
+def get_last_modified(image_meta):
+    """Return the time an image was last updated, to whole seconds"""
+    return common.get_last_modified(image_meta.get('updated_at'))
+
+
+def get_images_etag(request, images):
+    """
+    Return the entity tag of a listing of images, which changes whenever
+    an image is added to, updated in or removed from the listing.
+
+    Detailed listings carry the time each image was last updated, which
+    is enough to tell them apart; the few fields of a summary listing
+    are hashed as they are.
+
+    :param request: The WSGI/Webob Request object for the listing
+    :param images: List of image mappings in the listing
+    """
+    if images and 'updated_at' in images[0]:
+        parts = [(image['id'], image['updated_at']) for image in images]
+    else:
+        parts = [sorted(image.items()) for image in images]
+    return common.make_etag(request.query_string, parts)
+
+
 def create_resource():
     """Images resource factory method"""
     deserializer = ImageDeserializer()
@@ -103,6 +103,20 @@ class ImageDataController(object):
         image = self._get_image(ctx, image_id)
         location = image['location']
         if location:
+            byte_ranges = common.get_byte_ranges(req, image['size'],
+                                                 image['checksum'])
+            if byte_ranges:
+                def read_range(start, stop):
+                    image_data, size = self.store_api.get_range_from_backend(
+                            ctx, location, start, stop - start)
+                    return image_data
+
+                headers, image_data, size = common.get_partial_content(
+                        byte_ranges, image['size'], read_range)
+                return {'data': image_data, 'meta': image,
+                        'partial_content': {'headers': headers,
+                                            'size': size}}
+
             image_data, image_size = self.store_api.get_from_backend(ctx,
                                                                      location)
             #NOTE(bcwaldon): This is done to match the behavior of the v1 API.
@@ -135,9 +149,19 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
     def download(self, response, result):
         size = result['meta']['size']
         checksum = result['meta']['checksum']
+        partial_content = result.get('partial_content')
+        if partial_content:
+            size = partial_content['size']
         response.headers['Content-Length'] = size
         response.headers['Content-Type'] = 'application/octet-stream'
-        if checksum:
+        response.headers['Accept-Ranges'] = 'bytes'
+        if partial_content:
+            # NOTE: Content-MD5 describes the body, which is now only
+            # part of the image data, so it is left out here
+            response.status_int = 206
+            for k, v in partial_content['headers'].items():
+                response.headers[k] = v
+        elif checksum:
             response.headers['Content-MD5'] = checksum
         response.app_iter = common.size_checked_iter(
                 response, result['meta'], size, result['data'], self.notifier)
@@ -21,6 +21,7 @@ import urllib
 
 import webob.exc
 
+from glance.api import common
 from glance.api import policy
 from glance.common import exception
 from glance.common import utils
@@ -80,9 +81,13 @@ class ImagesController(object):
         except KeyError:
             pass
 
-    def _append_tags(self, context, image):
-        image['tags'] = self.db_api.image_tag_get_all(context, image['id'])
-        return image
+    def _append_tags(self, context, images):
+        """Add the tags of each of a list of images, with a single query"""
+        tags = self.db_api.image_tag_get_all_for_images(
+                context, [image['id'] for image in images])
+        for image in images:
+            image['tags'] = tags[image['id']]
+        return images
 
     @utils.mutating
     def create(self, req, image):
@@ -130,8 +135,9 @@ class ImagesController(object):
         except exception.NotFound as e:
             raise webob.exc.HTTPBadRequest(explanation=unicode(e))
         images = [self._normalize_properties(dict(image)) for image in images]
-        result['images'] = [self._append_tags(req.context, image)
-                            for image in images]
+        result['images'] = self._append_tags(req.context, images)
+        result['etag'] = get_images_etag(req, result['images'])
+        common.check_not_modified(req, result['etag'])
         return result
 
     def _get_image(self, context, image_id):
@@ -148,7 +154,10 @@ class ImagesController(object):
         self._enforce(req, 'get_image')
         image = self._get_image(req.context, image_id)
         image = self._normalize_properties(image)
-        return self._append_tags(req.context, image)
+        image = self._append_tags(req.context, [image])[0]
+        last_modified = common.get_last_modified(image['updated_at'])
+        common.check_not_modified(req, get_image_etag(image), last_modified)
+        return image
 
     @utils.mutating
     def update(self, req, image_id, changes):
@@ -175,7 +184,7 @@ class ImagesController(object):
             self.db_api.image_tag_set_all(req.context, image_id, tags)
             image['tags'] = tags
         else:
-            self._append_tags(req.context, image)
+            self._append_tags(req.context, [image])
 
         self.notifier.info('image.update', image)
         return image
@@ -416,15 +425,6 @@ class RequestDeserializer(wsgi.JSONRequestDeserializer):
             raise webob.exc.HTTPBadRequest(explanation=msg % op)
         return raw_change['value']
 
-    def _validate_change(self, change):
-        if change['op'] == 'delete':
-            return
-        partial_image = {change['path'][-1]: change['value']}
-        try:
-            self.schema.validate(partial_image)
-        except exception.InvalidObject as e:
-            raise webob.exc.HTTPBadRequest(explanation=unicode(e))
-
     def update(self, request):
         changes = []
         valid_content_types = [
@@ -437,6 +437,11 @@ class RequestDeserializer(wsgi.JSONRequestDeserializer):
         if not isinstance(body, list):
             msg = _('Request body must be a JSON array of operation objects.')
             raise webob.exc.HTTPBadRequest(explanation=msg)
+        # The image attributes set by each operation, validated together
+        # once all of the operations are parsed. Removals have no value to
+        # validate, but keep their place, so that an invalid object is
+        # named by the index of its operation.
+        partial_images = []
         for raw_change in body:
             if not isinstance(raw_change, dict):
                 msg = _('Operations must be JSON objects.')
@@ -446,11 +451,18 @@ class RequestDeserializer(wsgi.JSONRequestDeserializer):
             change = {'op': op, 'path': path}
             if not op == 'remove':
                 change['value'] = self._get_change_value(raw_change, op)
-                self._validate_change(change)
+                partial_images.append({path[-1]: change['value']})
                 if change['path'] == ['visibility']:
                     change['path'] = ['is_public']
                     change['value'] = change['value'] == 'public'
+            else:
+                partial_images.append(None)
             changes.append(change)
+
+        try:
+            self.schema.validate_many(partial_images)
+        except exception.InvalidObject as e:
+            raise webob.exc.HTTPBadRequest(explanation=unicode(e))
         return {'changes': changes}
 
     def _validate_limit(self, limit):
@@ -550,10 +562,30 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
 
     @staticmethod
     def _serialize_datetimes(image):
-        for (key, value) in image.iteritems():
+        #NOTE: only these image attributes are stored as datetimes
+        for key in ('created_at', 'updated_at'):
+            value = image.get(key)
             if isinstance(value, datetime.datetime):
                 image[key] = timeutils.isotime(value)
 
+    @staticmethod
+    def _iter_json_collection(name, items, body):
+        """
+        Yield the JSON encoding of body, with the list of items added to it
+        under name, as UTF-8 encoded fragments of at most one item each.
+        """
+        yield '{"%s": [' % name
+        separator = ''
+        for item in items:
+            fragment = json.dumps(item, ensure_ascii=False)
+            yield separator + fragment.encode('utf-8')
+            separator = ', '
+        remainder = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        if remainder != '{}':
+            yield '], ' + remainder[1:]
+        else:
+            yield ']}'
+
     def create(self, response, image):
         response.status_int = 201
         body = json.dumps(self._format_image(image), ensure_ascii=False)
@@ -562,6 +594,8 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
         response.location = self._get_image_href(image)
 
     def show(self, response, image):
+        response.etag = get_image_etag(image)
+        response.last_modified = common.get_last_modified(image['updated_at'])
         body = json.dumps(self._format_image(image), ensure_ascii=False)
         response.unicode_body = unicode(body)
         response.content_type = 'application/json'
@@ -576,7 +610,6 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
         params.pop('marker', None)
         query = urllib.urlencode(params)
         body = {
-            'images': [self._format_image(i) for i in result['images']],
             'first': '/v2/images',
             'schema': '/v2/schemas/images',
         }
@@ -586,8 +619,13 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
             params['marker'] = result['next_marker']
             next_query = urllib.urlencode(params)
             body['next'] = '/v2/images?%s' % next_query
-        response.unicode_body = unicode(json.dumps(body, ensure_ascii=False))
+        # Stream the images out one at a time, rather than building the
+        # whole body of a large listing in memory before sending any of it
+        images = (self._format_image(i) for i in result['images'])
+        if 'etag' in result:
+            response.etag = result['etag']
         response.content_type = 'application/json'
+        response.app_iter = self._iter_json_collection('images', images, body)
 
     def delete(self, response, result):
         response.status_int = 204
@@ -687,6 +725,23 @@ _BASE_LINKS = [
 ]
 
 
+def get_image_etag(image):
+    """
+    Return the entity tag of an image. Tags are added and removed without
+    touching the image itself, so they are hashed along with the time the
+    image was last updated.
+    """
+    return common.make_etag(image['id'], image['updated_at'],
+                            sorted(image['tags']))
+
+
+def get_images_etag(request, images):
+    """Return the entity tag of a page of images listed by request"""
+    parts = [(image['id'], image['updated_at'], sorted(image['tags']))
+             for image in images]
+    return common.make_etag(request.query_string, parts)
+
+
 def get_schema(custom_properties=None):
     properties = copy.deepcopy(_BASE_PROPERTIES)
     links = copy.deepcopy(_BASE_LINKS)
@@ -25,6 +25,7 @@ import functools
 import httplib
 import os
 import re
+import time
 import urllib
 import urlparse
 
@@ -128,6 +129,82 @@ class HTTPSClientAuthConnection(httplib.HTTPSConnection):
                                         cert_reqs=ssl.CERT_REQUIRED)
 
 
+class PooledHTTPResponse(httplib.HTTPResponse):
+    """
+    HTTP response that hands its connection back to a ConnectionPool
+    once its body has been read in full.
+
+    Only responses with a Content-Length are recognised as read in full,
+    so connections that received a chunked response are not reused.
+    """
+
+    release = None
+
+    def close(self):
+        release, self.release = self.release, None
+        httplib.HTTPResponse.close(self)
+        if release and not self.will_close and self.length == 0:
+            release()
+
+
+class ConnectionPool(object):
+    """
+    Keeps idle HTTP(S) connections alive so that later requests to the
+    same server can reuse them instead of opening a new connection.
+
+    Connections are pooled by host, port and connection settings (which
+    include whether SSL is used), keeping at most max_size idle ones for
+    each. Connections that have been idle for more than idle_timeout
+    seconds are closed rather than reused.
+    """
+
+    def __init__(self, max_size=10, idle_timeout=60):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._idle = collections.defaultdict(collections.deque)
+
+    def get(self, key):
+        """
+        Returns an idle connection for key, or None if there is none.
+        """
+        idle = self._idle.get(key)
+        if not idle:
+            return None
+        self._evict(idle)
+        if idle:
+            conn, last_used = idle.pop()
+            return conn
+
+    def put(self, key, conn):
+        """
+        Returns a connection to the pool, or closes it if there are
+        already max_size idle connections for key.
+        """
+        if conn.sock is None:
+            return
+        idle = self._idle[key]
+        self._evict(idle)
+        if len(idle) >= self.max_size:
+            conn.close()
+        else:
+            idle.append((conn, time.time()))
+
+    def _evict(self, idle):
+        # Connections are appended as they are released, so the ones that
+        # have been idle the longest are at the left
+        oldest = time.time() - self.idle_timeout
+        while idle and idle[0][1] < oldest:
+            conn, last_used = idle.popleft()
+            conn.close()
+
+    def clear(self):
+        """Closes all idle connections."""
+        for idle in self._idle.values():
+            for conn, last_used in idle:
+                conn.close()
+        self._idle.clear()
+
+
 class BaseClient(object):
 
     """A base client class"""
@@ -159,7 +236,7 @@ class BaseClient(object):
     def __init__(self, host, port=None, timeout=None, use_ssl=False,
                  auth_tok=None, creds=None, doc_root=None, key_file=None,
                  cert_file=None, ca_file=None, insecure=False,
-                 configure_via_auth=True):
+                 configure_via_auth=True, connection_pool=None):
         """
         Creates a new client to some service.
 
@@ -193,6 +270,11 @@ class BaseClient(object):
                          URL returned from the service catalog for the image
                          endpoint will **override** the URL supplied to in
                          the host parameter.
+        :param connection_pool: Optional. A ConnectionPool from which to
+                         reuse connections to the service, and to which
+                         connections are returned once a response has
+                         been read. If not set, every request is made on
+                         a new connection.
         """
         self.host = host
         self.port = port or self.DEFAULT_PORT
@@ -211,6 +293,7 @@ class BaseClient(object):
         self.cert_file = cert_file
         self.ca_file = ca_file
         self.insecure = insecure
+        self.connection_pool = connection_pool
         self.auth_plugin = self.make_auth_plugin(self.creds, self.insecure)
         self.connect_kwargs = self.get_connect_kwargs()
 
@@ -428,11 +511,23 @@ class BaseClient(object):
             if 'x-auth-token' not in headers and self.auth_tok:
                 headers['x-auth-token'] = self.auth_tok
 
-            c = connection_type(url.hostname, url.port, **self.connect_kwargs)
+            pool = self.connection_pool
+            pool_key = (connection_type, url.hostname, url.port,
+                        frozenset(self.connect_kwargs.items()))
+
+            def _connect():
+                c = connection_type(url.hostname, url.port,
+                                    **self.connect_kwargs)
+                if pool:
+                    c.response_class = PooledHTTPResponse
+                return c
 
             def _pushing(method):
                 return method.lower() in ('post', 'put')
 
+            def _idempotent(method):
+                return method.lower() in ('get', 'head')
+
             def _simple(body):
                 return body is None or isinstance(body, basestring)
 
@@ -452,36 +547,64 @@ class BaseClient(object):
                     connection.send('%x\r\n%s\r\n' % (len(chunk), chunk))
                 connection.send('0\r\n\r\n')
 
-            # Do a simple request or a chunked request, depending
-            # on whether the body param is file-like or iterable and
-            # the method is PUT or POST
-            #
-            if not _pushing(method) or _simple(body):
-                # Simple request...
-                c.request(method, path, body, headers)
-            elif _filelike(body) or self._iterable(body):
-                c.putrequest(method, path)
-
-                use_sendfile = self._sendable(body)
-
-                # According to HTTP/1.1, Content-Length and Transfer-Encoding
-                # conflict.
-                for header, value in headers.items():
-                    if use_sendfile or header.lower() != 'content-length':
-                        c.putheader(header, str(value))
-
-                iter = self.image_iterator(c, headers, body)
-
-                if use_sendfile:
-                    # send actual file without copying into userspace
-                    _sendbody(c, iter)
+            def _send_request(c):
+                # Do a simple request or a chunked request, depending
+                # on whether the body param is file-like or iterable and
+                # the method is PUT or POST
+                #
+                if not _pushing(method) or _simple(body):
+                    # Simple request...
+                    c.request(method, path, body, headers)
+                elif _filelike(body) or self._iterable(body):
+                    c.putrequest(method, path)
+
+                    use_sendfile = self._sendable(body)
+
+                    # According to HTTP/1.1, Content-Length and
+                    # Transfer-Encoding conflict.
+                    for header, value in headers.items():
+                        if use_sendfile or header.lower() != 'content-length':
+                            c.putheader(header, str(value))
+
+                    iter = self.image_iterator(c, headers, body)
+
+                    if use_sendfile:
+                        # send actual file without copying into userspace
+                        _sendbody(c, iter)
+                    else:
+                        # otherwise iterate and chunk
+                        _chunkbody(c, iter)
                 else:
-                    # otherwise iterate and chunk
-                    _chunkbody(c, iter)
+                    raise TypeError('Unsupported image type: %s' %
+                                    body.__class__)
+
+            c = pool.get(pool_key) if pool else None
+            if c is None:
+                c = _connect()
+                _send_request(c)
+                res = c.getresponse()
             else:
-                raise TypeError('Unsupported image type: %s' % body.__class__)
-
-            res = c.getresponse()
+                sent = False
+                try:
+                    _send_request(c)
+                    sent = True
+                    res = c.getresponse()
+                except (httplib.BadStatusLine, socket.error), e:
+                    # The server may have closed the connection while it
+                    # was idle in the pool. The request is only sent again
+                    # if its body can be, and if the server cannot have
+                    # acted on it already or it is safe to repeat.
+                    c.close()
+                    if not _simple(body) or (sent and not _idempotent(method)):
+                        raise exception.ClientConnectionError(e)
+                    LOG.debug(_("Request on a reused connection failed "
+                                "(%s), retrying on a new connection"), e)
+                    c = _connect()
+                    _send_request(c)
+                    res = c.getresponse()
+
+            if pool:
+                res.release = functools.partial(pool.put, pool_key, c)
 
             def _retry(res):
                 return res.getheader('Retry-After')
@@ -222,6 +222,11 @@ class InvalidNotifierStrategy(GlanceException):
     message = _("'%(strategy)s' is not an available notifier strategy.")
 
 
+class InvalidNotifierOutboxOverflow(GlanceException):
+    message = _("'%(overflow)s' is not an available notifier outbox "
+                "overflow policy.")
+
+
 class MaxRedirectsExceeded(GlanceException):
     message = _("Maximum redirects (%(redirects)s) was exceeded.")
 
@@ -55,21 +55,54 @@ def chunkreadable(iter, chunk_size=65536):
     return chunkiter(iter, chunk_size) if hasattr(iter, 'read') else iter
 
 
-def chunkiter(fp, chunk_size=65536):
+def chunkiter(fp, chunk_size=65536, length=None):
     """
     Return an iterator to a file-like obj which yields fixed size chunks
 
     :param fp: a file-like object
     :param chunk_size: maximum size of chunk
+    :param length: maximum number of bytes to read from fp, or None to
+                   read until EOF
     """
-    while True:
-        chunk = fp.read(chunk_size)
+    while length is None or length > 0:
+        if length is None:
+            chunk = fp.read(chunk_size)
+        else:
+            chunk = fp.read(min(chunk_size, length))
+            length -= len(chunk)
         if chunk:
             yield chunk
         else:
             break
 
 
+def chunkslice(iter, offset, length=None):
+    """
+    Return an iterator yielding only the bytes in the window
+    [offset, offset + length) of the data produced by an iterator of
+    string chunks. Data before the window is read and discarded, so
+    this is the fallback for sources that cannot seek.
+
+    :param iter: an iterator of string chunks
+    :param offset: number of leading bytes to skip
+    :param length: number of bytes to yield, or None for all remaining
+    """
+    position = 0
+    for chunk in iter:
+        chunk_end = position + len(chunk)
+        if chunk_end > offset:
+            start = max(offset - position, 0)
+            if length is not None:
+                stop = min(offset + length - position, len(chunk))
+            else:
+                stop = len(chunk)
+            if start < stop:
+                yield chunk[start:stop]
+        position = chunk_end
+        if length is not None and position >= offset + length:
+            break
+
+
 def cooperative_iter(iter):
     """
     Return an iterator which schedules after each
@@ -87,6 +120,97 @@ def cooperative_iter(iter):
         raise
 
 
+class FileWrapper(object):
+    """
+    Iterable over a byte range of a local file.
+
+    Iterating reads the file in chunks, scheduling after each one. The
+    WSGI server in glance.common.wsgi instead recognises a FileWrapper
+    returned as a response body and sends it with sendfile(), so the
+    image data never has to be copied through Python.
+
+    The file is only opened, through the supplied opener, once data is
+    first needed, and is closed again when the range has been sent or
+    close() is called.
+    """
+
+    CHUNKSIZE = 65536
+
+    def __init__(self, opener, offset=0, length=None):
+        """
+        :param opener: Callable returning a context manager which yields
+                       the file object opened for reading
+        :param offset: Offset of the first byte to send
+        :param length: Number of bytes to send, or None to send the rest
+                       of the file
+        """
+        self.opener = opener
+        self.offset = offset
+        self.bytes_sent = 0
+        self._length = length
+        self._reader = None
+        self._fp = None
+
+    @property
+    def length(self):
+        if self._length is None:
+            fp = self.open()
+            fp.seek(0, os.SEEK_END)
+            self._length = max(fp.tell() - self.offset, 0)
+            fp.seek(self.offset)
+        return self._length
+
+    def open(self):
+        """Return the underlying file object, opening it if need be"""
+        if self._fp is None:
+            self._reader = self.opener()
+            self._fp = self._reader.__enter__()
+            if self.offset:
+                self._fp.seek(self.offset)
+        return self._fp
+
+    def fileno(self):
+        return self.open().fileno()
+
+    def has_fileno(self):
+        """
+        Return True if the underlying file is an operating system file,
+        which can be sent with sendfile(), rather than an in-memory one
+        """
+        try:
+            self.fileno()
+        except (AttributeError, IOError, ValueError):
+            return False
+        return True
+
+    def __iter__(self):
+        """Return an iterator over the file's byte range"""
+        try:
+            fp = self.open()
+            for chunk in chunkiter(fp, self.CHUNKSIZE,
+                                   self.length - self.bytes_sent):
+                self.bytes_sent += len(chunk)
+                sleep(0)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Close the underlying file. The opener's context manager only
+        sees a clean exit if the whole range was sent.
+        """
+        if self._reader is not None:
+            reader = self._reader
+            self._reader = None
+            self._fp = None
+            if self.bytes_sent == self._length:
+                reader.__exit__(None, None, None)
+            else:
+                exc = GeneratorExit()
+                reader.__exit__(GeneratorExit, exc, None)
+
+
 def cooperative_read(fd):
     """
     Wrap a file descriptor's read with a partial function which schedules
@@ -170,6 +294,91 @@ class LimitingReader(object):
         return result
 
 
+class OrderedDict(object):
+    """
+    Dictionary that remembers the order in which its keys were inserted,
+    as collections.OrderedDict is not available on Python 2.6. Only the
+    operations glance needs are provided. Like collections.OrderedDict,
+    assigning to an existing key leaves it in place: pop it first to move
+    it to the end.
+    """
+
+    def __init__(self):
+        # Maps each key to its link in a circular doubly linked list of
+        # [previous link, next link, key, value], in insertion order
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def __iter__(self):
+        link = self._root[1]
+        while link is not self._root:
+            yield link[2]
+            link = link[1]
+
+    def __getitem__(self, key):
+        return self._links[key][3]
+
+    def __setitem__(self, key, value):
+        link = self._links.get(key)
+        if link is not None:
+            link[3] = value
+            return
+        last = self._root[0]
+        link = [last, self._root, key, value]
+        last[1] = self._root[0] = self._links[key] = link
+
+    def __delitem__(self, key):
+        previous, next, _key, _value = self._links.pop(key)
+        previous[1] = next
+        next[0] = previous
+
+    def get(self, key, default=None):
+        link = self._links.get(key)
+        if link is None:
+            return default
+        return link[3]
+
+    def pop(self, key, *default):
+        link = self._links.get(key)
+        if link is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        del self[key]
+        return link[3]
+
+    def popitem(self, last=True):
+        """
+        Removes and returns the (key, value) pair inserted last, or the
+        one inserted first if last is False.
+        """
+        if not self._links:
+            raise KeyError('dictionary is empty')
+        link = self._root[0] if last else self._root[1]
+        del self[link[2]]
+        return link[2], link[3]
+
+    def clear(self):
+        self._links.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self._links[key][3] for key in self]
+
+    def items(self):
+        return [(key, self._links[key][3]) for key in self]
+
+
 def image_meta_to_http_headers(image_meta):
     """
     Returns a set of image metadata into a dict
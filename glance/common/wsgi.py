@@ -33,13 +33,21 @@ import time
 import eventlet
 from eventlet.green import socket, ssl
 import eventlet.greenio
+import eventlet.hubs
 import eventlet.wsgi
 import routes
 import routes.middleware
 import webob.dec
 import webob.exc
 
+try:
+    import sendfile
+    SENDFILE_SUPPORTED = True
+except ImportError:
+    SENDFILE_SUPPORTED = False
+
 from glance.common import exception
+from glance.common import utils
 from glance.openstack.common import cfg
 import glance.openstack.common.log as os_logging
 
@@ -59,10 +67,17 @@ socket_opts = [
 
 workers_opt = cfg.IntOpt('workers', default=1)
 
+sendfile_opt = cfg.BoolOpt('use_sendfile', default=True,
+                           help=_("Send image data read from local files, "
+                                  "such as cached images, straight to the "
+                                  "client socket with sendfile(). Has no "
+                                  "effect when serving over SSL."))
+
 CONF = cfg.CONF
 CONF.register_opts(bind_opts)
 CONF.register_opts(socket_opts)
 CONF.register_opt(workers_opt)
+CONF.register_opt(sendfile_opt)
 
 
 class WritableLogger(object):
@@ -156,6 +171,96 @@ def get_socket(default_port):
     return sock
 
 
+class HttpProtocol(eventlet.wsgi.HttpProtocol):
+    """
+    eventlet.wsgi protocol which sends response bodies that are a
+    glance.common.utils.FileWrapper with sendfile().
+
+    eventlet writes the response headers together with the first block
+    of the body, so that block is read and yielded as usual. Once it is
+    on the wire the rest of the file is handed to the kernel, avoiding
+    a copy of every byte through userspace.
+    """
+
+    def handle_one_response(self):
+        application = self.application
+        if self._sendable_connection():
+            self.application = self._sendfile_application(application)
+        try:
+            eventlet.wsgi.HttpProtocol.handle_one_response(self)
+        finally:
+            self.application = application
+
+    @staticmethod
+    def _sendable_connection():
+        return (SENDFILE_SUPPORTED and CONF.use_sendfile and
+                not (CONF.cert_file or CONF.key_file))
+
+    def _sendfile_application(self, application):
+        def sendfile_application(environ, start_response):
+            response_headers = []
+
+            def _start_response(status, headers, exc_info=None):
+                response_headers[:] = headers
+                return start_response(status, headers, exc_info)
+
+            result = application(environ, _start_response)
+            if not isinstance(result, utils.FileWrapper):
+                return result
+
+            # Without a Content-Length eventlet uses chunked encoding,
+            # which the raw file data would not be framed in
+            header_names = [h.lower() for h, _v in response_headers]
+            if 'content-length' not in header_names:
+                return result
+
+            return self._sendfile_iter(result)
+        return sendfile_application
+
+    def _sendfile_iter(self, file_wrapper):
+        try:
+            block_size = max(self.minimum_chunk_size, 1)
+            first_block = file_wrapper.open().read(
+                    min(block_size, file_wrapper.length))
+            file_wrapper.bytes_sent += len(first_block)
+            yield first_block
+
+            # NOTE: eventlet only writes out the headers once a full block
+            # has been yielded, so a short first block means we are done
+            if len(first_block) < block_size:
+                return
+
+            if file_wrapper.has_fileno():
+                self._sendfile(file_wrapper)
+            else:
+                for chunk in file_wrapper:
+                    yield chunk
+        finally:
+            file_wrapper.close()
+
+    def _sendfile(self, file_wrapper):
+        out_fd = self.connection.fileno()
+        in_fd = file_wrapper.fileno()
+        offset = file_wrapper.offset + file_wrapper.bytes_sent
+        while file_wrapper.bytes_sent < file_wrapper.length:
+            count = file_wrapper.length - file_wrapper.bytes_sent
+            try:
+                sent = sendfile.sendfile(out_fd, in_fd, offset, count)
+            except OSError, e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                eventlet.hubs.trampoline(out_fd, write=True)
+                continue
+            if sent == 0:
+                msg = (_("File ended after sending only %(sent)d of "
+                         "%(length)d bytes") %
+                       {'sent': file_wrapper.bytes_sent,
+                        'length': file_wrapper.length})
+                raise IOError(msg)
+            offset += sent
+            file_wrapper.bytes_sent += sent
+
+
 class Server(object):
     """Server class to manage multiple WSGI sockets and applications."""
 
@@ -278,7 +383,8 @@ class Server(object):
             eventlet.wsgi.server(self.sock,
                                  self.app_func(),
                                  log=WritableLogger(self.logger),
-                                 custom_pool=self.pool)
+                                 custom_pool=self.pool,
+                                 protocol=HttpProtocol)
         except socket.error, err:
             if err[0] != errno.EINVAL:
                 raise
@@ -288,7 +394,8 @@ class Server(object):
         """Start a WSGI server in a new green thread."""
         self.logger.info(_("Starting single process server"))
         eventlet.wsgi.server(sock, application, custom_pool=self.pool,
-                             log=WritableLogger(self.logger))
+                             log=WritableLogger(self.logger),
+                             protocol=HttpProtocol)
 
 
 class Middleware(object):
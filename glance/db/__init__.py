@@ -60,6 +60,10 @@ IMAGE_ATTRS = BASE_MODEL_ATTRS | set(['name', 'status', 'size',
                                       'protected'])
 
 
+# Attributes image_update_many() may set on many images at once
+IMAGE_UPDATE_MANY_ATTRS = IMAGE_ATTRS - BASE_MODEL_ATTRS
+
+
 class ImageRepo(object):
 
     def __init__(self, context, db_api):
@@ -82,11 +86,12 @@ class ImageRepo(object):
         db_api_images = self.db_api.image_get_all(
                 self.context, filters=db_filters, marker=marker, limit=limit,
                 sort_key=sort_key, sort_dir=sort_dir)
+        tags = self.db_api.image_tag_get_all_for_images(
+                self.context, [image['id'] for image in db_api_images])
         images = []
         for db_api_image in db_api_images:
-            tags = self.db_api.image_tag_get_all(self.context,
-                                                 db_api_image['id'])
-            image = self._format_image_from_db(dict(db_api_image), tags)
+            image = self._format_image_from_db(dict(db_api_image),
+                                               tags[db_api_image['id']])
             images.append(image)
         return images
 
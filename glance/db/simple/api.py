@@ -17,6 +17,7 @@ import copy
 import functools
 
 from glance.common import exception
+import glance.db
 import glance.openstack.common.log as logging
 from glance.openstack.common import timeutils
 from glance.openstack.common import uuidutils
@@ -24,6 +25,9 @@ from glance.openstack.common import uuidutils
 
 LOG = logging.getLogger(__name__)
 
+STATUSES = ['active', 'saving', 'queued', 'killed', 'pending_delete',
+            'deleted']
+
 DATA = {
     'images': {},
     'members': {},
@@ -221,13 +225,16 @@ def image_get(context, image_id, session=None, force_show_deleted=False):
 
 @log_call
 def image_get_all(context, filters=None, marker=None, limit=None,
-                  sort_key='created_at', sort_dir='desc'):
+                  sort_key='created_at', sort_dir='desc', columns=None):
     filters = filters or {}
     images = DATA['images'].values()
     images = _filter_images(images, filters, context)
     images = _sort_images(images, sort_key, sort_dir)
     images = _do_pagination(context, images, marker, limit,
                             filters.get('deleted'))
+    if columns is not None:
+        images = [dict((column, image[column]) for column in columns)
+                  for image in images]
     return images
 
 
@@ -365,12 +372,63 @@ def image_destroy(context, image_id):
         raise exception.NotFound()
 
 
+def _image_get_many(context, image_ids, force_show_deleted=False):
+    images = []
+    for image_id in set(image_ids):
+        try:
+            images.append(_image_get(context, image_id, force_show_deleted))
+        except (exception.NotFound, exception.Forbidden):
+            pass
+    return images
+
+
+@log_call
+def image_get_many(context, image_ids, force_show_deleted=False):
+    images = _image_get_many(context, image_ids, force_show_deleted)
+    return copy.deepcopy(images)
+
+
+@log_call
+def image_update_many(context, image_ids, image_values):
+    unknown_keys = set(image_values) - glance.db.IMAGE_UPDATE_MANY_ATTRS
+    if unknown_keys:
+        msg = _("Unknown image attributes: %s") % ', '.join(
+                sorted(unknown_keys))
+        raise exception.Invalid(msg)
+    if 'status' in image_values and image_values['status'] not in STATUSES:
+        msg = "Invalid image status '%s' for image." % image_values['status']
+        raise exception.Invalid(msg)
+
+    images = [image for image in _image_get_many(context, image_ids)
+              if is_image_mutable(context, image)]
+    for image in images:
+        image.update(image_values)
+        image['updated_at'] = timeutils.utcnow()
+    return copy.deepcopy(images)
+
+
+@log_call
+def image_destroy_many(context, image_ids):
+    images = [image for image in _image_get_many(context, image_ids)
+              if is_image_mutable(context, image)]
+    for image in images:
+        image['deleted'] = True
+        image['deleted_at'] = timeutils.utcnow()
+    return copy.deepcopy(images)
+
+
 @log_call
 def image_tag_get_all(context, image_id):
     _image_get(context, image_id)
     return DATA['tags'].get(image_id, [])
 
 
+@log_call
+def image_tag_get_all_for_images(context, image_ids):
+    return dict((image_id, list(DATA['tags'].get(image_id, [])))
+                for image_id in image_ids)
+
+
 @log_call
 def image_tag_get(context, image_id, value):
     tags = image_tag_get_all(context, image_id)
@@ -30,6 +30,7 @@ import sqlalchemy.orm as sa_orm
 import sqlalchemy.sql as sa_sql
 
 from glance.common import exception
+import glance.db
 from glance.db.sqlalchemy import migration
 from glance.db.sqlalchemy import models
 from glance.openstack.common import cfg
@@ -46,6 +47,10 @@ sa_logger = None
 LOG = os_logging.getLogger(__name__)
 
 
+# Number of leading characters of image property values that are indexed,
+# as created by migration 017
+PROPERTY_VALUE_INDEX_LENGTH = 255
+
 STATUSES = ['active', 'saving', 'queued', 'killed', 'pending_delete',
             'deleted']
 
@@ -251,6 +256,138 @@ def image_get(context, image_id, session=None, force_show_deleted=False):
     return image
 
 
+def _image_visibility_filter(context):
+    """
+    Return a filter matching the images is_image_visible allows in the
+    context, or None if all images are visible.
+    """
+    if context.is_admin:
+        return None
+
+    visibility_filters = [models.Image.is_public == True,
+                          models.Image.owner == None]
+    if context.owner is not None:
+        visibility_filters.extend([
+            models.Image.owner == context.owner,
+            models.Image.members.any(member=context.owner, deleted=False),
+        ])
+    return sa_sql.or_(*visibility_filters)
+
+
+def _image_get_many(context, session, image_ids, force_show_deleted=False):
+    """
+    Get the images with the given ids that are visible in the context,
+    along with their properties, in two queries.
+    """
+    query = session.query(models.Image)\
+                   .options(sa_orm.subqueryload(models.Image.properties))\
+                   .filter(models.Image.id.in_(image_ids))
+
+    if not force_show_deleted and not _can_show_deleted(context):
+        query = query.filter_by(deleted=False)
+
+    visibility_filter = _image_visibility_filter(context)
+    if visibility_filter is not None:
+        query = query.filter(visibility_filter)
+
+    return query.all()
+
+
+def image_get_many(context, image_ids, force_show_deleted=False):
+    """
+    Get the images with the given ids, in no particular order. Images
+    that do not exist or are not visible in the context are left out.
+    """
+    if not image_ids:
+        return []
+    session = get_session()
+    return _image_get_many(context, session, set(image_ids),
+                           force_show_deleted)
+
+
+def image_update_many(context, image_ids, values):
+    """
+    Set the given attributes on many images with a single UPDATE.
+    Images that do not exist, are not visible or may not be modified
+    in the context are left out.
+
+    :param values: A dict of image attributes, without properties
+    :raises Invalid if values holds properties or unknown attributes
+    :retval The updated images
+    """
+    unknown_keys = set(values) - glance.db.IMAGE_UPDATE_MANY_ATTRS
+    if unknown_keys:
+        msg = _("Unknown image attributes: %s") % ', '.join(
+                sorted(unknown_keys))
+        raise exception.Invalid(msg)
+    values = dict(values)
+    if 'status' in values and values['status'] not in STATUSES:
+        msg = "Invalid image status '%s' for image." % values['status']
+        raise exception.Invalid(msg)
+
+    if not image_ids:
+        return []
+
+    session = get_session()
+    with session.begin():
+        images = [image_ref for image_ref in
+                  _image_get_many(context, session, set(image_ids))
+                  if is_image_mutable(context, image_ref)]
+        if not images:
+            return []
+
+        values['updated_at'] = timeutils.utcnow()
+        session.query(models.Image)\
+               .filter(models.Image.id.in_([i.id for i in images]))\
+               .update(values, synchronize_session=False)
+
+    for image_ref in images:
+        for key, value in values.iteritems():
+            sa_orm.attributes.set_committed_value(image_ref, key, value)
+    return images
+
+
+def image_destroy_many(context, image_ids):
+    """
+    Destroy many images, along with their properties and memberships,
+    with one UPDATE per table. Images that do not exist, are not visible
+    or may not be modified in the context are left out.
+
+    :retval The destroyed images
+    """
+    if not image_ids:
+        return []
+
+    session = get_session()
+    with session.begin():
+        images = [image_ref for image_ref in
+                  _image_get_many(context, session, set(image_ids))
+                  if is_image_mutable(context, image_ref)]
+        if not images:
+            return []
+
+        ids = [image_ref.id for image_ref in images]
+        now = timeutils.utcnow()
+        values = {'deleted': True, 'deleted_at': now, 'updated_at': now}
+        for model_class, id_column in (
+                (models.Image, models.Image.id),
+                (models.ImageProperty, models.ImageProperty.image_id),
+                (models.ImageMember, models.ImageMember.image_id)):
+            session.query(model_class)\
+                   .filter(id_column.in_(ids))\
+                   .filter_by(deleted=False)\
+                   .update(values, synchronize_session=False)
+
+    set_committed_value = sa_orm.attributes.set_committed_value
+    for image_ref in images:
+        refs = [image_ref]
+        refs.extend(p for p in image_ref.properties if not p.deleted)
+        for ref in refs:
+            for key, value in values.iteritems():
+                set_committed_value(ref, key, value)
+    return images
+
+
 def is_image_mutable(context, image):
     """Return True if the image is mutable in this context."""
     # Is admin == image mutable
@@ -329,6 +466,22 @@ def is_image_visible(context, image):
     return False
 
 
+def _supports_row_values(query):
+    """
+    Return True if the database behind query compares row values, such
+    as (a, b) > (1, 2), using a composite index on the compared columns.
+    """
+    bind = query.session.bind
+    if bind is None:
+        return False
+    dialect = bind.dialect
+    if dialect.name == 'postgresql':
+        return True
+    if dialect.name == 'sqlite':
+        return dialect.dbapi.sqlite_version_info >= (3, 15)
+    return False
+
+
 def paginate_query(query, model, limit, sort_keys, marker=None,
                    sort_dir=None, sort_dirs=None):
     """Returns a query with sorting / pagination criteria added.
@@ -342,6 +495,13 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
     the lexicographical ordering:
     (k1 > X1) or (k1 == X1 && k2 > X2) or (k1 == X1 && k2 == X2 && k3 > X3)
 
+    Databases rarely use an index to satisfy such a disjunction, so when
+    all the columns are sorted in the same direction and the database
+    supports it, this is expressed as a row value comparison instead:
+    (k1, k2, k3) > (X1, X2, X3)
+    Otherwise the disjunction is prefixed with k1 >= X1, which bounds an
+    index scan on the first sort key.
+
     We also have to cope with different sort_directions.
 
     Typically, the id of the last row is used as the client-facing pagination
@@ -379,16 +539,22 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
     assert(len(sort_dirs) == len(sort_keys))
 
     # Add sorting
+    sort_attrs = []
     for current_sort_key, current_sort_dir in zip(sort_keys, sort_dirs):
-        sort_dir_func = {
-            'asc': sqlalchemy.asc,
-            'desc': sqlalchemy.desc,
-        }[current_sort_dir]
+        try:
+            sort_dir_func = {
+                'asc': sqlalchemy.asc,
+                'desc': sqlalchemy.desc,
+            }[current_sort_dir]
+        except KeyError:
+            raise ValueError(_("Unknown sort direction, "
+                               "must be 'desc' or 'asc'"))
 
         try:
             sort_key_attr = getattr(model, current_sort_key)
         except AttributeError:
             raise exception.InvalidSortKey()
+        sort_attrs.append(sort_key_attr)
         query = query.order_by(sort_dir_func(sort_key_attr))
 
     # Add pagination
@@ -398,27 +564,34 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
             v = getattr(marker, sort_key)
             marker_values.append(v)
 
-        # Build up an array of sort criteria as in the docstring
-        criteria_list = []
-        for i in xrange(0, len(sort_keys)):
-            crit_attrs = []
-            for j in xrange(0, i):
-                model_attr = getattr(model, sort_keys[j])
-                crit_attrs.append((model_attr == marker_values[j]))
-
-            model_attr = getattr(model, sort_keys[i])
-            if sort_dirs[i] == 'desc':
-                crit_attrs.append((model_attr < marker_values[i]))
-            elif sort_dirs[i] == 'asc':
-                crit_attrs.append((model_attr > marker_values[i]))
+        if len(set(sort_dirs)) == 1 and _supports_row_values(query):
+            keys = sa_sql.tuple_(*sort_attrs)
+            values = sa_sql.tuple_(*marker_values)
+            if sort_dirs[0] == 'desc':
+                f = keys < values
             else:
-                raise ValueError(_("Unknown sort direction, "
-                                   "must be 'desc' or 'asc'"))
-
-            criteria = sa_sql.and_(*crit_attrs)
-            criteria_list.append(criteria)
-
-        f = sa_sql.or_(*criteria_list)
+                f = keys > values
+        else:
+            # Build up an array of sort criteria as in the docstring
+            criteria_list = []
+            for i in xrange(0, len(sort_keys)):
+                crit_attrs = []
+                for j in xrange(0, i):
+                    crit_attrs.append((sort_attrs[j] == marker_values[j]))
+
+                if sort_dirs[i] == 'desc':
+                    crit_attrs.append((sort_attrs[i] < marker_values[i]))
+                else:
+                    crit_attrs.append((sort_attrs[i] > marker_values[i]))
+
+                criteria = sa_sql.and_(*crit_attrs)
+                criteria_list.append(criteria)
+
+            if sort_dirs[0] == 'desc':
+                bound = sort_attrs[0] <= marker_values[0]
+            else:
+                bound = sort_attrs[0] >= marker_values[0]
+            f = sa_sql.and_(bound, sa_sql.or_(*criteria_list))
         query = query.filter(f)
 
     if limit is not None:
@@ -428,7 +601,7 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
 
 
 def image_get_all(context, filters=None, marker=None, limit=None,
-                  sort_key='created_at', sort_dir='desc'):
+                  sort_key='created_at', sort_dir='desc', columns=None):
     """
     Get all images that match zero or more filters.
 
@@ -439,12 +612,18 @@ def image_get_all(context, filters=None, marker=None, limit=None,
     :param limit: maximum number of images to return
     :param sort_key: image attribute by which results should be sorted
     :param sort_dir: direction in which results should be sorted (asc, desc)
+    :param columns: if given, only these image attributes are selected,
+                    and each image is returned as a dict of them, without
+                    its properties
     """
     filters = filters or {}
 
     session = get_session()
-    query = session.query(models.Image)\
-                   .options(sa_orm.joinedload(models.Image.properties))
+    query = session.query(models.Image)
+    if columns is None:
+        # Load the properties of the whole page in a second query, rather
+        # than joining them to the paginated image query
+        query = query.options(sa_orm.subqueryload(models.Image.properties))
 
     # NOTE(markwash) treat is_public=None as if it weren't filtered
     if 'is_public' in filters and filters['is_public'] is None:
@@ -477,11 +656,13 @@ def image_get_all(context, filters=None, marker=None, limit=None,
         if not deleted_filter:
             query = query.filter(models.Image.status != 'killed')
 
-    for (k, v) in filters.pop('properties', {}).items():
-        query = query.filter(models.Image.properties.any(name=k,
-                                                         value=v,
-                                                         deleted=False))
+    properties = filters.pop('properties', {})
+    if properties:
+        query = query.filter(_image_property_filter(properties))
 
+    # Filters on keys that are not image attributes are matched against
+    # image properties, including deleted ones
+    other_properties = {}
     for (k, v) in filters.items():
         if v is not None:
             key = k
@@ -501,22 +682,91 @@ def image_get_all(context, filters=None, marker=None, limit=None,
             elif hasattr(models.Image, key):
                 query = query.filter(getattr(models.Image, key) == v)
             else:
-                query = query.filter(models.Image.properties.any(name=key,
-                                                                 value=v))
+                other_properties[key] = v
+
+    if other_properties:
+        query = query.filter(_image_property_filter(other_properties,
+                                                    show_deleted=True))
 
     marker_image = None
     if marker is not None:
-        marker_image = image_get(context, marker,
-                                 force_show_deleted=showing_deleted)
+        marker_image = _image_get_marker(context, session, marker,
+                                         showing_deleted)
 
-    query = paginate_query(query, models.Image, limit,
-                           [sort_key, 'created_at', 'id'],
+    sort_keys = [sort_key]
+    for key in ('created_at', 'id'):
+        if key not in sort_keys:
+            sort_keys.append(key)
+
+    query = paginate_query(query, models.Image, limit, sort_keys,
                            marker=marker_image,
                            sort_dir=sort_dir)
 
+    if columns is not None:
+        query = query.with_entities(*[getattr(models.Image, column)
+                                      for column in columns])
+        return [dict(zip(columns, row)) for row in query]
+
     return query.all()
 
 
+def _image_property_filter(properties, show_deleted=False):
+    """
+    Return a criterion matching the images that have all of the given
+    properties.
+
+    Rather than a correlated subquery per property, the properties are
+    matched by a single query over image_properties, grouped by image,
+    which can be answered from the (name, value, image_id) index added
+    by migration 017.
+
+    :param properties: dict of property names and values to match
+    :param show_deleted: whether deleted properties may match
+    """
+    prop = models.ImageProperty
+    value_prefix = sa_sql.func.substr(
+            prop.value, sa_sql.literal_column('1'),
+            sa_sql.literal_column(str(PROPERTY_VALUE_INDEX_LENGTH)))
+
+    criteria = []
+    for (name, value) in properties.items():
+        crit_attrs = [prop.name == name, prop.value == value]
+        if isinstance(value, basestring):
+            # Lets PostgreSQL use its index on the value prefix
+            crit_attrs.append(
+                    value_prefix == value[:PROPERTY_VALUE_INDEX_LENGTH])
+        criteria.append(sa_sql.and_(*crit_attrs))
+
+    image_ids = sa_sql.select([prop.image_id]).where(sa_sql.or_(*criteria))
+    if not show_deleted:
+        image_ids = image_ids.where(prop.deleted == False)
+    image_ids = image_ids.group_by(prop.image_id)\
+                         .having(sa_sql.func.count(prop.name.distinct()) ==
+                                 len(properties))
+
+    return models.Image.id.in_(image_ids)
+
+
+def _image_get_marker(context, session, image_id, showing_deleted):
+    """
+    Get the marker image of a page of images, without its properties,
+    or raise if it does not exist or is not visible.
+    """
+    query = session.query(models.Image).filter_by(id=image_id)
+    if not showing_deleted and not _can_show_deleted(context):
+        query = query.filter_by(deleted=False)
+
+    try:
+        image = query.one()
+    except sa_orm.exc.NoResultFound:
+        raise exception.NotFound("No image found with ID %s" % image_id)
+
+    if not is_image_visible(context, image):
+        raise exception.Forbidden("Image not visible to you")
+
+    return image
+
+
 def _drop_protected_attrs(model_class, values):
     """
     Removed protected attributes from values dictionary using the models
@@ -591,6 +841,9 @@ def _image_update(context, values, image_id, purge_props=False):
             values['is_public'] = bool(values.get('is_public', False))
             values['protected'] = bool(values.get('protected', False))
             image_ref = models.Image()
+            # A new image has no properties yet: initialize the collection
+            # so that it is not loaded from the database once saved
+            image_ref.properties
 
         # Need to canonicalize ownership
         if 'owner' in values and not values['owner']:
@@ -620,7 +873,15 @@ def _image_update(context, values, image_id, purge_props=False):
         _set_properties_for_image(context, image_ref, properties, purge_props,
                                   session)
 
-    return image_get(context, image_ref.id)
+        if not image_id:
+            # Columns the INSERT did not set are NULL, so set them as such
+            # rather than loading them back when they are first read
+            for key in sa_orm.object_mapper(image_ref).columns.keys():
+                if key not in image_ref.__dict__:
+                    sa_orm.attributes.set_committed_value(image_ref, key,
+                                                          None)
+
+    return image_ref
 
 
 def _set_properties_for_image(context, image_ref, properties,
@@ -628,31 +889,72 @@ def _set_properties_for_image(context, image_ref, properties,
     """
     Create or update a set of image_properties for a given image
 
+    The properties are written with at most one INSERT and two UPDATE
+    statements, however many there are, and image_ref.properties is
+    updated to match without reloading it. Properties created this way
+    are not given their ids.
+
     :param context: Request context
     :param image_ref: An Image object
     :param properties: A dict of properties to set
     :param session: A SQLAlchemy session to use (if present)
     """
+    session = session or get_session()
+    table = models.ImageProperty.__table__
+    now = timeutils.utcnow()
+
     orig_properties = {}
     for prop_ref in image_ref.properties:
         orig_properties[prop_ref.name] = prop_ref
 
+    created = []
+    updated = []
     for name, value in properties.iteritems():
-        prop_values = {'image_id': image_ref.id,
-                       'name': name,
-                       'value': value}
-        if name in orig_properties:
-            prop_ref = orig_properties[name]
-            _image_property_update(context, prop_ref, prop_values,
-                                   session=session)
-        else:
-            image_property_create(context, prop_values, session=session)
-
+        prop_ref = orig_properties.get(name)
+        if prop_ref is None:
+            created.append({'image_id': image_ref.id, 'name': name,
+                            'value': value, 'created_at': now,
+                            'updated_at': now, 'deleted': False})
+        elif prop_ref.value != value or prop_ref.deleted:
+            updated.append((prop_ref, value))
+
+    deleted = []
     if purge_props:
-        for key in orig_properties.keys():
-            if not key in properties:
-                prop_ref = orig_properties[key]
-                image_property_delete(context, prop_ref, session=session)
+        deleted = [prop_ref for name, prop_ref in orig_properties.iteritems()
+                   if name not in properties and not prop_ref.deleted]
+
+    if created:
+        session.execute(table.insert(), created)
+
+    if updated:
+        query = table.update()\
+                     .where(table.c.id == sa_sql.bindparam('_id'))\
+                     .values(value=sa_sql.bindparam('_value'),
+                             updated_at=now, deleted=False)
+        session.execute(query, [{'_id': prop_ref.id, '_value': value}
+                                for prop_ref, value in updated])
+
+    if deleted:
+        query = table.update()\
+                     .where(table.c.id.in_([p.id for p in deleted]))\
+                     .values(updated_at=now, deleted=True, deleted_at=now)
+        session.execute(query)
+
+    # Bring the loaded properties in line with what was written, without
+    # marking them as modified in the session
+    set_committed_value = sa_orm.attributes.set_committed_value
+    for prop_ref, value in updated:
+        set_committed_value(prop_ref, 'value', value)
+        set_committed_value(prop_ref, 'updated_at', now)
+        set_committed_value(prop_ref, 'deleted', False)
+    for prop_ref in deleted:
+        set_committed_value(prop_ref, 'updated_at', now)
+        set_committed_value(prop_ref, 'deleted', True)
+        set_committed_value(prop_ref, 'deleted_at', now)
+    if created:
+        prop_refs = list(image_ref.properties)
+        prop_refs.extend(models.ImageProperty(**values) for values in created)
+        set_committed_value(image_ref, 'properties', prop_refs)
 
 
 def image_property_create(context, values, session=None):
@@ -820,3 +1122,25 @@ def image_tag_get_all(context, image_id, session=None):
                   .order_by(sqlalchemy.asc(models.ImageTag.created_at))\
                   .all()
     return [tag['value'] for tag in tags]
+
+
+def image_tag_get_all_for_images(context, image_ids, session=None):
+    """
+    Get the tags of several images with a single query.
+
+    :param image_ids: ids of the images whose tags to get
+    :retval dict of image ids to lists of tags, like image_tag_get_all
+    """
+    tags = dict((image_id, []) for image_id in image_ids)
+    if not tags:
+        return tags
+
+    session = session or get_session()
+    query = session.query(models.ImageTag.image_id, models.ImageTag.value)\
+                   .filter(models.ImageTag.image_id.in_(tags.keys()))\
+                   .filter_by(deleted=False)\
+                   .order_by(sqlalchemy.asc(models.ImageTag.created_at),
+                             sqlalchemy.asc(models.ImageTag.id))
+    for image_id, value in query:
+        tags[image_id].append(value)
+    return tags
@@ -0,0 +1,49 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import schema
+
+
+# Images are listed in (sort_key, created_at, id) order, and the next page
+# is selected by comparing those columns with the marker image, so each
+# index lets a page be read from the marker onwards without a sort.
+INDEXES = {
+    'ix_images_created_at_id': ('created_at', 'id'),
+    'ix_images_updated_at_created_at_id': ('updated_at', 'created_at', 'id'),
+    'ix_images_name_created_at_id': ('name', 'created_at', 'id'),
+    'ix_images_size_created_at_id': ('size', 'created_at', 'id'),
+}
+
+
+def get_indexes(meta):
+    images = schema.Table('images', meta, autoload=True)
+    return [schema.Index(name, *[images.c[column] for column in columns])
+            for name, columns in sorted(INDEXES.items())]
+
+
+def upgrade(migrate_engine):
+    meta = schema.MetaData()
+    meta.bind = migrate_engine
+    for index in get_indexes(meta):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = schema.MetaData()
+    meta.bind = migrate_engine
+    for index in get_indexes(meta):
+        index.drop(migrate_engine)
@@ -23,8 +23,9 @@ SQLAlchemy models for glance data
 from sqlalchemy import Column, Integer, String, BigInteger
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import ForeignKey, DateTime, Boolean, Text
+from sqlalchemy import ForeignKey, DateTime, Boolean, Text, Index
 from sqlalchemy.orm import relationship, backref, object_mapper
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy import UniqueConstraint
 
 import glance.db.sqlalchemy.api
@@ -39,6 +40,27 @@ def compile_big_int_sqlite(type_, compiler, **kw):
     return 'INTEGER'
 
 
+PROPERTY_VALUE_INDEX = 'ix_image_properties_name_value_image_id'
+
+
+@compiles(CreateIndex, 'mysql', 'postgresql')
+def compile_create_property_value_index(create, compiler, **kw):
+    """
+    Property values are unbounded text, so MySQL and PostgreSQL index
+    only a prefix of them, as migration 017 does
+    """
+    if create.element.name != PROPERTY_VALUE_INDEX:
+        return compiler.visit_create_index(create, **kw)
+
+    length = glance.db.sqlalchemy.api.PROPERTY_VALUE_INDEX_LENGTH
+    if compiler.dialect.name == 'mysql':
+        value = 'value(%d)' % length
+    else:
+        value = 'substr(value, 1, %d)' % length
+    return ('CREATE INDEX %s ON image_properties (name, %s, image_id)' %
+            (PROPERTY_VALUE_INDEX, value))
+
+
 class ModelBase(object):
     """Base class for Nova and Glance Models"""
     __table_args__ = {'mysql_engine': 'InnoDB'}
@@ -100,6 +122,14 @@ class ModelBase(object):
 class Image(BASE, ModelBase):
     """Represents an image in the datastore"""
     __tablename__ = 'images'
+    __table_args__ = (Index('ix_images_created_at_id', 'created_at', 'id'),
+                      Index('ix_images_updated_at_created_at_id',
+                            'updated_at', 'created_at', 'id'),
+                      Index('ix_images_name_created_at_id',
+                            'name', 'created_at', 'id'),
+                      Index('ix_images_size_created_at_id',
+                            'size', 'created_at', 'id'),
+                      {'mysql_engine': 'InnoDB'})
 
     id = Column(String(36), primary_key=True, default=uuidutils.generate_uuid)
     name = Column(String(255))
@@ -119,7 +149,9 @@ class Image(BASE, ModelBase):
 class ImageProperty(BASE, ModelBase):
     """Represents an image properties in the datastore"""
     __tablename__ = 'image_properties'
-    __table_args__ = (UniqueConstraint('image_id', 'name'), {})
+    __table_args__ = (UniqueConstraint('image_id', 'name'),
+                      Index(PROPERTY_VALUE_INDEX, 'name', 'value', 'image_id'),
+                      {'mysql_engine': 'InnoDB'})
 
     id = Column(Integer, primary_key=True)
     image_id = Column(String(36), ForeignKey('images.id'),
@@ -19,10 +19,20 @@
 LRU Cache for Image Data
 """
 
+from contextlib import contextmanager
+import cStringIO
+import errno
 import hashlib
+import json
+import os
+import time
+
+import eventlet
 
 from glance.common import exception
 from glance.common import utils
+from glance.image_cache import eviction
+from glance.image_cache import memory
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 from glance.openstack.common import importutils
@@ -34,12 +44,55 @@ image_cache_opts = [
     cfg.IntOpt('image_cache_max_size', default=10 * (1024 ** 3)),  # 10 GB
     cfg.IntOpt('image_cache_stall_time', default=86400),  # 24 hours
     cfg.StrOpt('image_cache_dir'),
+    cfg.IntOpt('image_cache_follow_timeout', default=60,
+               help=_("Seconds a request reading an image that another "
+                      "request is still writing into the cache waits for "
+                      "more data before giving up")),
+    cfg.StrOpt('image_cache_eviction_policy', default='lru',
+               help=_("Policy choosing the cached images to prune first: "
+                      "lru, lfu, gdsf or arc")),
+    cfg.IntOpt('image_cache_memory_size', default=0,
+               help=_("Bytes of memory each API process may use to hold "
+                      "small, frequently read cached images, or 0 to "
+                      "disable the memory tier")),
+    cfg.IntOpt('image_cache_memory_max_image_size', default=32 * 1024 ** 2,
+               help=_("Largest image, in bytes, held in memory")),
+    cfg.IntOpt('image_cache_memory_promote_hits', default=2,
+               help=_("Number of reads from the on-disk cache after which "
+                      "an image is held in memory")),
+    cfg.BoolOpt('image_cache_dedup', default=False,
+                help=_("Share the cached data of images the cache found "
+                       "to have the same checksum")),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(image_cache_opts)
 
 DEFAULT_MAX_CACHE_SIZE = 10 * 1024 * 1024 * 1024  # 10 GB
+FOLLOW_POLL_INTERVAL = 0.1  # seconds
+
+_MEMORY_CACHE = None
+
+
+def get_memory_cache():
+    """
+    Returns the memory tier shared by all image caches of this process,
+    or None if the memory tier is disabled.
+    """
+    global _MEMORY_CACHE
+    if CONF.image_cache_memory_size <= 0:
+        return None
+    if _MEMORY_CACHE is None:
+        _MEMORY_CACHE = memory.MemoryCache(
+            CONF.image_cache_memory_size,
+            CONF.image_cache_memory_max_image_size,
+            CONF.image_cache_memory_promote_hits)
+    return _MEMORY_CACHE
+
+
+@contextmanager
+def _open_buffer(data):
+    yield cStringIO.StringIO(data)
 
 
 class ImageCache(object):
@@ -48,6 +101,9 @@ class ImageCache(object):
 
     def __init__(self):
         self.init_driver()
+        self.policy = eviction.get_policy(CONF.image_cache_eviction_policy)
+        self.memory = get_memory_cache()
+        self.dedup = CONF.image_cache_dedup
 
     def init_driver(self):
         """
@@ -105,6 +161,15 @@ class ImageCache(object):
         """
         return self.driver.is_queued(image_id)
 
+    def is_being_cached(self, image_id):
+        """
+        Returns True if the image with supplied id is currently
+        in the process of having its image file cached.
+
+        :param image_id: Image ID
+        """
+        return self.driver.is_being_cached(image_id)
+
     def get_cache_size(self):
         """
         Returns the total size in bytes of the image cache.
@@ -121,16 +186,28 @@ class ImageCache(object):
 
     def get_cached_images(self):
         """
-        Returns a list of records about cached images.
+        Returns a list of records about cached images. With the memory
+        tier enabled, each record also gives the number of times the image
+        was read from the memory of this process ('memory_hits'), while
+        'hits' counts the reads of all processes, from disk or memory.
         """
-        return self.driver.get_cached_images()
+        images = self.driver.get_cached_images()
+        if self.memory is not None:
+            for image in images:
+                image['memory_hits'] = self.memory.get_hit_count(
+                        image['image_id'])
+        return images
 
     def delete_all_cached_images(self):
         """
         Removes all cached image files and any attributes about the images
         and returns the number of cached image files that were deleted.
         """
-        return self.driver.delete_all_cached_images()
+        if self.memory is not None:
+            self.memory.clear()
+        deleted = self.driver.delete_all_cached_images()
+        self.driver.delete_orphaned_blobs()
+        return deleted
 
     def delete_cached_image(self, image_id):
         """
@@ -138,7 +215,10 @@ class ImageCache(object):
 
         :param image_id: Image ID
         """
+        if self.memory is not None:
+            self.memory.delete(image_id)
         self.driver.delete_cached_image(image_id)
+        self.driver.delete_orphaned_blobs()
 
     def delete_all_queued_images(self):
         """
@@ -160,6 +240,9 @@ class ImageCache(object):
         Removes all cached image files above the cache's maximum
         size. Returns a tuple containing the total number of cached
         files removed and the total size of all pruned image files.
+
+        When images with the same data share a blob, the blob is pruned
+        as a whole, along with all the images linked to it.
         """
         max_size = CONF.image_cache_max_size
         current_size = self.driver.get_cache_size()
@@ -174,28 +257,117 @@ class ImageCache(object):
 
         total_bytes_pruned = 0
         total_files_pruned = 0
-        entry = self.driver.get_least_recently_accessed()
-        while entry and current_size > max_size:
-            image_id, size = entry
+        entries = self.driver.get_cached_images()
+        links = {}
+        if self.dedup:
+            entries, links = self._group_by_blob(entries)
+        self._load_policy_state()
+        victims = self.policy.select_victims(entries, overage)
+        self._save_policy_state()
+        for image_id, size in victims:
             LOG.debug(_("Pruning '%(image_id)s' to free %(size)d bytes"),
                       {'image_id': image_id, 'size': size})
-            self.driver.delete_cached_image(image_id)
+            for linked_id in links.get(image_id, [image_id]):
+                self.driver.delete_cached_image(linked_id)
+                total_files_pruned = total_files_pruned + 1
             total_bytes_pruned = total_bytes_pruned + size
-            total_files_pruned = total_files_pruned + 1
-            current_size = current_size - size
-            entry = self.driver.get_least_recently_accessed()
+        self.driver.delete_orphaned_blobs()
 
         LOG.debug(_("Pruning finished pruning. "
                     "Pruned %(total_files_pruned)d and "
                     "%(total_bytes_pruned)d.") % locals())
         return total_files_pruned, total_bytes_pruned
 
+    def _get_policy_state_path(self):
+        # NOTE: kept out of the cache directory itself, where every
+        # regular file is taken for a cached image
+        return os.path.join(self.driver.base_dir, 'eviction',
+                            '%s.json' % self.policy.name)
+
+    def _load_policy_state(self):
+        """
+        Gives the eviction policy the state it saved at the end of the
+        last prune, which may have been made by another process, such
+        as an earlier run of the pruner.
+        """
+        if self.policy.get_state() is None:
+            return
+
+        path = self._get_policy_state_path()
+        try:
+            with open(path) as state_file:
+                self.policy.set_state(json.load(state_file))
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                LOG.warn(_("Unable to read the eviction policy state "
+                           "%(path)s: %(e)s") % locals())
+        except (ValueError, KeyError, TypeError), e:
+            LOG.warn(_("Ignoring invalid eviction policy state in "
+                       "%(path)s: %(e)s") % locals())
+            self.policy = eviction.get_policy(self.policy.name)
+
+    def _save_policy_state(self):
+        """Saves the state of the eviction policy for the next prune."""
+        state = self.policy.get_state()
+        if state is None:
+            return
+
+        path = self._get_policy_state_path()
+        try:
+            utils.safe_mkdirs(os.path.dirname(path))
+            with open(path + '.tmp', 'w') as state_file:
+                json.dump(state, state_file)
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError), e:
+            LOG.warn(_("Unable to save the eviction policy state to "
+                       "%(path)s: %(e)s") % locals())
+
+    def _group_by_blob(self, entries):
+        """
+        Merges the records about cached images whose image files are
+        links to the same blob into a single record with the ID of the
+        first of those images, their combined hits and their latest
+        access time. Returns the merged records, and a dict mapping the
+        image ID of each merged record to the IDs of all the images it
+        stands for.
+
+        :param entries: Records about cached images, as returned by the
+                        cache driver's get_cached_images()
+        """
+        blobs = {}
+        links = {}
+        merged = []
+        for entry in entries:
+            inode = entry.get('inode')
+            if inode is None:
+                # Only for images the driver cached before it recorded
+                # the inodes of image files
+                path = self.driver.get_image_filepath(entry['image_id'])
+                try:
+                    inode = os.stat(path).st_ino
+                except OSError:
+                    # The image was deleted since the records were gathered
+                    continue
+
+            blob = blobs.get(inode)
+            if blob is None:
+                blob = blobs[inode] = dict(entry)
+                links[blob['image_id']] = [blob['image_id']]
+                merged.append(blob)
+            else:
+                blob['hits'] += entry['hits']
+                blob['last_accessed'] = max(blob['last_accessed'],
+                                            entry['last_accessed'])
+                links[blob['image_id']].append(entry['image_id'])
+        return merged, links
+
     def clean(self, stall_time=None):
         """
         Cleans up any invalid or incomplete cached images. The cache driver
         decides what that means...
         """
         self.driver.clean(stall_time)
+        self.driver.delete_orphaned_blobs()
 
     def queue_image(self, image_id):
         """
@@ -208,7 +380,48 @@ class ImageCache(object):
         """
         return self.driver.queue_image(image_id)
 
-    def get_caching_iter(self, image_id, image_checksum, image_iter):
+    def link_image(self, image_id, checksum):
+        """
+        Caches an image without fetching its data, if the data of an image
+        with the same checksum is already cached under another ID.
+
+        The checksum of an image in the registry may have been given by
+        whoever registered it, rather than computed from its data. So an
+        image is only linked to a blob if its own data was hashed to the
+        checksum of the blob when it was cached before. Otherwise the data
+        of another tenant's image could be served for it.
+
+        :param image_id: Image ID
+        :param checksum: MD5 checksum of the image data, from the registry
+
+        :retval True if image file was cached, False otherwise
+        """
+        if not (self.dedup and checksum and
+                self.driver.is_cacheable(image_id)):
+            return False
+
+        if str(image_id) not in self.driver.get_blob_owners(checksum):
+            LOG.debug(_("Not linking image '%(image_id)s' to the blob with "
+                        "checksum %(checksum)s, as its data was never found "
+                        "to have that checksum"), locals())
+            return False
+
+        if not self.driver.link_image(image_id, checksum):
+            return False
+        LOG.debug(_("Cached image '%(image_id)s' by linking it to the "
+                    "blob with checksum %(checksum)s"), locals())
+        return True
+
+    def _store_blob(self, image_id, checksum):
+        """
+        Makes the data of an image just cached available to images with
+        the same checksum cached later
+        """
+        if self.dedup:
+            self.driver.store_blob(image_id, checksum)
+
+    def get_caching_iter(self, image_id, image_checksum, image_iter,
+                         opened=None):
         """
         Returns an iterator that caches the contents of an image
         while the image contents are read through the supplied
@@ -218,8 +431,20 @@ class ImageCache(object):
         :param image_checksum: checksum expected to be generated while
                                iterating over image data
         :param image_iter: Iterator that will read image contents
+        :param opened: Optional callable called once the image file has
+                       been opened for writing, so that other requests may
+                       follow it with get_following_iter(), or once it is
+                       known that the image is not going to be cached
         """
+        called = []
+
+        def notify_opened():
+            if opened is not None and not called:
+                called.append(True)
+                opened()
+
         if not self.driver.is_cacheable(image_id):
+            notify_opened()
             return image_iter
 
         LOG.debug(_("Tee'ing image '%s' into cache"), image_id)
@@ -229,6 +454,7 @@ class ImageCache(object):
                 current_checksum = hashlib.md5()
 
                 with self.driver.open_for_write(image_id) as cache_file:
+                    notify_opened()
                     for chunk in image_iter:
                         try:
                             cache_file.write(chunk)
@@ -243,6 +469,8 @@ class ImageCache(object):
                                 "caching of image '%s'." % image_id)
                         raise exception.GlanceException(msg)
 
+                self._store_blob(image_id, current_checksum.hexdigest())
+
             except exception.GlanceException as e:
                 # image_iter has given us bad, (size_checked_iter has found a
                 # bad length), or corrupt data (checksum is wrong).
@@ -252,6 +480,8 @@ class ImageCache(object):
                 LOG.exception(_("Exception encountered while tee'ing "
                                 "image '%s' into cache: %s. Continuing "
                                 "with response.") % (image_id, e))
+            finally:
+                notify_opened()
 
             # NOTE(markwash): continue responding even if caching failed
             for chunk in image_iter:
@@ -259,6 +489,103 @@ class ImageCache(object):
 
         return tee_iter(image_id)
 
+    def get_following_iter(self, image_id, chunk_size=65536):
+        """
+        Returns an iterator over the image file of an image that is
+        being cached by another request, or None if the image is not
+        being cached. The iterator reads the incomplete image file while
+        it is written, waiting for more data whenever it catches up with
+        the writer, until the file has been completely cached.
+
+        If caching the image fails, or no data is written for
+        image_cache_follow_timeout seconds, the iterator raises
+        GlanceException once it has yielded the data written so far.
+
+        :param image_id: Image ID
+        :param chunk_size: Maximum size of the chunks to yield
+        """
+        incomplete_path = self.driver.get_image_filepath(image_id,
+                                                         'incomplete')
+        final_path = self.driver.get_image_filepath(image_id)
+        try:
+            inode = os.stat(incomplete_path).st_ino
+        except OSError:
+            return None
+
+        LOG.debug(_("Following image '%s' as it is cached"), image_id)
+
+        def failed():
+            msg = (_("Image '%s' being followed failed to be "
+                     "cached") % image_id)
+            return exception.GlanceException(msg)
+
+        def open_followed():
+            # NOTE: the file is only opened once the iterator is used, so
+            # that nothing is left open if it never is. By then the writer
+            # may have finished and renamed the file.
+            for path in (incomplete_path, final_path):
+                try:
+                    cache_file = open(path, 'rb')
+                except IOError:
+                    continue
+                if os.fstat(cache_file.fileno()).st_ino == inode:
+                    return cache_file
+                cache_file.close()
+            raise failed()
+
+        def still_writing(inode):
+            # NOTE: the writer renames the file once it has finished,
+            # whether it succeeded or not, and a later attempt to cache
+            # the image would write a new file at the same path
+            try:
+                return os.stat(incomplete_path).st_ino == inode
+            except OSError:
+                return False
+
+        def follow_iter():
+            cache_file = open_followed()
+            # NOTE: the data is read with os.read(), as reads through a
+            # file object may keep returning nothing once they have hit
+            # the end of the file, even after the file has grown
+            fd = cache_file.fileno()
+            try:
+                last_read = time.time()
+                while True:
+                    chunk = os.read(fd, chunk_size)
+                    if chunk:
+                        last_read = time.time()
+                        yield chunk
+                        eventlet.sleep(0)
+                        continue
+
+                    if not still_writing(inode):
+                        break
+
+                    waited = time.time() - last_read
+                    if waited > CONF.image_cache_follow_timeout:
+                        msg = (_("Timed out waiting for more data of "
+                                 "image '%s' to be cached") % image_id)
+                        raise exception.GlanceException(msg)
+                    eventlet.sleep(FOLLOW_POLL_INTERVAL)
+
+                # Read whatever was written between our last read and
+                # the writer finishing
+                chunk = os.read(fd, chunk_size)
+                while chunk:
+                    yield chunk
+                    chunk = os.read(fd, chunk_size)
+
+                try:
+                    cached = os.stat(final_path).st_ino == inode
+                except OSError:
+                    cached = False
+                if not cached:
+                    raise failed()
+            finally:
+                cache_file.close()
+
+        return follow_iter()
+
     def cache_image_iter(self, image_id, image_iter):
         """
         Cache an image with supplied iterator.
@@ -271,10 +598,13 @@ class ImageCache(object):
         if not self.driver.is_cacheable(image_id):
             return False
 
+        checksum = hashlib.md5()
         with self.driver.open_for_write(image_id) as cache_file:
             for chunk in image_iter:
                 cache_file.write(chunk)
+                checksum.update(chunk)
             cache_file.flush()
+        self._store_blob(image_id, checksum.hexdigest())
         return True
 
     def cache_image_file(self, image_id, image_file):
@@ -301,7 +631,46 @@ class ImageCache(object):
 
         :param image_id: Image ID
         """
-        return self.driver.open_for_read(image_id)
+        if self.memory is None:
+            return self.driver.open_for_read(image_id)
+
+        # Another process may have deleted, pruned or cached the image
+        # again since it was read into memory
+        file_info = self._stat_cached_file(image_id)
+        if file_info is None:
+            self.memory.delete(image_id)
+            return self.driver.open_for_read(image_id)
+
+        identity = (file_info.st_ino, file_info.st_size, file_info.st_mtime)
+        data = self.memory.get(image_id, identity)
+        if data is not None:
+            return self._open_memory(image_id, data)
+
+        if not self.memory.should_promote(image_id, file_info.st_size):
+            return self.driver.open_for_read(image_id)
+
+        with self.driver.open_for_read(image_id) as cache_file:
+            data = cache_file.read()
+        LOG.debug(_("Promoting image '%s' into the memory cache"), image_id)
+        self.memory.put(image_id, data, identity)
+        return _open_buffer(data)
+
+    @contextmanager
+    def _open_memory(self, image_id, data):
+        yield cStringIO.StringIO(data)
+        self.driver.record_hit(image_id)
+
+    def _stat_cached_file(self, image_id):
+        """
+        Returns the stat of the image file for an image with supplied
+        identifier, or None if the image is not cached.
+        """
+        if not self.driver.is_cached(image_id):
+            return None
+        try:
+            return os.stat(self.driver.get_image_filepath(image_id))
+        except OSError:
+            return None
 
     def get_image_size(self, image_id):
         """
@@ -19,6 +19,7 @@
 Base attribute driver class
 """
 
+import errno
 import os.path
 
 from glance.common import exception
@@ -62,7 +63,11 @@ class Driver(object):
         self.invalid_dir = os.path.join(self.base_dir, 'invalid')
         self.queue_dir = os.path.join(self.base_dir, 'queue')
 
+        self.blob_dir = os.path.join(self.base_dir, 'blobs')
+
         dirs = [self.incomplete_dir, self.invalid_dir, self.queue_dir]
+        if CONF.image_cache_dedup:
+            dirs.append(self.blob_dir)
 
         for path in dirs:
             utils.safe_mkdirs(path)
@@ -85,10 +90,13 @@ class Driver(object):
                 'hits': INTEGER,
                 'last_modified': ISO_TIMESTAMP,
                 'last_accessed': ISO_TIMESTAMP,
-                'size': INTEGER
+                'size': INTEGER,
+                'inode': INTEGER
                 }, ...
             ]
 
+        The inode number of the image file, the same for the images linked
+        to the same blob, may be None if the driver does not know it.
         """
         return NotImplementedError
 
@@ -188,6 +196,15 @@ class Driver(object):
         """
         raise NotImplementedError
 
+    def record_hit(self, image_id):
+        """
+        Count a hit on a cached image that was read without opening its
+        image file through open_for_read(), e.g. from memory.
+
+        :param image_id: Image ID
+        """
+        raise NotImplementedError
+
     def get_image_filepath(self, image_id, cache_status='active'):
         """
         This crafts an absolute path to a specific entry
@@ -199,6 +216,120 @@ class Driver(object):
             return os.path.join(self.base_dir, str(image_id))
         return os.path.join(self.base_dir, cache_status, str(image_id))
 
+    def get_blob_filepath(self, checksum):
+        """
+        This crafts an absolute path to the blob holding the image data
+        with the supplied checksum
+
+        :param checksum: MD5 checksum of the image data
+        """
+        return os.path.join(self.blob_dir, str(checksum))
+
+    def get_blob_owners_filepath(self, checksum):
+        """
+        This crafts an absolute path to the file listing the images whose
+        data was found to have the supplied checksum
+
+        :param checksum: MD5 checksum of the image data
+        """
+        return os.path.join(self.blob_dir, '%s.owners' % checksum)
+
+    def get_blob_owners(self, checksum):
+        """
+        Returns the set of IDs of the images whose data was hashed to the
+        supplied checksum as it was cached, i.e. the images that may be
+        linked to the blob with that checksum.
+
+        :param checksum: MD5 checksum of the image data
+        """
+        try:
+            with open(self.get_blob_owners_filepath(checksum)) as owners:
+                return set(line.strip() for line in owners)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            return set()
+
+    def link_image(self, image_id, checksum):
+        """
+        Caches the image file for an image with supplied identifier
+        by linking it to the blob with the supplied checksum, without
+        writing any image data.
+
+        :param image_id: Image ID
+        :param checksum: MD5 checksum of the image data
+
+        :retval True if the image file was linked, False if there is
+                no blob with that checksum
+        """
+        raise NotImplementedError
+
+    def _link_blob(self, checksum, path):
+        """
+        Hard links the blob with the supplied checksum to path, returning
+        False if there is no such blob
+        """
+        try:
+            os.link(self.get_blob_filepath(checksum), path)
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        return True
+
+    def store_blob(self, image_id, checksum):
+        """
+        Makes the cached image file for an image with supplied identifier
+        the blob for its checksum, unless there already is a blob with that
+        checksum, and records the image as one of the owners of the blob.
+
+        The checksum must have been computed from the cached image data,
+        never taken from the image metadata, which anyone registering an
+        image may set: the blob is linked to the owners of its data only.
+
+        :param image_id: Image ID
+        :param checksum: MD5 checksum of the image data
+        """
+        try:
+            os.link(self.get_image_filepath(image_id),
+                    self.get_blob_filepath(checksum))
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        if str(image_id) not in self.get_blob_owners(checksum):
+            with open(self.get_blob_owners_filepath(checksum), 'a') as owners:
+                owners.write('%s\n' % image_id)
+
+    def delete_orphaned_blobs(self):
+        """
+        Removes the blobs no cached image file is linked to anymore, along
+        with their lists of owners, and returns the number of blobs that
+        were deleted.
+        """
+        if not os.path.isdir(self.blob_dir):
+            return 0
+
+        deleted = 0
+        for fname in os.listdir(self.blob_dir):
+            if fname.endswith('.owners'):
+                continue
+            path = os.path.join(self.blob_dir, fname)
+            try:
+                if os.stat(path).st_nlink != 1:
+                    continue
+                LOG.debug(_("Deleting orphaned blob '%s'"), path)
+                os.unlink(path)
+            except OSError:
+                # Deleted by another process since the directory was listed
+                continue
+            deleted += 1
+            try:
+                os.unlink(self.get_blob_owners_filepath(fname))
+            except OSError:
+                pass
+        return deleted
+
     def get_image_size(self, image_id):
         """
         Return the size of the image file for an image with supplied
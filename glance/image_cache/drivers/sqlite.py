@@ -25,7 +25,7 @@ import os
 import stat
 import time
 
-from eventlet import sleep, timeout
+from eventlet import semaphore, sleep, spawn_after, timeout
 import sqlite3
 
 from glance.common import exception
@@ -37,6 +37,10 @@ LOG = logging.getLogger(__name__)
 
 sqlite_opts = [
     cfg.StrOpt('image_cache_sqlite_db', default='cache.db'),
+    cfg.IntOpt('image_cache_sqlite_flush_interval', default=10,
+               help=_("Seconds the SQLite cache driver collects the hits "
+                      "on cached images in memory before writing them to "
+                      "its database in one transaction")),
 ]
 
 CONF = cfg.CONF
@@ -96,12 +100,22 @@ class Driver(base.Driver):
         """
         super(Driver, self).configure()
 
+        self._conn = None
+        self._conn_pid = None
+        self._db_lock = semaphore.Semaphore()
+        self._pending_hits = {}
+        self._flush_timer = None
+
         # Create the SQLite database that will hold our cache attributes
         self.initialize_db()
 
     def initialize_db(self):
         db = CONF.image_cache_sqlite_db
         self.db_path = os.path.join(self.base_dir, db)
+        # Besides the database itself, SQLite keeps its journal or its
+        # write-ahead log and shared memory index next to it
+        self.db_files = [self.db_path] + [self.db_path + suffix for suffix
+                                          in ('-journal', '-wal', '-shm')]
         try:
             conn = sqlite3.connect(self.db_path, check_same_thread=False,
                                    factory=SqliteConnection)
@@ -112,9 +126,11 @@ class Driver(base.Driver):
                     last_modified REAL DEFAULT 0.0,
                     size INTEGER DEFAULT 0,
                     hits INTEGER DEFAULT 0,
-                    checksum TEXT
+                    checksum TEXT,
+                    inode INTEGER
                 );
             """)
+            self._add_inode_column(conn)
             conn.close()
         except sqlite3.DatabaseError, e:
             msg = _("Failed to initialize the image cache database. "
@@ -123,17 +139,35 @@ class Driver(base.Driver):
             raise exception.BadDriverConfiguration(driver_name='sqlite',
                                                    reason=msg)
 
+    def _add_inode_column(self, conn):
+        """
+        Adds the inode column to a database created before the inodes of
+        image files were recorded. Their rows are left without an inode.
+        """
+        columns = [row[1] for row in
+                   conn.execute("PRAGMA table_info(cached_images)")]
+        if 'inode' in columns:
+            return
+        try:
+            conn.execute("ALTER TABLE cached_images ADD COLUMN inode INTEGER")
+        except sqlite3.OperationalError:
+            # Unless another process added the column in the meantime
+            columns = [row[1] for row in
+                       conn.execute("PRAGMA table_info(cached_images)")]
+            if 'inode' not in columns:
+                raise
+
     def get_cache_size(self):
         """
         Returns the total size in bytes of the image cache.
         """
-        sizes = []
+        sizes = {}
         for path in self.get_cache_files(self.base_dir):
-            if path == self.db_path:
-                continue
             file_info = os.stat(path)
-            sizes.append(file_info[stat.ST_SIZE])
-        return sum(sizes)
+            # Image files linked to the same blob take up space only once
+            inode = (file_info[stat.ST_DEV], file_info[stat.ST_INO])
+            sizes[inode] = file_info[stat.ST_SIZE]
+        return sum(sizes.values())
 
     def get_hit_count(self, image_id):
         """
@@ -144,6 +178,7 @@ class Driver(base.Driver):
         if not self.is_cached(image_id):
             return 0
 
+        self.flush_hits()
         hits = 0
         with self.get_db() as db:
             cur = db.execute("""SELECT hits FROM cached_images
@@ -157,9 +192,11 @@ class Driver(base.Driver):
         Returns a list of records about cached images.
         """
         LOG.debug(_("Gathering cached image entries."))
+        self.flush_hits()
         with self.get_db() as db:
             cur = db.execute("""SELECT
-                             image_id, hits, last_accessed, last_modified, size
+                             image_id, hits, last_accessed, last_modified,
+                             size, inode
                              FROM cached_images
                              ORDER BY image_id""")
             cur.row_factory = dict_factory
@@ -209,6 +246,7 @@ class Driver(base.Driver):
         Removes all cached image files and any attributes about the images
         """
         deleted = 0
+        self._pending_hits.clear()
         with self.get_db() as db:
             for path in self.get_cache_files(self.base_dir):
                 delete_cached_file(path)
@@ -224,6 +262,7 @@ class Driver(base.Driver):
         :param image_id: Image ID
         """
         path = self.get_image_filepath(image_id)
+        self._pending_hits.pop(image_id, None)
         with self.get_db() as db:
             delete_cached_file(path)
             db.execute("""DELETE FROM cached_images WHERE image_id = ?""",
@@ -269,6 +308,7 @@ class Driver(base.Driver):
         Return a tuple containing the image_id and size of the least recently
         accessed cached file, or None if no cached files.
         """
+        self.flush_hits()
         with self.get_db() as db:
             cur = db.execute("""SELECT image_id FROM cached_images
                              ORDER BY last_accessed LIMIT 1""")
@@ -305,13 +345,15 @@ class Driver(base.Driver):
                 if self.is_queued(image_id):
                     os.unlink(self.get_image_filepath(image_id, 'queue'))
 
-                filesize = os.path.getsize(final_path)
+                file_info = os.stat(final_path)
                 now = time.time()
 
                 db.execute("""INSERT INTO cached_images
-                           (image_id, last_accessed, last_modified, hits, size)
-                           VALUES (?, 0, ?, 0, ?)""",
-                           (image_id, now, filesize))
+                           (image_id, last_accessed, last_modified, hits, size,
+                            inode)
+                           VALUES (?, 0, ?, 0, ?, ?)""",
+                           (image_id, now, file_info[stat.ST_SIZE],
+                            file_info[stat.ST_INO]))
                 db.commit()
 
         def rollback(e):
@@ -345,6 +387,37 @@ class Driver(base.Driver):
             if os.path.exists(incomplete_path):
                 rollback('incomplete fetch')
 
+    def link_image(self, image_id, checksum):
+        """
+        Caches the image file for an image with supplied identifier
+        by linking it to the blob with the supplied checksum.
+
+        :param image_id: Image ID
+        :param checksum: MD5 checksum of the image data
+
+        :retval True if the image file was linked, False otherwise
+        """
+        final_path = self.get_image_filepath(image_id)
+        with self.get_db() as db:
+            if not self._link_blob(checksum, final_path):
+                return False
+
+            # Make sure that we "pop" the image from the queue...
+            if self.is_queued(image_id):
+                os.unlink(self.get_image_filepath(image_id, 'queue'))
+
+            file_info = os.stat(final_path)
+            now = time.time()
+
+            db.execute("""INSERT INTO cached_images
+                       (image_id, last_accessed, last_modified, hits, size,
+                        checksum, inode)
+                       VALUES (?, ?, ?, 0, ?, ?, ?)""",
+                       (image_id, now, now, file_info[stat.ST_SIZE],
+                        checksum, file_info[stat.ST_INO]))
+            db.commit()
+        return True
+
     @contextmanager
     def open_for_read(self, image_id):
         """
@@ -356,36 +429,86 @@ class Driver(base.Driver):
         path = self.get_image_filepath(image_id)
         with open(path, 'rb') as cache_file:
             yield cache_file
+        self.record_hit(image_id)
+
+    def record_hit(self, image_id):
+        """
+        Count a hit on a cached image in memory, to be written to the
+        database along with other hits by flush_hits(), so that serving
+        an image from the cache never waits for the database write lock.
+        The first hit counted since the last flush schedules the next one.
+        """
         now = time.time()
+        hits = self._pending_hits.get(image_id, (0, now))[0]
+        self._pending_hits[image_id] = (hits + 1, now)
+        if self._flush_timer is None:
+            self._flush_timer = spawn_after(
+                    CONF.image_cache_sqlite_flush_interval, self.flush_hits)
+
+    def flush_hits(self):
+        """
+        Write the hits on cached images counted since the last flush to
+        the database, in a single transaction.
+        """
+        if self._flush_timer is not None:
+            # Only cancels the scheduled flush if this is not it
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending_hits:
+            return
+
+        pending_hits = self._pending_hits
+        self._pending_hits = {}
         with self.get_db() as db:
-            db.execute("""UPDATE cached_images
-                       SET hits = hits + 1, last_accessed = ?
-                       WHERE image_id = ?""",
-                       (now, image_id))
+            db.executemany("""UPDATE cached_images
+                           SET hits = hits + ?, last_accessed = ?
+                           WHERE image_id = ?""",
+                           [(hits, last_accessed, image_id)
+                            for image_id, (hits, last_accessed)
+                            in pending_hits.iteritems()])
             db.commit()
 
+    def _get_connection(self):
+        """
+        Return the database connection of this process, opening it if
+        this is the first use of the database since the process started
+        or was forked.
+        """
+        pid = os.getpid()
+        if self._conn is None or self._conn_pid != pid:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   factory=SqliteConnection)
+            conn.row_factory = sqlite3.Row
+            conn.text_factory = str
+            # A write-ahead log lets readers go on while hits are written
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA count_changes = OFF')
+            conn.execute('PRAGMA temp_store = MEMORY')
+            self._conn = conn
+            self._conn_pid = pid
+        return self._conn
+
     @contextmanager
     def get_db(self):
         """
-        Returns a context manager that produces a database connection that
-        self-closes and calls rollback if an error occurs while using the
-        database connection
-        """
-        conn = sqlite3.connect(self.db_path, check_same_thread=False,
-                               factory=SqliteConnection)
-        conn.row_factory = sqlite3.Row
-        conn.text_factory = str
-        conn.execute('PRAGMA synchronous = NORMAL')
-        conn.execute('PRAGMA count_changes = OFF')
-        conn.execute('PRAGMA temp_store = MEMORY')
-        try:
-            yield conn
-        except sqlite3.DatabaseError, e:
-            msg = _("Error executing SQLite call. Got error: %s") % e
-            LOG.error(msg)
-            conn.rollback()
-        finally:
-            conn.close()
+        Returns a context manager that produces the database connection of
+        this process, held for the exclusive use of the caller, and calls
+        rollback if an error occurs while using the database connection
+        """
+        with self._db_lock:
+            conn = self._get_connection()
+            try:
+                yield conn
+            except sqlite3.DatabaseError, e:
+                msg = _("Error executing SQLite call. Got error: %s") % e
+                LOG.error(msg)
+                conn.rollback()
+            except Exception:
+                # The connection outlives the caller, so a transaction left
+                # open would hold the database write lock for good
+                conn.rollback()
+                raise
 
     def queue_image(self, image_id):
         """
@@ -463,7 +586,7 @@ class Driver(base.Driver):
         """
         for fname in os.listdir(basepath):
             path = os.path.join(basepath, fname)
-            if path != self.db_path and os.path.isfile(path):
+            if path not in self.db_files and os.path.isfile(path):
                 yield path
 
 
@@ -70,8 +70,15 @@ import glance.openstack.common.log as logging
 
 LOG = logging.getLogger(__name__)
 
+xattr_opts = [
+    cfg.IntOpt('image_cache_xattr_rescan_interval', default=300,
+               help=_("Seconds after which the xattr cache driver scans "
+                      "the cache directory again to pick up changes made "
+                      "by other processes to its index of cached images")),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(xattr_opts)
 
 
 class Driver(base.Driver):
@@ -117,15 +124,55 @@ class Driver(base.Driver):
             if os.path.exists(fake_image_filepath):
                 os.unlink(fake_image_filepath)
 
+        self._scan()
+
+    def _scan(self):
+        """
+        Build the index of cached images from the files in the cache
+        directory, replacing any index built before.
+
+        The index maps the ID of each cached image to its size, hit
+        count and last access and modification times, so that questions
+        about the cache as a whole are answered without a stat() and
+        getxattr() call for every cached file. It is kept up to date as
+        images are cached, read and deleted by this process, and built
+        again every image_cache_xattr_rescan_interval seconds to pick up
+        the changes made by other processes sharing the cache directory.
+        """
+        index = {}
+        for path in get_all_regular_files(self.base_dir):
+            try:
+                index[os.path.basename(path)] = self._stat_entry(path)
+            except OSError:
+                # The file was deleted since the directory was listed
+                continue
+        self._index = index
+        self._scanned_at = time.time()
+
+    def _stat_entry(self, path):
+        file_info = os.stat(path)
+        return {
+            'inode': (file_info[stat.ST_DEV], file_info[stat.ST_INO]),
+            'size': file_info[stat.ST_SIZE],
+            'last_accessed': file_info[stat.ST_ATIME],
+            'last_modified': file_info[stat.ST_MTIME],
+            'hits': int(get_xattr(path, 'hits', default=0)),
+        }
+
+    def _get_index(self):
+        interval = CONF.image_cache_xattr_rescan_interval
+        if time.time() - self._scanned_at >= interval:
+            self._scan()
+        return self._index
+
     def get_cache_size(self):
         """
         Returns the total size in bytes of the image cache.
         """
-        sizes = []
-        for path in get_all_regular_files(self.base_dir):
-            file_info = os.stat(path)
-            sizes.append(file_info[stat.ST_SIZE])
-        return sum(sizes)
+        # Image files linked to the same blob take up space only once
+        sizes = dict((e['inode'], e['size'])
+                     for e in self._get_index().itervalues())
+        return sum(sizes.values())
 
     def get_hit_count(self, image_id):
         """
@@ -133,11 +180,10 @@ class Driver(base.Driver):
 
         :param image_id: Opaque image identifier
         """
-        if not self.is_cached(image_id):
+        entry = self._get_index().get(image_id)
+        if entry is None:
             return 0
-
-        path = self.get_image_filepath(image_id)
-        return int(get_xattr(path, 'hits', default=0))
+        return entry['hits']
 
     def get_cached_images(self):
         """
@@ -145,22 +191,17 @@ class Driver(base.Driver):
         """
         LOG.debug(_("Gathering cached image entries."))
         entries = []
-        for path in get_all_regular_files(self.base_dir):
-            image_id = os.path.basename(path)
-
-            entry = {}
-            entry['image_id'] = image_id
-
-            file_info = os.stat(path)
-            entry['last_modified'] = iso8601_from_timestamp(
-                file_info[stat.ST_MTIME])
-            entry['last_accessed'] = iso8601_from_timestamp(
-                file_info[stat.ST_ATIME])
-            entry['size'] = file_info[stat.ST_SIZE]
-            entry['hits'] = self.get_hit_count(image_id)
-
-            entries.append(entry)
-        entries.sort()  # Order by ID
+        for image_id, entry in sorted(self._get_index().iteritems()):
+            entries.append({
+                'image_id': image_id,
+                'last_modified': iso8601_from_timestamp(
+                    entry['last_modified']),
+                'last_accessed': iso8601_from_timestamp(
+                    entry['last_accessed']),
+                'size': entry['size'],
+                'hits': entry['hits'],
+                'inode': entry['inode'][1],
+            })
         return entries
 
     def is_cached(self, image_id):
@@ -208,6 +249,7 @@ class Driver(base.Driver):
         for path in get_all_regular_files(self.base_dir):
             delete_cached_file(path)
             deleted += 1
+        self._index = {}
         return deleted
 
     def delete_cached_image(self, image_id):
@@ -218,6 +260,7 @@ class Driver(base.Driver):
         """
         path = self.get_image_filepath(image_id)
         delete_cached_file(path)
+        self._index.pop(image_id, None)
 
     def delete_all_queued_images(self):
         """
@@ -243,18 +286,12 @@ class Driver(base.Driver):
         Return a tuple containing the image_id and size of the least recently
         accessed cached file, or None if no cached files.
         """
-        stats = []
-        for path in get_all_regular_files(self.base_dir):
-            file_info = os.stat(path)
-            stats.append((file_info[stat.ST_ATIME],  # access time
-                          file_info[stat.ST_SIZE],   # size in bytes
-                          path))                     # absolute path
-
-        if not stats:
+        index = self._get_index()
+        if not index:
             return None
 
-        stats.sort()
-        return os.path.basename(stats[0][2]), stats[0][1]
+        image_id = min(index, key=lambda i: index[i]['last_accessed'])
+        return image_id, index[image_id]['size']
 
     @contextmanager
     def open_for_write(self, image_id):
@@ -278,6 +315,7 @@ class Driver(base.Driver):
                       dict(incomplete_path=incomplete_path,
                            final_path=final_path))
             os.rename(incomplete_path, final_path)
+            self._index[image_id] = self._stat_entry(final_path)
 
             # Make sure that we "pop" the image from the queue...
             if self.is_queued(image_id):
@@ -311,6 +349,30 @@ class Driver(base.Driver):
             if os.path.exists(incomplete_path):
                 rollback('incomplete fetch')
 
+    def link_image(self, image_id, checksum):
+        """
+        Caches the image file for an image with supplied identifier
+        by linking it to the blob with the supplied checksum. As the
+        xattrs belong to the file rather than to its links, the image
+        shares the hit count of the other images linked to the blob.
+
+        :param image_id: Image ID
+        :param checksum: MD5 checksum of the image data
+
+        :retval True if the image file was linked, False otherwise
+        """
+        final_path = self.get_image_filepath(image_id)
+        if not self._link_blob(checksum, final_path):
+            return False
+        self._index[image_id] = self._stat_entry(final_path)
+
+        # Make sure that we "pop" the image from the queue...
+        if self.is_queued(image_id):
+            LOG.debug(_("Removing image '%s' from queue after "
+                        "caching it."), image_id)
+            os.unlink(self.get_image_filepath(image_id, 'queue'))
+        return True
+
     @contextmanager
     def open_for_read(self, image_id):
         """
@@ -322,8 +384,24 @@ class Driver(base.Driver):
         path = self.get_image_filepath(image_id)
         with open(path, 'rb') as cache_file:
             yield cache_file
+        self.record_hit(image_id)
+
+    def record_hit(self, image_id):
+        """
+        Count a hit on a cached image. Its access time is set as well, as
+        it does not move by itself when the image was not read from disk.
+
+        :param image_id: Image ID
+        """
         path = self.get_image_filepath(image_id)
         inc_xattr(path, 'hits', 1)
+        now = time.time()
+        os.utime(path, (now, os.path.getmtime(path)))
+
+        entry = self._index.get(image_id)
+        if entry is not None:
+            entry['hits'] += 1
+            entry['last_accessed'] = now
 
     def queue_image(self, image_id):
         """
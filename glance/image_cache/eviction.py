@@ -0,0 +1,339 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Eviction policies deciding which cached images are pruned first
+"""
+
+from glance.common import utils
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class Policy(object):
+
+    """
+    Chooses the cached images to prune in order to free up space.
+
+    Policies work from the records about cached images returned by a
+    cache driver's get_cached_images(), so that a whole prune run only
+    needs a single pass over the cache.
+
+    Policies that learn from earlier prunes return what they learnt from
+    get_state(), so that it can be saved between runs of the pruner and
+    given back to them with set_state().
+    """
+
+    name = None
+
+    def get_state(self):
+        """
+        Return the state the policy keeps between prunes, as a structure
+        that can be serialized to JSON, or None if it keeps none.
+        """
+        return None
+
+    def set_state(self, state):
+        """
+        Restore the state returned by get_state() in an earlier run.
+
+        :param state: State deserialized from JSON
+        """
+        pass
+
+    def select_victims(self, entries, bytes_to_free):
+        """
+        Return the cached images to prune, in the order they should be
+        pruned, so that at least bytes_to_free bytes are freed, or all of
+        them if the cache is not that large.
+
+        :param entries: Records about cached images, as returned by the
+                        cache driver's get_cached_images()
+        :param bytes_to_free: Number of bytes to free
+        :retval list of (image_id, size) tuples
+        """
+        victims = []
+        bytes_freed = 0
+        for entry in sorted(entries, key=self.priority):
+            if bytes_freed >= bytes_to_free:
+                break
+            victims.append((entry['image_id'], entry['size']))
+            bytes_freed += entry['size']
+        return victims
+
+    def priority(self, entry):
+        """
+        Return the sort key of a cached image, the image with the lowest
+        key being pruned first.
+
+        :param entry: Record about a cached image
+        """
+        raise NotImplementedError
+
+
+class LRUPolicy(Policy):
+
+    """Prunes the least recently accessed images first."""
+
+    name = 'lru'
+
+    def priority(self, entry):
+        return entry['last_accessed']
+
+
+class LFUPolicy(Policy):
+
+    """
+    Prunes the least frequently accessed images first, using the number
+    of cache hits of each image, and the least recently accessed of those
+    with as many hits.
+    """
+
+    name = 'lfu'
+
+    def priority(self, entry):
+        return entry['hits'], entry['last_accessed']
+
+
+class GDSFPolicy(Policy):
+
+    """
+    Greedy-Dual-Size-Frequency: prunes the images with the fewest hits
+    per byte first, so that a single large image is pruned before many
+    small images that are read as often.
+
+    Each image is given a priority of L + (hits + 1) / size when it is
+    first seen or has been read since the last prune, where L is the
+    priority of the last image pruned. L keeps rising, so images that
+    have not been read for a while age out even if they were popular.
+    """
+
+    name = 'gdsf'
+
+    def __init__(self):
+        self.inflation = 0.0
+        self.priorities = {}
+
+    def get_state(self):
+        return {'inflation': self.inflation,
+                'priorities': self.priorities}
+
+    def set_state(self, state):
+        self.inflation = state['inflation']
+        self.priorities = dict((image_id, (tuple(key), priority))
+                               for image_id, (key, priority)
+                               in state['priorities'].iteritems())
+
+    def select_victims(self, entries, bytes_to_free):
+        priorities = {}
+        for entry in entries:
+            key = (entry['hits'], entry['last_accessed'])
+            previous = self.priorities.get(entry['image_id'])
+            if previous is not None and previous[0] == key:
+                priority = previous[1]
+            else:
+                priority = (self.inflation +
+                            float(entry['hits'] + 1) / max(entry['size'], 1))
+            priorities[entry['image_id']] = (key, priority)
+        self.priorities = priorities
+
+        victims = super(GDSFPolicy, self).select_victims(entries,
+                                                         bytes_to_free)
+        for image_id, size in victims:
+            self.inflation = self.priorities.pop(image_id)[1]
+        return victims
+
+    def priority(self, entry):
+        return self.priorities[entry['image_id']][1], entry['last_accessed']
+
+
+class ARCPolicy(Policy):
+
+    """
+    Adaptive Replacement Cache: splits the cache between images that have
+    not been read from the cache since they were cached and images that
+    have, and prunes the least recently accessed images of whichever part
+    is over its target size.
+
+    The target size of the first part adapts to the workload: it grows
+    when an image pruned from that part is cached again, and shrinks when
+    an image pruned from the other part is, so the images pruned are
+    remembered from one prune to the next.
+    """
+
+    name = 'arc'
+
+    def __init__(self):
+        self.target = None
+        self.recent_ghosts = utils.OrderedDict()
+        self.frequent_ghosts = utils.OrderedDict()
+        self.promoted = set()
+
+    def get_state(self):
+        return {'target': self.target,
+                'recent_ghosts': self.recent_ghosts.items(),
+                'frequent_ghosts': self.frequent_ghosts.items(),
+                'promoted': sorted(self.promoted)}
+
+    def set_state(self, state):
+        self.target = state['target']
+        self.recent_ghosts = utils.OrderedDict()
+        for image_id, size in state['recent_ghosts']:
+            self.recent_ghosts[image_id] = size
+        self.frequent_ghosts = utils.OrderedDict()
+        for image_id, size in state['frequent_ghosts']:
+            self.frequent_ghosts[image_id] = size
+        self.promoted = set(state['promoted'])
+
+    def _adapt(self, entries, capacity):
+        recent_ghost_bytes = sum(self.recent_ghosts.values())
+        frequent_ghost_bytes = sum(self.frequent_ghosts.values())
+        for entry in entries:
+            image_id = entry['image_id']
+            size = entry['size']
+            if image_id in self.recent_ghosts:
+                ratio = (float(frequent_ghost_bytes) /
+                         max(recent_ghost_bytes, 1))
+                self.target = min(self.target + max(ratio, 1) * size,
+                                  capacity)
+                recent_ghost_bytes -= self.recent_ghosts.pop(image_id)
+                self.promoted.add(image_id)
+            elif image_id in self.frequent_ghosts:
+                ratio = (float(recent_ghost_bytes) /
+                         max(frequent_ghost_bytes, 1))
+                self.target = max(self.target - max(ratio, 1) * size, 0)
+                frequent_ghost_bytes -= self.frequent_ghosts.pop(image_id)
+                self.promoted.add(image_id)
+
+    def _remember(self, ghosts, image_id, size, capacity):
+        ghosts[image_id] = size
+        ghost_bytes = sum(ghosts.values())
+        while ghost_bytes > capacity and ghosts:
+            ghost_bytes -= ghosts.popitem(last=False)[1]
+
+    def select_victims(self, entries, bytes_to_free):
+        capacity = max(sum(e['size'] for e in entries) - bytes_to_free, 0)
+        if self.target is None:
+            self.target = capacity / 2
+        self._adapt(entries, capacity)
+
+        cached = set(e['image_id'] for e in entries)
+        self.promoted &= cached
+        recent = []
+        frequent = []
+        for entry in sorted(entries, key=self.priority):
+            if entry['hits'] or entry['image_id'] in self.promoted:
+                frequent.append(entry)
+            else:
+                recent.append(entry)
+        recent_bytes = sum(e['size'] for e in recent)
+
+        victims = []
+        bytes_freed = 0
+        recent.reverse()
+        frequent.reverse()
+        while bytes_freed < bytes_to_free and (recent or frequent):
+            if recent and (recent_bytes > self.target or not frequent):
+                entry = recent.pop()
+                recent_bytes -= entry['size']
+                ghosts = self.recent_ghosts
+            else:
+                entry = frequent.pop()
+                ghosts = self.frequent_ghosts
+            image_id = entry['image_id']
+            victims.append((image_id, entry['size']))
+            bytes_freed += entry['size']
+            self.promoted.discard(image_id)
+            self._remember(ghosts, image_id, entry['size'], capacity)
+        return victims
+
+    def priority(self, entry):
+        return entry['last_accessed']
+
+
+POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'gdsf': GDSFPolicy,
+    'arc': ARCPolicy,
+}
+
+
+def get_policy(name):
+    """
+    Return a new instance of the eviction policy with the given name,
+    falling back to LRU if there is no such policy.
+
+    :param name: One of the keys of POLICIES
+    """
+    try:
+        return POLICIES[name]()
+    except KeyError:
+        LOG.warn(_("Unknown image cache eviction policy '%s'. "
+                   "Defaulting to LRU."), name)
+        return LRUPolicy()
+
+
+def simulate(policy, trace, max_size):
+    """
+    Replay a trace of image reads against a simulated image cache using
+    the given eviction policy, and report how well it performed.
+
+    An image not in the cache is cached when it is read, and the cache
+    is pruned back to max_size after each image is added, as if the
+    pruner ran continuously.
+
+    :param policy: The eviction policy to simulate
+    :param trace: Iterable of (image_id, size) tuples, one for each read
+                  of an image in the order they happened
+    :param max_size: Maximum size of the simulated cache in bytes
+    :retval dict with the number of reads, hits, bytes read and bytes
+            read from the cache, and the hit and byte hit ratios
+    """
+    entries = {}
+    cache_size = 0
+    reads = hits = bytes_read = bytes_hit = 0
+    for clock, (image_id, size) in enumerate(trace):
+        reads += 1
+        bytes_read += size
+        entry = entries.get(image_id)
+        if entry is not None:
+            hits += 1
+            bytes_hit += size
+            entry['hits'] += 1
+            entry['last_accessed'] = clock
+            continue
+
+        entries[image_id] = {'image_id': image_id, 'hits': 0,
+                             'last_accessed': clock, 'size': size}
+        cache_size += size
+        if cache_size > max_size:
+            victims = policy.select_victims(entries.values(),
+                                            cache_size - max_size)
+            for victim_id, victim_size in victims:
+                del entries[victim_id]
+                cache_size -= victim_size
+
+    return {
+        'reads': reads,
+        'hits': hits,
+        'bytes_read': bytes_read,
+        'bytes_hit': bytes_hit,
+        'hit_ratio': float(hits) / reads if reads else 0.0,
+        'byte_hit_ratio': float(bytes_hit) / bytes_read if bytes_read else 0.0,
+    }
@@ -0,0 +1,162 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process memory tier in front of the on-disk image cache
+"""
+
+from glance.common import utils
+
+
+class MemoryCache(object):
+
+    """
+    LRU cache holding the data of small, frequently read cached images in
+    memory, max_size bytes of image data in all.
+
+    An image is promoted into memory once it has been read promote_hits
+    times from the on-disk cache, provided it is no larger than
+    max_image_size bytes.
+
+    Images are held along with the identity of the cached image file they
+    were read from, so that an image deleted or cached again on disk by
+    another process is not served from memory any more.
+    """
+
+    def __init__(self, max_size, max_image_size, promote_hits):
+        self.max_size = max_size
+        self.max_image_size = max_image_size
+        self.promote_hits = promote_hits
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.promotions = 0
+        self.evictions = 0
+        self._images = utils.OrderedDict()
+        self._image_hits = {}
+        self._disk_reads = {}
+
+    def __contains__(self, image_id):
+        return image_id in self._images
+
+    def get(self, image_id, identity):
+        """
+        Returns the data of an image held in memory, or None if the image
+        is not held in memory. An image held for a cached image file of
+        another identity than the given one is dropped from memory.
+
+        :param image_id: Image ID
+        :param identity: Identity of the cached image file on disk
+        """
+        entry = self._images.pop(image_id, None)
+        if entry is not None and entry[1] != identity:
+            self.size -= len(entry[0])
+            self._image_hits.pop(image_id, None)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Re-insert the image as the most recently used one
+        self._images[image_id] = entry
+        self.hits += 1
+        self._image_hits[image_id] = self._image_hits.get(image_id, 0) + 1
+        return entry[0]
+
+    def get_image_size(self, image_id):
+        """
+        Returns the size of an image held in memory, or None if the image
+        is not held in memory.
+        """
+        entry = self._images.get(image_id)
+        if entry is not None:
+            return len(entry[0])
+
+    def get_hit_count(self, image_id):
+        """Returns the number of times an image was read from memory."""
+        return self._image_hits.get(image_id, 0)
+
+    def should_promote(self, image_id, size):
+        """
+        Counts a read of an image from the on-disk cache, and returns True
+        if the image should now be promoted into memory.
+
+        :param image_id: Image ID
+        :param size: Size of the cached image file in bytes
+        """
+        if size > min(self.max_image_size, self.max_size):
+            return False
+
+        reads = self._disk_reads.get(image_id, 0) + 1
+        if reads < self.promote_hits:
+            self._disk_reads[image_id] = reads
+            return False
+
+        self._disk_reads.pop(image_id, None)
+        return True
+
+    def put(self, image_id, data, identity):
+        """
+        Holds the data of an image in memory, evicting the least recently
+        used images if needed to keep within max_size bytes.
+
+        :param image_id: Image ID
+        :param data: Data of the image
+        :param identity: Identity of the cached image file the data was
+                         read from
+        """
+        if len(data) > self.max_size:
+            return
+
+        self.delete(image_id, forget_hits=False)
+        while self._images and self.size + len(data) > self.max_size:
+            _evicted_id, evicted = self._images.popitem(last=False)
+            self.size -= len(evicted[0])
+            self.evictions += 1
+
+        self._images[image_id] = (data, identity)
+        self.size += len(data)
+        self.promotions += 1
+
+    def delete(self, image_id, forget_hits=True):
+        """Removes an image from memory."""
+        entry = self._images.pop(image_id, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+        if forget_hits:
+            self._image_hits.pop(image_id, None)
+            self._disk_reads.pop(image_id, None)
+
+    def clear(self):
+        """Removes all images from memory."""
+        self._images.clear()
+        self._image_hits.clear()
+        self._disk_reads.clear()
+        self.size = 0
+
+    def get_stats(self):
+        """
+        Returns a dict of the number of hits, misses, promotions and
+        evictions of the memory tier, and of the number of images and
+        bytes of image data it holds.
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'promotions': self.promotions,
+                'evictions': self.evictions,
+                'images': len(self._images),
+                'size': self.size}
@@ -53,6 +53,9 @@ class Prefetcher(base.CacheApp):
             LOG.warn(_("No metadata found for image '%s'"), image_id)
             return False
 
+        if self.cache.link_image(image_id, image_meta['checksum']):
+            return True
+
         location = image_meta['location']
         image_data, image_size = glance.store.get_from_backend(ctx, location)
         LOG.debug(_("Caching image '%s'"), image_id)
@@ -21,13 +21,19 @@ import uuid
 
 from glance.common import exception
 import glance.domain
+from glance.notifier import outbox
 from glance.openstack.common import cfg
 from glance.openstack.common import importutils
 import glance.openstack.common.log as logging
 from glance.openstack.common import timeutils
 
 notifier_opts = [
-    cfg.StrOpt('notifier_strategy', default='default')
+    cfg.StrOpt('notifier_strategy', default='default'),
+    cfg.BoolOpt('notifier_async', default=False),
+    cfg.IntOpt('notifier_outbox_size', default=1000),
+    cfg.StrOpt('notifier_outbox_overflow', default='drop_oldest'),
+    cfg.IntOpt('notifier_batch_size', default=50),
+    cfg.StrOpt('notifier_journal_path', default=None),
 ]
 
 CONF = cfg.CONF
@@ -43,6 +49,56 @@ _STRATEGY_ALIASES = {
     "default": "glance.notifier.notify_noop.NoopStrategy",
 }
 
+_LISTENERS = []
+
+# Outboxes shared by the notifiers of this process, by strategy class
+_OUTBOXES = {}
+
+
+def add_listener(listener):
+    """
+    Registers a callable to be passed every notification message that
+    this process sends, whatever the notification strategy.
+    """
+    if listener not in _LISTENERS:
+        _LISTENERS.append(listener)
+
+
+def remove_listener(listener):
+    """Unregisters a callable registered with add_listener()."""
+    if listener in _LISTENERS:
+        _LISTENERS.remove(listener)
+
+
+def _get_outbox(strategy_class):
+    try:
+        return _OUTBOXES[strategy_class]
+    except KeyError:
+        _OUTBOXES[strategy_class] = outbox.Outbox(
+                strategy_class,
+                max_size=CONF.notifier_outbox_size,
+                overflow=CONF.notifier_outbox_overflow,
+                batch_size=CONF.notifier_batch_size,
+                journal_path=CONF.notifier_journal_path)
+        return _OUTBOXES[strategy_class]
+
+
+def get_outbox_stats():
+    """
+    Returns a dict of the delivery counters of each notification outbox
+    of this process, by strategy class name.
+    """
+    return dict(('%s.%s' % (cls.__module__, cls.__name__), o.get_stats())
+                for cls, o in _OUTBOXES.items())
+
+
+def _notify_listeners(msg):
+    for listener in _LISTENERS:
+        try:
+            listener(msg)
+        except Exception:
+            LOG.exception(_("Notification listener %s failed") % listener)
+
 
 class Notifier(object):
     """Uses a notification strategy to send out messages about events."""
@@ -61,7 +117,14 @@ class Notifier(object):
             strategy_class = importutils.import_class(strategy)
         except ImportError:
             raise exception.InvalidNotifierStrategy(strategy=strategy)
+
+        if CONF.notifier_async:
+            # Messages are queued, and the strategy used to send them is
+            # created by the outbox's delivery thread
+            self.outbox = _get_outbox(strategy_class)
+            self.strategy = None
         else:
+            self.outbox = None
             self.strategy = strategy_class()
 
     @staticmethod
@@ -77,15 +140,27 @@ class Notifier(object):
 
     def warn(self, event_type, payload):
         msg = self.generate_message(event_type, "WARN", payload)
-        self.strategy.warn(msg)
+        _notify_listeners(msg)
+        if self.outbox is not None:
+            self.outbox.put(msg)
+        else:
+            self.strategy.warn(msg)
 
     def info(self, event_type, payload):
         msg = self.generate_message(event_type, "INFO", payload)
-        self.strategy.info(msg)
+        _notify_listeners(msg)
+        if self.outbox is not None:
+            self.outbox.put(msg)
+        else:
+            self.strategy.info(msg)
 
     def error(self, event_type, payload):
         msg = self.generate_message(event_type, "ERROR", payload)
-        self.strategy.error(msg)
+        _notify_listeners(msg)
+        if self.outbox is not None:
+            self.outbox.put(msg)
+        else:
+            self.strategy.error(msg)
 
 
 def format_image_notification(image):
@@ -15,8 +15,8 @@
 
 
 import json
-import time
 
+import eventlet
 import kombu.connection
 import kombu.entity
 
@@ -163,7 +163,9 @@ class RabbitStrategy(strategy.Strategy):
             LOG.exception(_('AMQP server on %(hostname)s:%(port)d is'
                             ' unreachable: %(err_str)s. Trying again in '
                             '%(sleep_time)d seconds.') % log_info)
-            time.sleep(sleep_time)
+            # NOTE: time is not monkey patched in the API server, and a
+            # blocking sleep would stall every request in the process
+            eventlet.sleep(sleep_time)
 
     def log_failure(self, msg, priority):
         """Fallback to logging when we can't send to rabbit."""
@@ -179,21 +181,34 @@ class RabbitStrategy(strategy.Strategy):
 
     def _notify(self, msg, priority):
         """Send a notification and retry if needed."""
+        msg = dict(msg, priority=priority)
+        self.notify_batch([msg])
+
+    def notify_batch(self, messages):
+        """
+        Send several notifications over the same channel, reconnecting
+        and retrying if needed.
+
+        :retval the number of messages sent
+        """
         self.retry_attempts = 0
 
         if not self.connection:
             try:
                 self.reconnect()
             except KombuMaxRetriesReached:
-                self.log_failure(msg, priority)
-                return
-
-        routing_key = "%s.%s" % (self.topic, priority.lower())
-
-        while True:
+                for msg in messages:
+                    self.log_failure(msg, msg['priority'])
+                return 0
+
+        sent = 0
+        while sent < len(messages):
+            msg = messages[sent]
+            routing_key = "%s.%s" % (self.topic, msg['priority'].lower())
             try:
                 self._send_message(msg, routing_key)
-                return
+                sent += 1
+                continue
             except self.connection_errors, e:
                 pass
             except Exception, e:
@@ -212,7 +227,10 @@ class RabbitStrategy(strategy.Strategy):
                 self.reconnect()
             except KombuMaxRetriesReached:
                 break
-        self.log_failure(msg, priority)
+
+        for msg in messages[sent:]:
+            self.log_failure(msg, msg['priority'])
+        return sent
 
     def warn(self, msg):
         self._notify(msg, "WARN")
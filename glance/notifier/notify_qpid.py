@@ -141,3 +141,19 @@ class QpidStrategy(strategy.Strategy):
     def error(self, msg):
         qpid_msg = qpid.messaging.Message(content=msg)
         self.sender_error.send(qpid_msg)
+
+    def notify_batch(self, messages):
+        """
+        Send several notifications without waiting for each of them to
+        be acknowledged, then wait for the broker to acknowledge them all.
+
+        :retval the number of messages sent
+        """
+        senders = {'WARN': self.sender_warn,
+                   'INFO': self.sender_info,
+                   'ERROR': self.sender_error}
+        for msg in messages:
+            qpid_msg = qpid.messaging.Message(content=msg)
+            senders[msg['priority']].send(qpid_msg, sync=False)
+        self.session.sync()
+        return len(messages)
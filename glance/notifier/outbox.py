@@ -0,0 +1,325 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Asynchronous delivery of notifications through a bounded outbox
+"""
+
+import errno
+import json
+import os
+
+import eventlet
+import eventlet.queue
+
+from glance.common import exception
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'block')
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+class Outbox(object):
+
+    """
+    Bounded queue of notification messages, delivered in batches by a
+    green thread through a notification strategy, so that sending a
+    notification does not wait on the message broker.
+
+    When the outbox is full, the oldest queued message is dropped or the
+    sender waits for room, depending on the overflow policy. If a journal
+    path is given, messages are instead appended to the journal file and
+    delivered once the outbox has drained, including after a restart.
+
+    Each process has its own journal file, named after the journal path
+    and its pid, so that the workers of a server never read or rewrite
+    each other's journal.
+    """
+
+    def __init__(self, strategy_class, max_size=1000,
+                 overflow='drop_oldest', batch_size=50, journal_path=None):
+        """
+        :param strategy_class: class of the notification strategy through
+                               which messages are delivered. It is only
+                               instantiated by the delivery thread, as
+                               strategies may connect to the broker.
+        :param max_size: maximum number of messages held in memory
+        :param overflow: 'drop_oldest' or 'block'
+        :param batch_size: maximum number of messages delivered at once
+        :param journal_path: optional path of the files to which messages
+                             are spilled when the outbox is full, one
+                             per process
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise exception.InvalidNotifierOutboxOverflow(overflow=overflow)
+
+        self.strategy_class = strategy_class
+        self.strategy = None
+        self.max_size = max(1, max_size)
+        self.overflow = overflow
+        self.batch_size = max(1, batch_size)
+        self.journal_path = journal_path
+        self.journal_file = None
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.journaled = 0
+
+        self._queue = eventlet.queue.LightQueue(self.max_size)
+        self._in_flight = 0
+        self._journal_size = 0
+        self._worker = None
+        self._pid = None
+
+    def start(self):
+        """
+        Starts the delivery thread of this process, if it is not already
+        running, and queues the messages left in the journal for it.
+
+        This is done by the first put() of each process rather than when
+        the outbox is created, so that a server forking several workers
+        after loading its application replays the journal from a worker
+        rather than from a thread the fork left behind.
+        """
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        parent_pid = self._pid
+        self._pid = os.getpid()
+
+        self._journal_size = 0
+        if self.journal_path:
+            self.journal_file = '%s.%d' % (self.journal_path, self._pid)
+            self._claim_journals(parent_pid)
+        if self.journal_file and os.path.exists(self.journal_file):
+            try:
+                with open(self.journal_file) as journal:
+                    self._journal_size = sum(1 for line in journal)
+            except IOError, e:
+                LOG.error(_("Unable to read the notification journal "
+                            "%(path)s: %(e)s") %
+                          {'path': self.journal_file, 'e': e})
+            if self._journal_size:
+                LOG.info(_("Delivering %(count)d notifications left in "
+                           "%(path)s") % {'count': self._journal_size,
+                                          'path': self.journal_file})
+        self._worker = eventlet.spawn(self._run)
+
+    def _claim_journals(self, parent_pid):
+        """
+        Moves to the journal of this process the messages left in the
+        journals of processes that have exited, in the journal of the
+        process this one was forked from, and in a journal written to the
+        journal path itself.
+
+        :param parent_pid: pid of the process this one was forked from
+                           after starting the outbox, if any
+        """
+        dirname, basename = os.path.split(self.journal_path)
+        try:
+            names = os.listdir(dirname or os.curdir)
+        except OSError, e:
+            LOG.error(_("Unable to list the notification journals "
+                        "%(path)s.*: %(e)s") % {'path': self.journal_path,
+                                                'e': e})
+            return
+
+        for name in sorted(names):
+            if name != basename:
+                if not name.startswith(basename + '.'):
+                    continue
+                # Either the journal of a process, or one it was claiming
+                suffix = name[len(basename) + 1:].split('.')
+                if (not suffix[0].isdigit() or
+                        suffix[1:] not in ([], ['claimed'])):
+                    continue
+                pid = int(suffix[0])
+                if pid == self._pid:
+                    continue
+                if pid != parent_pid and _process_exists(pid):
+                    continue
+            self._claim_journal(os.path.join(dirname, name))
+
+    def _claim_journal(self, path):
+        # Renamed first, so that no other process claims it as well
+        claimed_path = self.journal_file + '.claimed'
+        try:
+            os.rename(path, claimed_path)
+        except OSError:
+            return
+
+        try:
+            with open(claimed_path) as claimed:
+                lines = claimed.readlines()
+            with open(self.journal_file, 'a') as journal:
+                journal.writelines(lines)
+            os.unlink(claimed_path)
+        except (IOError, OSError), e:
+            LOG.error(_("Unable to claim the notification journal "
+                        "%(path)s: %(e)s") % {'path': path, 'e': e})
+            return
+        LOG.info(_("Claimed %(count)d notifications left in %(path)s") %
+                 {'count': len(lines), 'path': path})
+
+    def put(self, msg):
+        """Queues a notification message for delivery."""
+        self.start()
+
+        if self.journal_path and (self._journal_size or self._queue.full()):
+            # Messages already waiting in the journal go first
+            self._write_journal(msg)
+            return
+
+        if self.overflow == 'block':
+            self._queue.put(msg)
+            return
+
+        try:
+            self._queue.put_nowait(msg)
+        except eventlet.queue.Full:
+            try:
+                dropped = self._queue.get_nowait()
+            except eventlet.queue.Empty:
+                pass
+            else:
+                self.dropped += 1
+                LOG.warn(_("Notification outbox full, dropped notification "
+                           "%s") % dropped.get('message_id'))
+            self._queue.put_nowait(msg)
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued message has been delivered, or failed
+        to be, for at most timeout seconds.
+
+        :retval True if the outbox was emptied
+        """
+        try:
+            with eventlet.Timeout(timeout):
+                while (self._queue.qsize() or self._journal_size or
+                       self._in_flight):
+                    eventlet.sleep(0.01)
+        except eventlet.Timeout:
+            return False
+        return True
+
+    def get_stats(self):
+        """
+        Returns a dict of the number of messages waiting in the outbox and
+        of the messages sent, failed, dropped and journaled so far.
+        """
+        return {'queued': self._queue.qsize() + self._journal_size,
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'journaled': self.journaled}
+
+    def _run(self):
+        while True:
+            if self._journal_size and self._queue.empty():
+                self._load_journal()
+
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except eventlet.queue.Empty:
+                    break
+
+            self._in_flight = len(batch)
+            try:
+                self._deliver(batch)
+            finally:
+                self._in_flight = 0
+
+    def _deliver(self, batch):
+        try:
+            if self.strategy is None:
+                self.strategy = self.strategy_class()
+            sent = self.strategy.notify_batch(batch)
+        except Exception:
+            LOG.exception(_("Failed to deliver %d notifications") %
+                          len(batch))
+            sent = 0
+        self.sent += sent
+        self.failed += len(batch) - sent
+
+    def _write_journal(self, msg):
+        try:
+            with open(self.journal_file, 'a') as journal:
+                journal.write(json.dumps(msg) + '\n')
+        except IOError, e:
+            self.dropped += 1
+            LOG.error(_("Unable to write notification %(id)s to the "
+                        "journal %(path)s: %(e)s") %
+                      {'id': msg.get('message_id'),
+                       'path': self.journal_file, 'e': e})
+            return
+        self._journal_size += 1
+        self.journaled += 1
+
+    def _load_journal(self):
+        """
+        Moves as many messages from the journal to the outbox as it can
+        hold, rewriting the journal with the rest.
+        """
+        try:
+            with open(self.journal_file) as journal:
+                lines = journal.readlines()
+        except IOError, e:
+            LOG.error(_("Unable to read the notification journal %(path)s: "
+                        "%(e)s") % {'path': self.journal_file, 'e': e})
+            self._journal_size = 0
+            return
+
+        count = min(len(lines), self.max_size)
+        remaining = lines[count:]
+        try:
+            if remaining:
+                with open(self.journal_file + '.tmp', 'w') as journal:
+                    journal.writelines(remaining)
+                os.rename(self.journal_file + '.tmp', self.journal_file)
+            else:
+                os.unlink(self.journal_file)
+        except (IOError, OSError), e:
+            # The messages are left in the journal rather than queued, so
+            # that they are not delivered twice. They are loaded again the
+            # next time the outbox overflows into the journal, or by the
+            # next process to start.
+            LOG.error(_("Unable to update the notification journal "
+                        "%(path)s: %(e)s") % {'path': self.journal_file,
+                                              'e': e})
+            self._journal_size = 0
+            return
+        self._journal_size = len(remaining)
+
+        for line in lines[:count]:
+            try:
+                self._queue.put_nowait(json.loads(line))
+            except ValueError:
+                self.failed += 1
+                LOG.error(_("Discarding corrupt notification journal "
+                            "entry: %r") % line)
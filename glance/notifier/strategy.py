@@ -15,6 +15,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
 
 class Strategy(object):
     """Base class for a notification strategy"""
@@ -27,3 +31,21 @@ class Strategy(object):
 
     def error(self, msg):
         raise NotImplementedError()
+
+    def notify_batch(self, messages):
+        """
+        Send several messages, each according to its priority.
+
+        :param messages: list of notification messages
+        :retval the number of messages sent
+        """
+        sent = 0
+        for msg in messages:
+            try:
+                getattr(self, msg['priority'].lower())(msg)
+            except Exception:
+                LOG.exception(_("Unable to send notification %s") %
+                              msg.get('message_id'))
+            else:
+                sent += 1
+        return sent
@@ -21,9 +21,12 @@ Registry API
 
 import os
 
+from glance.common import client as base_client
 from glance.common import exception
+from glance import notifier
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
+from glance.registry import cache
 from glance.registry import client
 
 LOG = logging.getLogger(__name__)
@@ -38,7 +41,23 @@ registry_client_opts = [
     cfg.StrOpt('registry_client_cert_file'),
     cfg.StrOpt('registry_client_ca_file'),
     cfg.BoolOpt('registry_client_insecure', default=False),
+    cfg.IntOpt('registry_client_pool_size', default=10,
+               help=_("Maximum number of idle connections to the registry "
+                      "server kept open for reuse. 0 disables reuse")),
+    cfg.IntOpt('registry_client_pool_idle_timeout', default=60,
+               help=_("Seconds after which an idle connection to the "
+                      "registry server is closed instead of reused")),
     cfg.StrOpt('metadata_encryption_key', secret=True),
+    cfg.IntOpt('registry_metadata_cache_size', default=0,
+               help=_("Maximum number of image metadata lookups cached "
+                      "in-process. 0 disables the cache")),
+    cfg.IntOpt('registry_metadata_cache_ttl', default=10,
+               help=_("Seconds for which image metadata read from the "
+                      "registry may be served from the cache")),
+    cfg.BoolOpt('registry_metadata_cache_use_notifications', default=True,
+                help=_("Invalidate cached image metadata when this "
+                       "process sends an image.update or image.delete "
+                       "notification")),
 ]
 registry_client_ctx_opts = [
     cfg.StrOpt('admin_user', secret=True),
@@ -58,6 +77,8 @@ _CLIENT_CREDS = None
 _CLIENT_HOST = None
 _CLIENT_PORT = None
 _CLIENT_KWARGS = {}
+_CLIENT_POOL = None
+_METADATA_CACHE = None
 # AES key used to encrypt 'location' metadata
 _METADATA_ENCRYPTION_KEY = None
 
@@ -67,6 +88,7 @@ def configure_registry_client():
     Sets up a registry client for use in registry lookups
     """
     global _CLIENT_KWARGS, _CLIENT_HOST, _CLIENT_PORT, _METADATA_ENCRYPTION_KEY
+    global _CLIENT_POOL, _METADATA_CACHE
     try:
         host, port = CONF.registry_host, CONF.registry_port
     except cfg.ConfigFileValueError:
@@ -81,12 +103,31 @@ def configure_registry_client():
     _CLIENT_HOST = host
     _CLIENT_PORT = port
     _METADATA_ENCRYPTION_KEY = CONF.metadata_encryption_key
+
+    if _CLIENT_POOL:
+        _CLIENT_POOL.clear()
+    _CLIENT_POOL = None
+    if CONF.registry_client_pool_size > 0:
+        _CLIENT_POOL = base_client.ConnectionPool(
+            CONF.registry_client_pool_size,
+            CONF.registry_client_pool_idle_timeout)
+
+    _METADATA_CACHE = None
+    notifier.remove_listener(_invalidate_on_notification)
+    if CONF.registry_metadata_cache_size > 0:
+        _METADATA_CACHE = cache.MetadataCache(
+            CONF.registry_metadata_cache_size,
+            CONF.registry_metadata_cache_ttl)
+        if CONF.registry_metadata_cache_use_notifications:
+            notifier.add_listener(_invalidate_on_notification)
+
     _CLIENT_KWARGS = {
         'use_ssl': CONF.registry_client_protocol.lower() == 'https',
         'key_file': CONF.registry_client_key_file,
         'cert_file': CONF.registry_client_cert_file,
         'ca_file': CONF.registry_client_ca_file,
         'insecure': CONF.registry_client_insecure,
+        'connection_pool': _CLIENT_POOL,
     }
 
 
@@ -131,8 +172,49 @@ def get_images_detail(context, **kwargs):
 
 
 def get_image_metadata(context, image_id):
+    if _METADATA_CACHE is None:
+        c = get_registry_client(context)
+        return c.get_image(image_id)
+
+    # NOTE: which images are visible through the registry depends on
+    # whether the request is an admin one and on its owner
+    key = (image_id, context.is_admin, context.owner)
+    image_meta = _METADATA_CACHE.get(key)
+    if image_meta is None:
+        generation = _METADATA_CACHE.generation
+        c = get_registry_client(context)
+        image_meta = c.get_image(image_id)
+        _METADATA_CACHE.put(key, image_meta, generation)
+    return image_meta
+
+
+def get_images_metadata(context, image_ids):
     c = get_registry_client(context)
-    return c.get_image(image_id)
+    return c.get_images_by_ids(image_ids)
+
+
+def invalidate_image_metadata(image_id):
+    """Removes any cached metadata of an image."""
+    if _METADATA_CACHE is not None:
+        _METADATA_CACHE.invalidate(image_id)
+
+
+def get_metadata_cache_stats():
+    """
+    Returns a dict of the number of hits, misses and entries of the image
+    metadata cache, or None if the cache is disabled.
+    """
+    if _METADATA_CACHE is not None:
+        return _METADATA_CACHE.get_stats()
+
+
+def _invalidate_on_notification(message):
+    if message['event_type'] in ('image.update', 'image.delete'):
+        try:
+            image_id = message['payload']['id']
+        except (KeyError, TypeError):
+            return
+        invalidate_image_metadata(image_id)
 
 
 def add_image_metadata(context, image_meta):
@@ -145,13 +227,39 @@ def update_image_metadata(context, image_id, image_meta,
                           purge_props=False):
     LOG.debug(_("Updating image metadata for image %s..."), image_id)
     c = get_registry_client(context)
-    return c.update_image(image_id, image_meta, purge_props)
+    try:
+        return c.update_image(image_id, image_meta, purge_props)
+    finally:
+        invalidate_image_metadata(image_id)
 
 
 def delete_image_metadata(context, image_id):
     LOG.debug(_("Deleting image metadata for image %s..."), image_id)
     c = get_registry_client(context)
-    return c.delete_image(image_id)
+    try:
+        return c.delete_image(image_id)
+    finally:
+        invalidate_image_metadata(image_id)
+
+
+def update_images_metadata(context, image_ids, image_meta):
+    LOG.debug(_("Updating image metadata for %d images..."), len(image_ids))
+    c = get_registry_client(context)
+    try:
+        return c.update_images(image_ids, image_meta)
+    finally:
+        for image_id in image_ids:
+            invalidate_image_metadata(image_id)
+
+
+def delete_images_metadata(context, image_ids):
+    LOG.debug(_("Deleting image metadata for %d images..."), len(image_ids))
+    c = get_registry_client(context)
+    try:
+        return c.delete_images(image_ids)
+    finally:
+        for image_id in image_ids:
+            invalidate_image_metadata(image_id)
 
 
 def get_image_members(context, image_id):
@@ -166,14 +274,24 @@ def get_member_images(context, member_id):
 
 def replace_members(context, image_id, member_data):
     c = get_registry_client(context)
-    return c.replace_members(image_id, member_data)
+    try:
+        return c.replace_members(image_id, member_data)
+    finally:
+        # Membership changes which tenants can see the image
+        invalidate_image_metadata(image_id)
 
 
 def add_member(context, image_id, member_id, can_share=None):
     c = get_registry_client(context)
-    return c.add_member(image_id, member_id, can_share=can_share)
+    try:
+        return c.add_member(image_id, member_id, can_share=can_share)
+    finally:
+        invalidate_image_metadata(image_id)
 
 
 def delete_member(context, image_id, member_id):
     c = get_registry_client(context)
-    return c.delete_member(image_id, member_id)
+    try:
+        return c.delete_member(image_id, member_id)
+    finally:
+        invalidate_image_metadata(image_id)
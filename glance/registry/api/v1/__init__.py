@@ -29,6 +29,13 @@ class API(wsgi.Router):
         mapper = routes.Mapper()
 
         images_resource = images.create_resource()
+        # Batch routes must come before /images/{id} would match them
+        for action, method in (('batch_get', 'POST'),
+                               ('batch_update', 'PUT'),
+                               ('batch_delete', 'POST')):
+            mapper.connect("/images/%s" % action,
+                           controller=images_resource, action=action,
+                           conditions=dict(method=[method]))
         mapper.resource("image", "images", controller=images_resource,
                         collection={'detail': 'GET'})
         mapper.connect("/", controller=images_resource, action="index")
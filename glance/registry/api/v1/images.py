@@ -50,6 +50,8 @@ SUPPORTED_SORT_DIRS = ('asc', 'desc')
 
 SUPPORTED_PARAMS = ('limit', 'marker', 'sort_key', 'sort_dir')
 
+_IMAGE_ATTRS = tuple(glance.db.IMAGE_ATTRS)
+
 
 class Controller(object):
 
@@ -95,7 +97,8 @@ class Controller(object):
             }
         """
         params = self._get_query_params(req)
-        images = self._get_images(req.context, **params)
+        images = self._get_images(req.context,
+                                  columns=DISPLAY_FIELDS_IN_INDEX, **params)
 
         results = []
         for image in images:
@@ -420,26 +423,112 @@ class Controller(object):
                                    request=req,
                                    content_type='text/plain')
 
+    def _get_batch_ids(self, body):
+        """
+        Parse the image ids of a batch request body.
+
+        :param body: Dictionary holding a list of image ids under 'ids'
+        :raises HTTPBadRequest if the ids are missing, malformed or more
+                than api_limit_max
+        """
+        image_ids = body.get('ids')
+        if (not isinstance(image_ids, list) or
+                not all(isinstance(i, basestring) for i in image_ids)):
+            msg = _("Batch requests must hold a list of image ids")
+            raise exc.HTTPBadRequest(explanation=msg)
+        if len(image_ids) > CONF.api_limit_max:
+            msg = (_("Batch requests may not hold more than %d image ids") %
+                   CONF.api_limit_max)
+            raise exc.HTTPBadRequest(explanation=msg)
+        return image_ids
+
+    def batch_get(self, req, body):
+        """
+        Return data about the images with the given ids.
+
+        :param req: wsgi Request object
+        :param body: Dictionary holding a list of image ids under 'ids'
+
+        :retval Returns a mapping holding the list of images found under
+        'images'. Images that do not exist or are not visible are left out.
+        """
+        image_ids = self._get_batch_ids(body)
+        images = self.db_api.image_get_many(req.context, image_ids)
+        LOG.info(_("Successfully retrieved %(found)d of %(count)d images") %
+                 {'found': len(images), 'count': len(image_ids)})
+        return dict(images=[make_image_dict(i) for i in images])
+
+    @utils.mutating
+    def batch_update(self, req, body):
+        """
+        Updates the attributes of many existing images with the registry.
+
+        :param req: wsgi Request object
+        :param body: Dictionary holding a list of image ids under 'ids', and
+                     the attributes to set on them under 'image'
+
+        :retval Returns a mapping holding the list of updated images under
+        'images'. Images that do not exist or may not be modified are left
+        out.
+        """
+        image_ids = self._get_batch_ids(body)
+        image_data = body.get('image', {})
+
+        # Prohibit modification of 'owner'
+        if not req.context.is_admin and 'owner' in image_data:
+            del image_data['owner']
+
+        try:
+            images = self.db_api.image_update_many(req.context, image_ids,
+                                                   image_data)
+        except exception.Invalid, e:
+            msg = (_("Failed to update image metadata. "
+                     "Got error: %(e)s") % locals())
+            LOG.error(msg)
+            return exc.HTTPBadRequest(msg)
+
+        LOG.info(_("Updated metadata for %(updated)d of %(count)d images") %
+                 {'updated': len(images), 'count': len(image_ids)})
+        return dict(images=[make_image_dict(i) for i in images])
+
+    @utils.mutating
+    def batch_delete(self, req, body):
+        """
+        Deletes many existing images with the registry.
+
+        :param req: wsgi Request object
+        :param body: Dictionary holding a list of image ids under 'ids'
+
+        :retval Returns a mapping holding the list of deleted images under
+        'images'. Images that do not exist or may not be deleted are left
+        out.
+        """
+        image_ids = self._get_batch_ids(body)
+        images = self.db_api.image_destroy_many(req.context, image_ids)
+        LOG.info(_("Successfully deleted %(deleted)d of %(count)d images") %
+                 {'deleted': len(images), 'count': len(image_ids)})
+        return dict(images=[make_image_dict(i) for i in images])
+
 
 def make_image_dict(image):
     """
     Create a dict representation of an image which we can use to
     serialize the image.
     """
-
-    def _fetch_attrs(d, attrs):
-        return dict([(a, d[a]) for a in attrs
-                    if a in d.keys()])
-
-    # TODO(sirp): should this be a dict, or a list of dicts?
-    # A plain dict is more convenient, but list of dicts would provide
-    # access to created_at, etc
-    properties = dict((p['name'], p['value'])
-                      for p in image['properties'] if not p['deleted'])
-
-    image_dict = _fetch_attrs(image, glance.db.IMAGE_ATTRS)
-
-    image_dict['properties'] = properties
+    if isinstance(image, dict):
+        # Images from the simple db driver are plain dicts
+        values = image
+        prop_values = image['properties']
+    else:
+        # Read the loaded attributes of models straight from their
+        # __dict__, rather than one ModelBase.__getitem__ call at a time
+        values = image.__dict__
+        prop_values = [p.__dict__ for p in image.properties]
+
+    image_dict = dict([(attr, values[attr]) for attr in _IMAGE_ATTRS
+                       if attr in values])
+    image_dict['properties'] = dict([(p['name'], p['value'])
+                                     for p in prop_values if not p['deleted']])
     return image_dict
 
 
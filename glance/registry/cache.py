@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process cache of image metadata read from the registry
+"""
+
+import collections
+import copy
+import time
+
+from glance.common import utils
+
+
+class MetadataCache(object):
+
+    """
+    LRU cache of image metadata, holding at most max_size entries, each
+    of which expires ttl seconds after it was read from the registry.
+
+    Entries are keyed by tuples whose first element is the image id, so
+    that all the entries of an image can be invalidated at once.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation, so that metadata read from the
+        # registry before an invalidation is not cached after it
+        self.generation = 0
+        self._entries = utils.OrderedDict()
+        self._keys_by_image = collections.defaultdict(set)
+
+    def get(self, key):
+        """
+        Returns a copy of the cached metadata for key, or None if there
+        is none or it has expired.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            image_meta, expires = entry
+            if expires > time.time():
+                # Re-insert the entry as the most recently used one
+                self._entries[key] = entry
+                self.hits += 1
+                return copy.deepcopy(image_meta)
+            self._discard_key(key)
+
+        self.misses += 1
+        return None
+
+    def put(self, key, image_meta, generation):
+        """
+        Caches a copy of image metadata for key, unless the cache has
+        been invalidated since generation was read.
+        """
+        if generation != self.generation or self.max_size <= 0:
+            return
+
+        self._entries.pop(key, None)
+        self._entries[key] = (copy.deepcopy(image_meta),
+                              time.time() + self.ttl)
+        self._keys_by_image[key[0]].add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest_key, entry = self._entries.popitem(last=False)
+            self._discard_key(oldest_key)
+
+    def invalidate(self, image_id):
+        """Removes all cached metadata for an image."""
+        self.generation += 1
+        for key in self._keys_by_image.pop(image_id, ()):
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Removes all cached metadata."""
+        self.generation += 1
+        self._entries.clear()
+        self._keys_by_image.clear()
+
+    def get_stats(self):
+        """
+        Returns a dict of the number of hits, misses and entries of the
+        cache.
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries)}
+
+    def _discard_key(self, key):
+        keys = self._keys_by_image.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_image[key[0]]
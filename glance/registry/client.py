@@ -36,6 +36,10 @@ class RegistryClient(BaseClient):
 
     DEFAULT_PORT = 9191
 
+    # Number of images sent in each batch request, below the registry's
+    # default api_limit_max
+    BATCH_SIZE = 500
+
     def __init__(self, host=None, port=None, metadata_encryption_key=None,
                  **kwargs):
         """
@@ -178,6 +182,55 @@ class RegistryClient(BaseClient):
         image = data['image']
         return image
 
+    def _do_batch_request(self, method, action, image_ids, body=None):
+        """
+        Makes a batch request for each slice of at most BATCH_SIZE ids,
+        returning the images of all the responses.
+        """
+        headers = {
+            'Content-Type': 'application/json',
+        }
+
+        image_list = []
+        for i in xrange(0, len(image_ids), self.BATCH_SIZE):
+            batch = dict(body or {}, ids=image_ids[i:i + self.BATCH_SIZE])
+            res = self.do_request(method, action, body=json.dumps(batch),
+                                  headers=headers)
+            image_list.extend(json.loads(res.read())['images'])
+
+        for image in image_list:
+            image = self.decrypt_metadata(image)
+        return image_list
+
+    def get_images_by_ids(self, image_ids):
+        """
+        Returns a list of image metadata mappings from Registry for the
+        given image ids, leaving out images which are not found
+        """
+        return self._do_batch_request("POST", "/images/batch_get",
+                                      list(image_ids))
+
+    def update_images(self, image_ids, image_metadata):
+        """
+        Updates Registry's information about many images, returning the
+        images which were updated
+
+        :param image_metadata: mapping of image attributes, without
+                               properties
+        """
+        encrypted_metadata = self.encrypt_metadata(dict(image_metadata))
+        return self._do_batch_request("PUT", "/images/batch_update",
+                                      list(image_ids),
+                                      {'image': encrypted_metadata})
+
+    def delete_images(self, image_ids):
+        """
+        Deletes Registry's information about many images, returning the
+        images which were deleted
+        """
+        return self._do_batch_request("POST", "/images/batch_delete",
+                                      list(image_ids))
+
     def get_image_members(self, image_id):
         """Returns a list of membership associations from Registry"""
         res = self.do_request("GET", "/images/%s/members" % image_id)
@@ -26,23 +26,48 @@ class Schema(object):
             properties = {}
         self.properties = properties
         self.links = links
+        self._validator = None
+
+    def _get_validator(self):
+        """
+        Returns a validator for the schema, checking the schema itself and
+        building the validator only the first time it is needed, rather
+        than for every object validated.
+        """
+        if self._validator is None:
+            raw = self.raw()
+            jsonschema.Draft3Validator.check_schema(raw)
+            self._validator = jsonschema.Draft3Validator(raw)
+        return self._validator
 
     def validate(self, obj):
         try:
-            jsonschema.validate(obj, self.raw())
+            self._get_validator().validate(obj)
         except jsonschema.ValidationError as e:
             raise exception.InvalidObject(schema=self.name, reason=str(e))
 
-    def filter(self, obj):
-        filtered = {}
-        for key, value in obj.iteritems():
-            if self._filter_func(self.properties, key) and value is not None:
-                filtered[key] = value
-        return filtered
+    def validate_many(self, objs):
+        """
+        Validates each of a list of objects against the schema.
+
+        :param objs: list of objects, in which None entries are skipped
+        :raises InvalidObject naming the first invalid object by its index
+        """
+        validator = self._get_validator()
+        for index, obj in enumerate(objs):
+            if obj is None:
+                continue
+            try:
+                validator.validate(obj)
+            except jsonschema.ValidationError as e:
+                reason = _("object %(index)d: %(e)s") % locals()
+                raise exception.InvalidObject(schema=self.name,
+                                              reason=reason)
 
-    @staticmethod
-    def _filter_func(properties, key):
-        return key in properties
+    def filter(self, obj):
+        properties = self.properties
+        return dict((key, value) for key, value in obj.iteritems()
+                    if key in properties and value is not None)
 
     def merge_properties(self, properties):
         # Ensure custom props aren't attempting to override base props
@@ -58,6 +83,7 @@ class Schema(object):
             raise exception.SchemaLoadError(reason=reason % {'props': props})
 
         self.properties.update(properties)
+        self._validator = None
 
     def raw(self):
         raw = {
@@ -71,9 +97,9 @@ class Schema(object):
 
 
 class PermissiveSchema(Schema):
-    @staticmethod
-    def _filter_func(properties, key):
-        return True
+    def filter(self, obj):
+        return dict((key, value) for key, value in obj.iteritems()
+                    if value is not None)
 
     def raw(self):
         raw = super(PermissiveSchema, self).raw()
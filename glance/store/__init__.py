@@ -15,10 +15,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import os
 import sys
 import time
 
+import eventlet
+
 from glance.common import exception
 from glance.common import utils
 import glance.context
@@ -125,6 +128,81 @@ class Indexable(object):
         return self.size
 
 
+class ParallelRangeReader(object):
+
+    """
+    Iterator over the data of a stored object of known size that reads
+    up to `concurrency` consecutive byte ranges of the object at once,
+    each in its own green thread, and yields their data in order.
+
+    Ranges that arrive early wait in a queue until the ranges before
+    them have been yielded. A new range is only requested once the
+    oldest one has been taken off that queue, so no more than about
+    (concurrency + 1) * range_size bytes are held at any time.
+    """
+
+    CHUNKSIZE = 65536
+
+    def __init__(self, read_range, size, range_size, concurrency):
+        """
+        Initialize the object
+
+        :param read_range: callable taking an offset and a length and
+                           returning the data of that byte range of the
+                           object as a string
+        :param size: the size of the object
+        :param range_size: the size of each byte range to read
+        :param concurrency: the number of ranges to read at once
+        """
+        self.read_range = read_range
+        self.size = size
+        self.range_size = range_size
+        self.concurrency = max(concurrency, 1)
+        self._iter = self._read()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self._iter.next()
+
+    def close(self):
+        """Stop reading, abandoning any ranges still being read"""
+        self._iter.close()
+
+    def _read(self):
+        offsets = iter(xrange(0, self.size, self.range_size))
+        pending = collections.deque()
+
+        def read_next_range():
+            for offset in offsets:
+                length = min(self.range_size, self.size - offset)
+                thread = eventlet.spawn(self.read_range, offset, length)
+                pending.append((offset, length, thread))
+                break
+
+        try:
+            for i in xrange(self.concurrency):
+                read_next_range()
+
+            while pending:
+                offset, length, thread = pending.popleft()
+                data = thread.wait()
+                if len(data) != length:
+                    msg = (_("Expected %(length)d bytes at offset "
+                             "%(offset)d but got %(got)d") %
+                           {'length': length, 'offset': offset,
+                            'got': len(data)})
+                    raise BackendException(msg)
+                read_next_range()
+
+                for start in xrange(0, length, self.CHUNKSIZE):
+                    yield data[start:start + self.CHUNKSIZE]
+        finally:
+            for offset, length, thread in pending:
+                thread.kill()
+
+
 def _get_store_class(store_entry):
     store_cls = None
     try:
@@ -217,6 +295,18 @@ def get_from_backend(context, uri, **kwargs):
     return store.get(loc)
 
 
+def get_range_from_backend(context, uri, offset, length=None):
+    """
+    Yields chunks of the byte range [offset, offset + length) of the
+    image data stored in the backend specified by uri
+    """
+
+    store = get_store_from_uri(context, uri)
+    loc = location.get_location_from_uri(uri)
+
+    return store.get_range(loc, offset, length)
+
+
 def get_size_from_backend(context, uri):
     """Retrieves image size from backend specified by uri"""
 
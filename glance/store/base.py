@@ -19,6 +19,7 @@
 """Base class for all storage backends"""
 
 from glance.common import exception
+from glance.common import utils
 from glance.openstack.common import importutils
 import glance.openstack.common.log as logging
 
@@ -91,6 +92,34 @@ class Store(object):
         """
         raise NotImplementedError
 
+    def get_range(self, location, offset, length=None):
+        """
+        Takes a `glance.store.location.Location` object that indicates
+        where to find the image file, and returns a tuple of generator
+        (for reading `length` bytes of the image file starting at byte
+        `offset`) and the number of bytes the generator will yield
+
+        Stores that can read from an arbitrary offset should override
+        this method; the default implementation reads the image from the
+        start and discards the data before `offset`.
+
+        :param location `glance.store.location.Location` object, supplied
+                        from glance.store.location.get_location_from_uri()
+        :param offset: first byte of the image file to return
+        :param length: number of bytes to return, or None to read until
+                       the end of the image file
+        :raises `glance.exception.NotFound` if image does not exist
+        """
+        image_iter, image_size = self.get(location)
+        if image_size:
+            image_size = int(image_size)
+            range_size = image_size - offset
+            if length is not None:
+                range_size = min(length, range_size)
+        else:
+            range_size = length
+        return (utils.chunkslice(image_iter, offset, length), range_size)
+
     def get_size(self, location):
         """
         Takes a `glance.store.location.Location` object that indicates
@@ -68,7 +68,7 @@ class StoreLocation(glance.store.location.StoreLocation):
         self.path = path
 
 
-class ChunkedFile(object):
+class ChunkedFile(utils.FileWrapper):
 
     """
     We send this back to the Glance API server as
@@ -77,27 +77,10 @@ class ChunkedFile(object):
 
     CHUNKSIZE = 65536
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, offset=0, length=None):
         self.filepath = filepath
-        self.fp = open(self.filepath, 'rb')
-
-    def __iter__(self):
-        """Return an iterator over the image file"""
-        try:
-            while True:
-                chunk = self.fp.read(ChunkedFile.CHUNKSIZE)
-                if chunk:
-                    yield chunk
-                else:
-                    break
-        finally:
-            self.close()
-
-    def close(self):
-        """Close the internal file pointer"""
-        if self.fp:
-            self.fp.close()
-            self.fp = None
+        super(ChunkedFile, self).__init__(lambda: open(filepath, 'rb'),
+                                          offset, length)
 
 
 class Store(glance.store.base.Store):
@@ -160,7 +143,30 @@ class Store(glance.store.base.Store):
         filepath, filesize = self._resolve_location(location)
         msg = _("Found image at %s. Returning in ChunkedFile.") % filepath
         LOG.debug(msg)
-        return (ChunkedFile(filepath), filesize)
+        return (ChunkedFile(filepath, length=filesize), filesize)
+
+    def get_range(self, location, offset, length=None):
+        """
+        Takes a `glance.store.location.Location` object that indicates
+        where to find the image file, and returns a tuple of generator
+        (for reading `length` bytes of the image file starting at byte
+        `offset`) and the number of bytes the generator will yield
+
+        :param location `glance.store.location.Location` object, supplied
+                        from glance.store.location.get_location_from_uri()
+        :param offset: first byte of the image file to return
+        :param length: number of bytes to return, or None to read until
+                       the end of the image file
+        :raises `glance.exception.NotFound` if image does not exist
+        """
+        filepath, filesize = self._resolve_location(location)
+        range_size = max(filesize - offset, 0)
+        if length is not None:
+            range_size = min(length, range_size)
+        msg = _("Found image at %s. Returning bytes %d-%d in "
+                "ChunkedFile.") % (filepath, offset, offset + range_size - 1)
+        LOG.debug(msg)
+        return (ChunkedFile(filepath, offset, range_size), range_size)
 
     def get_size(self, location):
         """
@@ -19,6 +19,7 @@ import httplib
 import urlparse
 
 from glance.common import exception
+from glance.common import utils
 import glance.openstack.common.log as logging
 import glance.store.base
 import glance.store.location
@@ -134,6 +135,36 @@ class Store(glance.store.base.Store):
 
         return (ResponseIndexable(iterator, content_length), content_length)
 
+    def get_range(self, location, offset, length=None):
+        """
+        Takes a `glance.store.location.Location` object that indicates
+        where to find the image file, and returns a tuple of generator
+        (for reading `length` bytes of the image file starting at byte
+        `offset`) and the number of bytes the generator will yield
+
+        :param location `glance.store.location.Location` object, supplied
+                        from glance.store.location.get_location_from_uri()
+        :param offset: first byte of the image file to return
+        :param length: number of bytes to return, or None to read until
+                       the end of the image file
+        """
+        if length is None:
+            byte_range = 'bytes=%d-' % offset
+        else:
+            byte_range = 'bytes=%d-%d' % (offset, offset + length - 1)
+        conn, resp, content_length = self._query(location, 'GET',
+                                                 headers={'Range': byte_range})
+
+        iterator = http_response_iterator(conn, resp, self.CHUNKSIZE)
+        if resp.status != httplib.PARTIAL_CONTENT:
+            # The remote server ignored the Range header and is sending
+            # the whole image, so skip the bytes we were not asked for
+            iterator = utils.chunkslice(iterator, offset, length)
+            content_length = max(content_length - offset, 0)
+            if length is not None:
+                content_length = min(length, content_length)
+        return (iterator, content_length)
+
     def get_schemes(self):
         return ('http', 'https')
 
@@ -150,13 +181,13 @@ class Store(glance.store.base.Store):
         except Exception:
             return 0
 
-    def _query(self, location, verb, depth=0):
+    def _query(self, location, verb, depth=0, headers=None):
         if depth > MAX_REDIRECTS:
             raise exception.MaxRedirectsExceeded(redirects=MAX_REDIRECTS)
         loc = location.store_location
         conn_class = self._get_conn_class(loc)
         conn = conn_class(loc.netloc)
-        conn.request(verb, loc.path, "", {})
+        conn.request(verb, loc.path, "", headers or {})
         resp = conn.getresponse()
 
         # Check for bad status codes
@@ -176,7 +207,7 @@ class Store(glance.store.base.Store):
                                      uri=location_header,
                                      image_id=location.image_id,
                                      store_specs=location.store_specs)
-            return self._query(new_loc, verb, depth + 1)
+            return self._query(new_loc, verb, depth + 1, headers)
         content_length = int(resp.getheader('content-length', 0))
         return (conn, resp, content_length)
 
@@ -123,12 +123,14 @@ class ImageIterator(object):
     Reads data from an RBD image, one chunk at a time.
     """
 
-    def __init__(self, name, store):
+    def __init__(self, name, store, offset=0, length=None):
         self.name = name
         self.pool = store.pool
         self.user = store.user
         self.conf_file = store.conf_file
         self.chunk_size = store.chunk_size
+        self.offset = offset
+        self.length = length
 
     def __iter__(self):
         try:
@@ -138,7 +140,9 @@ class ImageIterator(object):
                     with rbd.Image(ioctx, self.name) as image:
                         img_info = image.stat()
                         size = img_info['size']
-                        bytes_left = size
+                        if self.length is not None:
+                            size = min(size, self.offset + self.length)
+                        bytes_left = size - self.offset
                         while bytes_left > 0:
                             length = min(self.chunk_size, bytes_left)
                             data = image.read(size - bytes_left, length)
@@ -192,6 +196,22 @@ class Store(glance.store.base.Store):
         loc = location.store_location
         return (ImageIterator(str(loc.image), self), None)
 
+    def get_range(self, location, offset, length=None):
+        """
+        Takes a `glance.store.location.Location` object that indicates
+        where to find the image file, and returns a generator for reading
+        `length` bytes of the image file starting at byte `offset`
+
+        :param location `glance.store.location.Location` object, supplied
+                        from glance.store.location.get_location_from_uri()
+        :param offset: first byte of the image file to return
+        :param length: number of bytes to return, or None to read until
+                       the end of the image file
+        :raises `glance.exception.NotFound` if image does not exist
+        """
+        loc = location.store_location
+        return (ImageIterator(str(loc.image), self, offset, length), length)
+
     def _create_image(self, fsid, ioctx, name, size, order):
         """
         Create an rbd image. If librbd supports it,
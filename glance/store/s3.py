@@ -20,9 +20,12 @@
 import hashlib
 import httplib
 import re
+import StringIO
 import tempfile
 import urlparse
 
+import eventlet
+
 from glance.common import exception
 from glance.common import utils
 from glance.openstack.common import cfg
@@ -41,8 +44,27 @@ s3_opts = [
     cfg.StrOpt('s3_store_object_buffer_dir'),
     cfg.BoolOpt('s3_store_create_bucket_on_put', default=False),
     cfg.StrOpt('s3_store_bucket_url_format', default='subdomain'),
+    cfg.IntOpt('s3_store_large_object_size', default=100,
+               help=_("Images of at least this size in MB, or of unknown "
+                      "size, are streamed to S3 as a multipart upload "
+                      "instead of being buffered in a temporary file")),
+    cfg.IntOpt('s3_store_large_object_chunk_size', default=10,
+               help=_("Size in MB of each part of a multipart upload. "
+                      "S3 requires parts of at least 5 MB")),
+    cfg.IntOpt('s3_store_thread_pools', default=10,
+               help=_("Number of parts of a multipart upload that are "
+                      "uploaded concurrently")),
+    cfg.IntOpt('s3_store_read_ahead_concurrency', default=1,
+               help=_("Number of byte ranges of an image that are read "
+                      "from S3 concurrently when it is downloaded. "
+                      "1 reads the image with a single request")),
+    cfg.IntOpt('s3_store_read_ahead_chunk_size', default=16,
+               help=_("Size in MB of each byte range read from S3 when "
+                      "s3_store_read_ahead_concurrency is more than 1")),
 ]
 
+MIN_PART_SIZE = 5 * 1024 * 1024
+
 CONF = cfg.CONF
 CONF.register_opts(s3_opts)
 
@@ -206,6 +228,11 @@ class Store(glance.store.base.Store):
     def get_schemes(self):
         return ('s3', 's3+http', 's3+https')
 
+    def configure(self):
+        self.read_ahead_concurrency = CONF.s3_store_read_ahead_concurrency
+        self.read_ahead_chunk_size = (CONF.s3_store_read_ahead_chunk_size *
+                                      1024 * 1024)
+
     def configure_add(self):
         """
         Configure the Store to use the stored configuration options
@@ -235,6 +262,12 @@ class Store(glance.store.base.Store):
 
         self.s3_store_object_buffer_dir = CONF.s3_store_object_buffer_dir
 
+        self.large_object_size = CONF.s3_store_large_object_size * 1024 * 1024
+        self.part_size = max(
+                CONF.s3_store_large_object_chunk_size * 1024 * 1024,
+                MIN_PART_SIZE)
+        self.thread_pools = max(CONF.s3_store_thread_pools, 1)
+
     def _option_get(self, param):
         result = getattr(CONF, param)
         if not result:
@@ -259,6 +292,21 @@ class Store(glance.store.base.Store):
 
         key.BufferSize = self.CHUNKSIZE
 
+        if (self.read_ahead_concurrency > 1 and
+                key.size > self.read_ahead_chunk_size):
+
+            class ReaderIndexable(glance.store.Indexable):
+                def another(self):
+                    try:
+                        return self.wrapped.next()
+                    except StopIteration:
+                        return ''
+
+            reader = glance.store.ParallelRangeReader(
+                self._range_reader(key), key.size,
+                self.read_ahead_chunk_size, self.read_ahead_concurrency)
+            return (ReaderIndexable(reader, key.size), key.size)
+
         class ChunkedIndexable(glance.store.Indexable):
             def another(self):
                 return (self.wrapped.fp.read(ChunkedFile.CHUNKSIZE)
@@ -266,6 +314,51 @@ class Store(glance.store.base.Store):
 
         return (ChunkedIndexable(ChunkedFile(key), key.size), key.size)
 
+    def _range_reader(self, key):
+        """
+        Returns a function that reads a byte range of the S3 object of
+        key, for use from several green threads at once.
+        """
+        def _read_range(offset, length):
+            # NOTE: An open key holds the response being read, so every
+            # range is read through a key of its own. boto hands each
+            # request a free connection from the S3 connection's pool.
+            range_key = key.bucket.key_class(key.bucket, key.name)
+            range_key.BufferSize = self.CHUNKSIZE
+            byte_range = 'bytes=%d-%d' % (offset, offset + length - 1)
+            range_key.open_read(headers={'Range': byte_range})
+            return ''.join(ChunkedFile(range_key))
+
+        return _read_range
+
+    def get_range(self, location, offset, length=None):
+        """
+        Takes a `glance.store.location.Location` object that indicates
+        where to find the image file, and returns a tuple of generator
+        (for reading `length` bytes of the image file starting at byte
+        `offset`) and the number of bytes the generator will yield
+
+        :param location `glance.store.location.Location` object, supplied
+                        from glance.store.location.get_location_from_uri()
+        :param offset: first byte of the image file to return
+        :param length: number of bytes to return, or None to read until
+                       the end of the image file
+        :raises `glance.exception.NotFound` if image does not exist
+        """
+        key = self._retrieve_key(location)
+
+        key.BufferSize = self.CHUNKSIZE
+
+        range_size = max(key.size - offset, 0)
+        if length is not None:
+            range_size = min(length, range_size)
+        if range_size == 0:
+            return (iter([]), 0)
+
+        byte_range = 'bytes=%d-%d' % (offset, offset + range_size - 1)
+        key.open_read(headers={'Range': byte_range})
+        return (ChunkedFile(key), range_size)
+
     def get_size(self, location):
         """
         Takes a `glance.store.location.Location` object that indicates
@@ -364,6 +457,14 @@ class Store(glance.store.base.Store):
                                          'obj_name': obj_name})
         LOG.debug(msg)
 
+        if not image_size or image_size >= self.large_object_size:
+            size, checksum_hex = self._add_multipart(bucket_obj, obj_name,
+                                                     image_file,
+                                                     _sanitize(loc.get_uri()))
+            LOG.debug(_("Wrote %(size)d bytes to S3 key named %(obj_name)s "
+                        "with checksum %(checksum_hex)s") % locals())
+            return (loc.get_uri(), size, checksum_hex)
+
         key = bucket_obj.new_key(obj_name)
 
         # We need to wrap image_file, which is a reference to the
@@ -404,6 +505,84 @@ class Store(glance.store.base.Store):
 
         return (loc.get_uri(), size, checksum_hex)
 
+    def _add_multipart(self, bucket_obj, obj_name, image_file, uri):
+        """
+        Streams the image data to S3 as a multipart upload, computing the
+        checksum as it goes. Parts are read from image_file one at a time
+        and uploaded from a pool of green threads, so at most
+        thread_pools + 1 parts are held in memory at once.
+
+        :retval tuple of bytes written and checksum
+        """
+        msg = _("Streaming image data to S3 for %(uri)s using a multipart "
+                "upload in parts of %(part_size)d bytes") % {
+                    'uri': uri, 'part_size': self.part_size}
+        LOG.debug(msg)
+
+        mpu = bucket_obj.initiate_multipart_upload(obj_name)
+        pool = eventlet.GreenPool(size=self.thread_pools)
+        failures = []
+
+        def _upload_part(part, part_num):
+            try:
+                mpu.upload_part_from_file(StringIO.StringIO(part), part_num)
+            except Exception, e:
+                msg = _("Failed to upload part %(part_num)d of %(uri)s "
+                        "to S3: %(e)s") % {'part_num': part_num,
+                                           'uri': uri, 'e': e}
+                LOG.error(msg)
+                failures.append(e)
+
+        checksum = hashlib.md5()
+        size = 0
+        part_num = 0
+        try:
+            for part in self._read_parts(image_file):
+                if failures:
+                    break
+                checksum.update(part)
+                size += len(part)
+                part_num += 1
+                # NOTE: spawn_n() waits for a free green thread, which
+                # bounds the number of parts buffered in memory
+                pool.spawn_n(_upload_part, part, part_num)
+            pool.waitall()
+
+            if failures:
+                raise failures[0]
+            if part_num == 0:
+                # A multipart upload needs at least one (empty) part
+                mpu.upload_part_from_file(StringIO.StringIO(''), 1)
+
+            mpu.complete_upload()
+        except Exception:
+            LOG.error(_("Cancelling multipart upload of %s to S3") % uri)
+            pool.waitall()
+            mpu.cancel_upload()
+            raise
+
+        return (size, checksum.hexdigest())
+
+    def _read_parts(self, image_file):
+        """
+        Yields the image data in strings of part_size bytes; the last
+        part may be shorter.
+        """
+        part = []
+        part_len = 0
+        for chunk in utils.chunkreadable(image_file, self.CHUNKSIZE):
+            while chunk:
+                needed = self.part_size - part_len
+                part.append(chunk[:needed])
+                part_len += len(part[-1])
+                chunk = chunk[needed:]
+                if part_len == self.part_size:
+                    yield ''.join(part)
+                    part = []
+                    part_len = 0
+        if part_len:
+            yield ''.join(part)
+
     def delete(self, location):
         """
         Takes a `glance.store.location.Location` object that indicates
@@ -22,9 +22,13 @@ from __future__ import absolute_import
 import hashlib
 import httplib
 import math
+import StringIO
+import tempfile
 import urllib
 import urlparse
 
+import eventlet
+
 from glance.common import auth
 from glance.common import exception
 from glance.openstack.common import cfg
@@ -61,6 +65,23 @@ swift_opts = [
     cfg.BoolOpt('swift_store_create_container_on_put', default=False),
     cfg.BoolOpt('swift_store_multi_tenant', default=False),
     cfg.ListOpt('swift_store_admin_tenants', default=[]),
+    cfg.IntOpt('swift_store_segment_concurrency', default=1,
+               help=_("Number of segments of a large object that are "
+                      "buffered and uploaded to Swift concurrently")),
+    cfg.StrOpt('swift_store_segment_buffer_dir',
+               help=_("Directory in which segments waiting to be uploaded "
+                      "are buffered. If unset, they are held in memory")),
+    cfg.IntOpt('swift_store_segment_retries', default=3,
+               help=_("Number of times the upload of a single segment is "
+                      "retried before the whole image upload fails")),
+    cfg.IntOpt('swift_store_read_ahead_concurrency', default=1,
+               help=_("Number of byte ranges of an image that are read "
+                      "from Swift concurrently when it is downloaded. "
+                      "1 reads the image with a single request")),
+    cfg.IntOpt('swift_store_read_ahead_chunk_size', default=16,
+               help=_("Size in MB of each byte range read from Swift "
+                      "when swift_store_read_ahead_concurrency is more "
+                      "than 1")),
 ]
 
 CONF = cfg.CONF
@@ -221,6 +242,9 @@ class Store(glance.store.base.Store):
         self.auth_version = self._option_get('swift_store_auth_version')
         self.storage_url = None
         self.token = None
+        self.read_ahead_concurrency = CONF.swift_store_read_ahead_concurrency
+        self.read_ahead_chunk_size = (CONF.swift_store_read_ahead_chunk_size *
+                                      ONE_MB)
 
     def configure_add(self):
         """
@@ -255,6 +279,9 @@ class Store(glance.store.base.Store):
             self.large_object_size = _obj_size * ONE_MB
             _obj_chunk_size = CONF.swift_store_large_object_chunk_size
             self.large_object_chunk_size = _obj_chunk_size * ONE_MB
+            self.segment_concurrency = CONF.swift_store_segment_concurrency
+            self.segment_buffer_dir = CONF.swift_store_segment_buffer_dir
+            self.segment_retries = CONF.swift_store_segment_retries
         except cfg.ConfigFileValueError, e:
             reason = _("Error in configuration conf: %s") % e
             LOG.error(reason)
@@ -286,7 +313,25 @@ class Store(glance.store.base.Store):
         loc = location.store_location
         swift_conn = self._swift_connection_for_location(loc)
 
+        class ResponseIndexable(glance.store.Indexable):
+            def another(self):
+                try:
+                    return self.wrapped.next()
+                except StopIteration:
+                    return ''
+
         try:
+            if self.read_ahead_concurrency > 1:
+                resp_headers = swift_conn.head_object(container=loc.container,
+                                                      obj=loc.obj)
+                length = int(resp_headers.get('content-length', 0))
+                if length > self.read_ahead_chunk_size:
+                    reader = glance.store.ParallelRangeReader(
+                        self._range_reader(swift_conn, loc), length,
+                        self.read_ahead_chunk_size,
+                        self.read_ahead_concurrency)
+                    return (ResponseIndexable(reader, length), length)
+
             (resp_headers, resp_body) = swift_conn.get_object(
                 container=loc.container, obj=loc.obj,
                 resp_chunk_size=self.CHUNKSIZE)
@@ -298,16 +343,71 @@ class Store(glance.store.base.Store):
             else:
                 raise
 
-        class ResponseIndexable(glance.store.Indexable):
-            def another(self):
-                try:
-                    return self.wrapped.next()
-                except StopIteration:
-                    return ''
-
         length = int(resp_headers.get('content-length', 0))
         return (ResponseIndexable(resp_body, length), length)
 
+    def _range_reader(self, swift_conn, loc):
+        """
+        Returns a function that reads a byte range of the object at loc,
+        for use from several green threads at once.
+        """
+        # swiftclient connections cannot be shared between green threads,
+        # so each read borrows an idle one or clones a new one
+        idle_conns = [swift_conn]
+
+        def _read_range(offset, length):
+            if idle_conns:
+                conn = idle_conns.pop()
+            else:
+                conn = self._clone_swift_connection(swift_conn)
+            byte_range = 'bytes=%d-%d' % (offset, offset + length - 1)
+            try:
+                (resp_headers, resp_body) = conn._retry(
+                    None, get_object_range, loc.container, loc.obj,
+                    byte_range)
+                return resp_body
+            finally:
+                idle_conns.append(conn)
+
+        return _read_range
+
+    def get_range(self, location, offset, length=None):
+        """
+        Takes a `glance.store.location.Location` object that indicates
+        where to find the image file, and returns a tuple of generator
+        (for reading `length` bytes of the image file starting at byte
+        `offset`) and the number of bytes the generator will yield
+
+        :param location `glance.store.location.Location` object, supplied
+                        from glance.store.location.get_location_from_uri()
+        :param offset: first byte of the image file to return
+        :param length: number of bytes to return, or None to read until
+                       the end of the image file
+        :raises `glance.exception.NotFound` if image does not exist
+        """
+        loc = location.store_location
+        swift_conn = self._swift_connection_for_location(loc)
+
+        if length is None:
+            byte_range = 'bytes=%d-' % offset
+        else:
+            byte_range = 'bytes=%d-%d' % (offset, offset + length - 1)
+
+        try:
+            (resp_headers, resp_body) = swift_conn._retry(
+                None, get_object_range, loc.container, loc.obj, byte_range,
+                resp_chunk_size=self.CHUNKSIZE)
+        except swiftclient.ClientException, e:
+            if e.http_status == httplib.NOT_FOUND:
+                uri = location.get_store_uri()
+                raise exception.NotFound(_("Swift could not find image at "
+                                           "uri %(uri)s") % locals())
+            else:
+                raise
+
+        length = int(resp_headers.get('content-length', 0))
+        return (resp_body, length)
+
     def get_size(self, location):
         """
         Takes a `glance.store.location.Location` object that indicates
@@ -464,7 +564,6 @@ class Store(glance.store.base.Store):
                                                  content_length=image_size)
             else:
                 # Write the image into Swift in chunks.
-                chunk_id = 1
                 if image_size > 0:
                     total_chunks = str(int(
                         math.ceil(float(image_size) /
@@ -477,41 +576,13 @@ class Store(glance.store.base.Store):
                                 "segmented object to Swift."))
                     total_chunks = '?'
 
-                checksum = hashlib.md5()
-                combined_chunks_size = 0
-                while True:
-                    chunk_size = self.large_object_chunk_size
-                    if image_size == 0:
-                        content_length = None
-                    else:
-                        left = image_size - combined_chunks_size
-                        if left == 0:
-                            break
-                        if chunk_size > left:
-                            chunk_size = left
-                        content_length = chunk_size
-
-                    chunk_name = "%s-%05d" % (obj_name, chunk_id)
-                    reader = ChunkReader(image_file, checksum, chunk_size)
-                    chunk_etag = swift_conn.put_object(
-                        container, chunk_name, reader,
-                        content_length=content_length)
-                    bytes_read = reader.bytes_read
-                    msg = _("Wrote chunk %(chunk_name)s (%(chunk_id)d/"
-                            "%(total_chunks)s) of length %(bytes_read)d "
-                            "to Swift returning MD5 of content: "
-                            "%(chunk_etag)s")
-                    LOG.debug(msg % locals())
-
-                    if bytes_read == 0:
-                        # Delete the last chunk, because it's of zero size.
-                        # This will happen if image_size == 0.
-                        LOG.debug(_("Deleting final zero-length chunk"))
-                        swift_conn.delete_object(container, chunk_name)
-                        break
-
-                    chunk_id += 1
-                    combined_chunks_size += bytes_read
+                if self.segment_concurrency > 1:
+                    write_segments = self._write_segments_concurrently
+                else:
+                    write_segments = self._write_segments
+                combined_chunks_size, checksum = write_segments(
+                        swift_conn, container, obj_name, image_file,
+                        image_size, total_chunks)
 
                 # In the case we have been given an unknown image size,
                 # set the image_size to the total size of the combined chunks.
@@ -550,6 +621,166 @@ class Store(glance.store.base.Store):
             LOG.error(msg)
             raise glance.store.BackendException(msg)
 
+    def _write_segments(self, swift_conn, container, obj_name, image_file,
+                        image_size, total_chunks):
+        """
+        Writes the image data to Swift as a series of segments, one
+        after another.
+
+        :retval tuple of the combined size of the segments and the
+                MD5 checksum object of the image data
+        """
+        checksum = hashlib.md5()
+        combined_chunks_size = 0
+        chunk_id = 1
+        while True:
+            chunk_size = self.large_object_chunk_size
+            if image_size == 0:
+                content_length = None
+            else:
+                left = image_size - combined_chunks_size
+                if left == 0:
+                    break
+                if chunk_size > left:
+                    chunk_size = left
+                content_length = chunk_size
+
+            chunk_name = "%s-%05d" % (obj_name, chunk_id)
+            reader = ChunkReader(image_file, checksum, chunk_size)
+            chunk_etag = swift_conn.put_object(
+                container, chunk_name, reader,
+                content_length=content_length)
+            bytes_read = reader.bytes_read
+            msg = _("Wrote chunk %(chunk_name)s (%(chunk_id)d/"
+                    "%(total_chunks)s) of length %(bytes_read)d "
+                    "to Swift returning MD5 of content: "
+                    "%(chunk_etag)s")
+            LOG.debug(msg % locals())
+
+            if bytes_read == 0:
+                # Delete the last chunk, because it's of zero size.
+                # This will happen if image_size == 0.
+                LOG.debug(_("Deleting final zero-length chunk"))
+                swift_conn.delete_object(container, chunk_name)
+                break
+
+            chunk_id += 1
+            combined_chunks_size += bytes_read
+
+        return combined_chunks_size, checksum
+
+    def _write_segments_concurrently(self, swift_conn, container, obj_name,
+                                     image_file, image_size, total_chunks):
+        """
+        Writes the image data to Swift as a series of segments, uploading
+        up to segment_concurrency segments at once from a pool of green
+        threads. Each segment is read into a buffer, in memory or in a
+        file in segment_buffer_dir, before it is uploaded, so a failed
+        upload can be retried without failing the whole image.
+
+        :retval tuple of the combined size of the segments and the
+                MD5 checksum object of the image data
+        """
+        checksum = hashlib.md5()
+        combined_chunks_size = 0
+        chunk_id = 1
+        pool = eventlet.GreenPool(size=self.segment_concurrency)
+        # swiftclient connections cannot be shared between green threads,
+        # so each upload borrows an idle one or clones a new one
+        idle_conns = []
+        failures = []
+
+        def _upload_segment(chunk_name, chunk_id, segment, segment_size):
+            if idle_conns:
+                conn = idle_conns.pop()
+            else:
+                conn = self._clone_swift_connection(swift_conn)
+            try:
+                for attempt in xrange(self.segment_retries + 1):
+                    try:
+                        segment.seek(0)
+                        chunk_etag = conn.put_object(
+                            container, chunk_name, segment,
+                            content_length=segment_size)
+                        break
+                    except Exception, e:
+                        conflict = (isinstance(e, swiftclient.ClientException)
+                                    and e.http_status == httplib.CONFLICT)
+                        if conflict or attempt == self.segment_retries:
+                            failures.append(e)
+                            return
+                        msg = _("Failed to write chunk %(chunk_name)s to "
+                                "Swift, retrying: %(e)s")
+                        LOG.warn(msg % {'chunk_name': chunk_name, 'e': e})
+                msg = _("Wrote chunk %(chunk_name)s (%(chunk_id)d/"
+                        "%(total_chunks)s) of length %(segment_size)d "
+                        "to Swift returning MD5 of content: "
+                        "%(chunk_etag)s")
+                LOG.debug(msg % {'chunk_name': chunk_name,
+                                 'chunk_id': chunk_id,
+                                 'total_chunks': total_chunks,
+                                 'segment_size': segment_size,
+                                 'chunk_etag': chunk_etag})
+            finally:
+                segment.close()
+                idle_conns.append(conn)
+
+        while not failures:
+            chunk_size = self.large_object_chunk_size
+            if image_size > 0:
+                left = image_size - combined_chunks_size
+                if left == 0:
+                    break
+                chunk_size = min(chunk_size, left)
+
+            reader = ChunkReader(image_file, checksum, chunk_size)
+            segment = self._buffer_segment(reader)
+            if reader.bytes_read == 0:
+                segment.close()
+                break
+
+            chunk_name = "%s-%05d" % (obj_name, chunk_id)
+            # NOTE: spawn_n() waits for a free green thread, which bounds
+            # the number of segments buffered at any one time
+            pool.spawn_n(_upload_segment, chunk_name, chunk_id, segment,
+                         reader.bytes_read)
+            chunk_id += 1
+            combined_chunks_size += reader.bytes_read
+            if reader.bytes_read < chunk_size:
+                break
+
+        pool.waitall()
+        if failures:
+            raise failures[0]
+        return combined_chunks_size, checksum
+
+    def _buffer_segment(self, reader):
+        """
+        Reads everything from reader into a buffer, which is a temporary
+        file in segment_buffer_dir if that is set.
+        """
+        if self.segment_buffer_dir:
+            segment = tempfile.TemporaryFile(dir=self.segment_buffer_dir)
+        else:
+            segment = StringIO.StringIO()
+        chunk = reader.read(self.CHUNKSIZE)
+        while chunk:
+            segment.write(chunk)
+            chunk = reader.read(self.CHUNKSIZE)
+        return segment
+
+    @staticmethod
+    def _clone_swift_connection(swift_conn):
+        """
+        Creates a new connection sharing the storage URL and token that
+        swift_conn already authenticated with.
+        """
+        return swiftclient.Connection(
+            swift_conn.authurl, swift_conn.user, swift_conn.key,
+            preauthurl=swift_conn.url, preauthtoken=swift_conn.token,
+            snet=swift_conn.snet, os_options=swift_conn.os_options,
+            auth_version=swift_conn.auth_version)
+
     def delete(self, location):
         """
         Takes a `glance.store.location.Location` object that indicates
@@ -661,6 +892,62 @@ class ChunkReader(object):
         return result
 
 
+def get_object_range(url, token, container, name, byte_range,
+                     http_conn=None, resp_chunk_size=None):
+    """
+    Get a byte range of an object. This mirrors
+    ``swiftclient.client.get_object``, which cannot pass a Range header,
+    and is meant to be called through ``swiftclient.Connection._retry``
+    so that it shares the connection's authentication and retry logic.
+
+    :param url: storage URL
+    :param token: auth token
+    :param container: container name that the object is in
+    :param name: object name to get
+    :param byte_range: value of the HTTP Range header, e.g. 'bytes=0-99'
+    :param http_conn: HTTP connection object (If None, it will create the
+                      conn object)
+    :param resp_chunk_size: if defined, chunk size of data to read
+    :returns: a tuple of (response headers, the object's contents) The
+              response headers will be a dict and all header names will be
+              lowercase.
+    :raises ClientException: HTTP GET request failed
+    """
+    if http_conn:
+        parsed, conn = http_conn
+    else:
+        parsed, conn = swiftclient.http_connection(url)
+    path = '%s/%s/%s' % (parsed.path, urllib.quote(container),
+                         urllib.quote(name))
+    headers = {'X-Auth-Token': token, 'Range': byte_range}
+    conn.request('GET', path, '', headers)
+    resp = conn.getresponse()
+    if resp.status < 200 or resp.status >= 300:
+        body = resp.read()
+        raise swiftclient.ClientException('Object GET failed',
+                                          http_scheme=parsed.scheme,
+                                          http_host=conn.host,
+                                          http_port=conn.port,
+                                          http_path=path,
+                                          http_status=resp.status,
+                                          http_reason=resp.reason,
+                                          http_response_content=body)
+    if resp_chunk_size:
+
+        def _object_body():
+            buf = resp.read(resp_chunk_size)
+            while buf:
+                yield buf
+                buf = resp.read(resp_chunk_size)
+        object_body = _object_body()
+    else:
+        object_body = resp.read()
+    resp_headers = {}
+    for header, value in resp.getheaders():
+        resp_headers[header.lower()] = value
+    return resp_headers, object_body
+
+
 def create_container_if_missing(container, swift_conn):
     """
     Creates a missing container in Swift if the
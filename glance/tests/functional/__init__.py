@@ -234,6 +234,7 @@ class ApiServer(Server):
         self.image_cache_driver = 'sqlite'
         self.policy_file = policy_file
         self.policy_default_rule = 'default'
+        self.policy_file_check_interval = 0
         self.server_control_options = '--capture-output'
 
         self.needs_database = True
@@ -282,6 +283,7 @@ image_cache_dir = %(image_cache_dir)s
 image_cache_driver = %(image_cache_driver)s
 policy_file = %(policy_file)s
 policy_default_rule = %(policy_default_rule)s
+policy_file_check_interval = %(policy_file_check_interval)s
 db_auto_create = False
 sql_connection = %(sql_connection)s
 show_image_direct_url = %(show_image_direct_url)s
@@ -243,6 +243,94 @@ class TestDriver(base.IsolatedUnitTest):
         self.assertRaises(exception.NotFound,
                           self.db_api.image_get, self.context, UUID)
 
+    def test_image_get_many(self):
+        missing = uuidutils.generate_uuid()
+        images = self.db_api.image_get_many(self.context,
+                                            [UUID1, UUID3, missing])
+        self.assertEqual(set([UUID1, UUID3]), set(i['id'] for i in images))
+        image = [i for i in images if i['id'] == UUID1][0]
+        properties = dict((p['name'], p['value'])
+                          for p in image['properties'])
+        self.assertEqual({'foo': 'bar'}, properties)
+
+    def test_image_get_many_not_owned(self):
+        TENANT1 = uuidutils.generate_uuid()
+        TENANT2 = uuidutils.generate_uuid()
+        ctxt1 = context.RequestContext(is_admin=False, tenant=TENANT1)
+        ctxt2 = context.RequestContext(is_admin=False, tenant=TENANT2)
+        image = self.db_api.image_create(
+                ctxt1, {'status': 'queued', 'owner': TENANT1})
+        images = self.db_api.image_get_many(ctxt2, [UUID1, image['id']])
+        self.assertEqual([UUID1], [i['id'] for i in images])
+        images = self.db_api.image_get_many(ctxt1, [UUID1, image['id']])
+        self.assertEqual(2, len(images))
+
+    def test_image_get_many_deleted(self):
+        self.db_api.image_destroy(self.adm_context, UUID1)
+        images = self.db_api.image_get_many(self.context, [UUID1, UUID2])
+        self.assertEqual([UUID2], [i['id'] for i in images])
+        images = self.db_api.image_get_many(self.context, [UUID1, UUID2],
+                                            force_show_deleted=True)
+        self.assertEqual(2, len(images))
+
+    def test_image_update_many(self):
+        images = self.db_api.image_update_many(self.adm_context,
+                                               [UUID1, UUID2],
+                                               {'status': 'killed'})
+        self.assertEqual(set([UUID1, UUID2]), set(i['id'] for i in images))
+        self.assertEqual(['killed', 'killed'], [i['status'] for i in images])
+        for image_id, status in ((UUID1, 'killed'), (UUID2, 'killed'),
+                                 (UUID3, 'active')):
+            image = self.db_api.image_get(self.adm_context, image_id)
+            self.assertEqual(status, image['status'])
+
+    def test_image_update_many_not_owned(self):
+        images = self.db_api.image_update_many(self.context, [UUID1],
+                                               {'status': 'killed'})
+        self.assertEqual([], images)
+        image = self.db_api.image_get(self.adm_context, UUID1)
+        self.assertEqual('active', image['status'])
+
+    def test_image_update_many_properties(self):
+        self.assertRaises(exception.Invalid,
+                          self.db_api.image_update_many,
+                          self.adm_context, [UUID1],
+                          {'properties': {'ping': 'pong'}})
+
+    def test_image_update_many_unknown_attributes(self):
+        for values in ({'id': UUID2}, {'created_at': timeutils.utcnow()},
+                       {'status': 'killed', 'pants': 'on'}):
+            try:
+                self.db_api.image_update_many(self.adm_context, [UUID1],
+                                              values)
+            except exception.Invalid, e:
+                self.assertTrue('Unknown image attributes' in str(e))
+            else:
+                self.fail("Updated %s on many images" % values.keys())
+        image = self.db_api.image_get(self.adm_context, UUID1)
+        self.assertEqual('active', image['status'])
+
+    def test_image_update_many_invalid_status(self):
+        self.assertRaises(exception.Invalid,
+                          self.db_api.image_update_many,
+                          self.adm_context, [UUID1], {'status': 'eaten'})
+        image = self.db_api.image_get(self.adm_context, UUID1)
+        self.assertEqual('active', image['status'])
+
+    def test_image_destroy_many(self):
+        images = self.db_api.image_destroy_many(self.adm_context,
+                                                [UUID1, UUID2])
+        self.assertEqual(set([UUID1, UUID2]), set(i['id'] for i in images))
+        self.assertEqual([True, True], [i['deleted'] for i in images])
+        images = self.db_api.image_get_many(self.context,
+                                            [UUID1, UUID2, UUID3])
+        self.assertEqual([UUID3], [i['id'] for i in images])
+
+    def test_image_destroy_many_not_owned(self):
+        images = self.db_api.image_destroy_many(self.context, [UUID1])
+        self.assertEqual([], images)
+        self.db_api.image_get(self.context, UUID1)
+
     def test_image_get_all(self):
         images = self.db_api.image_get_all(self.context)
         self.assertEquals(3, len(images))
@@ -255,6 +343,18 @@ class TestDriver(base.IsolatedUnitTest):
         self.assertEquals(len(images), 1)
         self.assertEquals(images[0]['id'], self.fixtures[0]['id'])
 
+    def test_image_get_all_columns(self):
+        images = self.db_api.image_get_all(self.context,
+                                           filters={'foo': 'bar'},
+                                           columns=['id', 'size'])
+        self.assertEquals([{'id': UUID1, 'size': 13}], images)
+
+    def test_image_get_all_columns_sorted(self):
+        images = self.db_api.image_get_all(self.context, sort_key='size',
+                                           sort_dir='asc', limit=2,
+                                           columns=['id'])
+        self.assertEquals([{'id': UUID1}, {'id': UUID2}], images)
+
     def test_image_get_all_with_filter_user_defined_property(self):
         images = self.db_api.image_get_all(self.context,
                                            filters={'foo': 'bar'})
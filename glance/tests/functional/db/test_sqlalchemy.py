@@ -14,9 +14,18 @@
 #    under the License.
 
 
+import sqlalchemy
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy import schema
+import stubout
+
+from glance import context
 import glance.db.sqlalchemy.api
 from glance.db.sqlalchemy import models as db_models
 import glance.tests.functional.db as db_tests
+from glance.tests import utils as test_utils
 
 
 def get_db(config):
@@ -41,5 +50,108 @@ def tearDownModule():
     db_tests.reset()
 
 
+class TestImageUpdateStatements(test_utils.BaseTestCase):
+
+    """Counts the statements needed to update image properties"""
+
+    def setUp(self):
+        super(TestImageUpdateStatements, self).setUp()
+        self.stubs = stubout.StubOutForTesting()
+        self.db_api = glance.db.sqlalchemy.api
+        self.statements = []
+        test_utils.stub_out_sqlalchemy_db(self.stubs, self.statements)
+
+        self.adm_context = context.RequestContext(is_admin=True)
+        self.image_id = self.db_api.image_create(
+                self.adm_context,
+                {'status': 'active', 'properties': {'foo': 'bar'}})['id']
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestImageUpdateStatements, self).tearDown()
+
+    def _update_statements(self, properties, purge_props=False):
+        del self.statements[:]
+        self.db_api.image_update(self.adm_context, self.image_id,
+                                 {'properties': properties},
+                                 purge_props=purge_props)
+        return len(self.statements)
+
+    def test_statements_independent_of_property_count(self):
+        few = self._update_statements({'a': '1', 'foo': 'baz'})
+        many = dict(('prop%d' % i, str(i)) for i in xrange(50))
+        many['a'] = '2'
+        self.assertEqual(few, self._update_statements(many))
+
+    def test_purge_statements_independent_of_property_count(self):
+        many = dict(('prop%d' % i, str(i)) for i in xrange(50))
+        self._update_statements(many)
+        few = self._update_statements({'foo': 'bar', 'prop0': '1'},
+                                      purge_props=True)
+        self._update_statements(many)
+        self.assertEqual(few, self._update_statements({'prop0': '2'},
+                                                      purge_props=True))
+
+    def test_image_update_matches_image_get(self):
+        self._update_statements({'ping': 'pong'}, purge_props=True)
+        image = self.db_api.image_update(
+                self.adm_context, self.image_id,
+                {'properties': {'foo': 'baz', 'ping': 'pong', 'a': 'b'}},
+                purge_props=True)
+
+        def _properties(image):
+            return sorted((p['name'], p['value'], p['deleted'])
+                          for p in image['properties'])
+
+        expected = [('a', 'b', False), ('foo', 'baz', False),
+                    ('ping', 'pong', False)]
+        self.assertEqual(expected, _properties(image))
+        image = self.db_api.image_get(self.adm_context, self.image_id)
+        self.assertEqual(expected, _properties(image))
+
+
+class TestPropertyValueIndex(test_utils.BaseTestCase):
+
+    """Checks the models create the index added by migration 017"""
+
+    def _get_index(self):
+        for index in db_models.ImageProperty.__table__.indexes:
+            if index.name == db_models.PROPERTY_VALUE_INDEX:
+                return index
+        self.fail("Index %s not declared" % db_models.PROPERTY_VALUE_INDEX)
+
+    def _compile(self, dialect):
+        return str(schema.CreateIndex(self._get_index()).compile(
+                dialect=dialect))
+
+    def test_created_with_models(self):
+        engine = sqlalchemy.create_engine('sqlite://')
+        db_models.register_models(engine)
+        rows = engine.execute("PRAGMA index_info(%s)" %
+                              db_models.PROPERTY_VALUE_INDEX)
+        self.assertEqual(['name', 'value', 'image_id'],
+                         [row[2] for row in rows])
+
+    def test_value_prefix_indexed(self):
+        create = 'CREATE INDEX %s ON ' % db_models.PROPERTY_VALUE_INDEX
+        self.assertEqual(create +
+                         'image_properties (name, value(255), image_id)',
+                         self._compile(mysql.dialect()))
+        self.assertEqual(create + 'image_properties '
+                         '(name, substr(value, 1, 255), image_id)',
+                         self._compile(postgresql.dialect()))
+        self.assertTrue('(name, value, image_id)' in
+                        self._compile(sqlite.dialect()))
+
+
+class TestTableArgs(test_utils.BaseTestCase):
+
+    def test_innodb_tables(self):
+        for model in (db_models.Image, db_models.ImageProperty):
+            self.assertEqual('InnoDB',
+                             model.__table__.kwargs.get('mysql_engine'),
+                             "%s is not InnoDB" % model.__tablename__)
+
+
 #NOTE(markwash): Pull in all the base test cases
 from glance.tests.functional.db.base import *
@@ -13,11 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import datetime
+import StringIO
 import unittest
 
 import webob
+import webob.exc
 
 from glance.common import exception
+from glance.common import utils
+from glance import context
 import glance.api.common
 
 
@@ -125,3 +131,163 @@ class TestSizeCheckedIter(unittest.TestCase):
         self.assertEqual('CD', checked_image.next())
         self.assertEqual('E', checked_image.next())
         self.assertRaises(exception.GlanceException, checked_image.next)
+
+
+class FakeNotifier(object):
+    def __init__(self):
+        self.notifications = []
+
+    def info(self, event_type, payload):
+        self.notifications.append(('info', payload['bytes_sent']))
+
+    def error(self, event_type, payload):
+        self.notifications.append(('error', payload['bytes_sent']))
+
+
+class TestSizeCheckedIterNotification(unittest.TestCase):
+    def setUp(self):
+        self.request = webob.Request.blank('/')
+        self.request.context = context.RequestContext()
+        self.response = webob.Response(request=self.request)
+        self.meta = {'id': 'e31cb99c-fe89-49fb-9cc5-f5104fffa636',
+                     'owner': None}
+        self.notifier = FakeNotifier()
+
+    def _get_file_wrapper(self):
+        @contextlib.contextmanager
+        def opener():
+            yield StringIO.StringIO('ABCD')
+
+        return utils.FileWrapper(opener, 0, 4)
+
+    def test_notify_in_posthook(self):
+        self.request.environ['eventlet.posthooks'] = []
+        checked_image = glance.api.common.size_checked_iter(
+                self.response, self.meta, 4, ['AB', 'CD'], self.notifier)
+
+        self.assertEqual('ABCD', ''.join(checked_image))
+        self.assertEqual([], self.notifier.notifications)
+        hook, args, kwargs = self.request.environ['eventlet.posthooks'][0]
+        hook(self.request.environ, *args, **kwargs)
+        self.assertEqual([('info', 4)], self.notifier.notifications)
+
+    def test_notify_without_posthooks(self):
+        checked_image = glance.api.common.size_checked_iter(
+                self.response, self.meta, 4, ['AB', 'CD'], self.notifier)
+
+        self.assertEqual('AB', checked_image.next())
+        self.assertEqual([], self.notifier.notifications)
+        self.assertEqual('CD', checked_image.next())
+        self.assertRaises(StopIteration, checked_image.next)
+        self.assertEqual([('info', 4)], self.notifier.notifications)
+
+    def test_notify_without_posthooks_on_disconnect(self):
+        checked_image = glance.api.common.size_checked_iter(
+                self.response, self.meta, 4, ['AB', 'CD'], self.notifier)
+
+        self.assertEqual('AB', checked_image.next())
+        self.assertEqual('CD', checked_image.next())
+        checked_image.close()
+        self.assertEqual([('error', 2)], self.notifier.notifications)
+
+    def test_file_wrapper_passed_through_with_posthooks(self):
+        self.request.environ['eventlet.posthooks'] = []
+        file_wrapper = self._get_file_wrapper()
+        checked_image = glance.api.common.size_checked_iter(
+                self.response, self.meta, 4, file_wrapper, self.notifier)
+        self.assertTrue(checked_image is file_wrapper)
+
+    def test_file_wrapper_without_posthooks(self):
+        checked_image = glance.api.common.size_checked_iter(
+                self.response, self.meta, 4, self._get_file_wrapper(),
+                self.notifier)
+
+        self.assertFalse(isinstance(checked_image, utils.FileWrapper))
+        self.assertEqual('ABCD', ''.join(checked_image))
+        self.assertEqual([('info', 4)], self.notifier.notifications)
+
+
+class TestCheckNotModified(unittest.TestCase):
+    last_modified = datetime.datetime(2012, 10, 18, 10, 30, 15)
+
+    def _check(self, headers, etag=None, last_modified=None, method='GET'):
+        request = webob.Request.blank('/', headers=headers)
+        request.method = method
+        glance.api.common.check_not_modified(request, etag, last_modified)
+
+    def test_no_conditional_headers(self):
+        self._check({}, 'abc', self.last_modified)  # No exception raised
+
+    def test_if_none_match(self):
+        headers = {'If-None-Match': '"xyz", "abc"'}
+        self.assertRaises(webob.exc.HTTPNotModified,
+                          self._check, headers, 'abc')
+        self._check(headers, 'def')  # No exception raised
+        self._check(headers)  # No exception raised
+
+    def test_if_none_match_any(self):
+        self.assertRaises(webob.exc.HTTPNotModified,
+                          self._check, {'If-None-Match': '*'}, 'abc')
+
+    def test_if_none_match_only_for_get_and_head(self):
+        headers = {'If-None-Match': '"abc"'}
+        self.assertRaises(webob.exc.HTTPNotModified,
+                          self._check, headers, 'abc', method='HEAD')
+        self._check(headers, 'abc', method='PUT')  # No exception raised
+
+    def test_if_modified_since(self):
+        headers = {'If-Modified-Since': 'Thu, 18 Oct 2012 10:30:15 GMT'}
+        self.assertRaises(webob.exc.HTTPNotModified, self._check,
+                          headers, last_modified=self.last_modified)
+        later = self.last_modified + datetime.timedelta(seconds=1)
+        self._check(headers, last_modified=later)  # No exception raised
+        self._check(headers)  # No exception raised
+
+    def test_if_none_match_takes_precedence(self):
+        headers = {'If-None-Match': '"xyz"',
+                   'If-Modified-Since': 'Thu, 18 Oct 2012 10:30:15 GMT'}
+        self._check(headers, 'abc', self.last_modified)  # No exception raised
+
+    def test_not_modified_headers(self):
+        request = webob.Request.blank('/', headers={'If-None-Match': '*'})
+        try:
+            glance.api.common.check_not_modified(request, 'abc',
+                                                 self.last_modified)
+        except webob.exc.HTTPNotModified, e:
+            self.assertEqual('"abc"', e.headers['ETag'])
+            self.assertEqual('Thu, 18 Oct 2012 10:30:15 GMT',
+                             e.headers['Last-Modified'])
+        else:
+            self.fail('HTTPNotModified not raised')
+
+
+class TestGetLastModified(unittest.TestCase):
+
+    def test_datetime(self):
+        updated_at = datetime.datetime(2012, 10, 18, 10, 30, 15, 123456)
+        expected = datetime.datetime(2012, 10, 18, 10, 30, 15)
+        self.assertEqual(expected,
+                         glance.api.common.get_last_modified(updated_at))
+
+    def test_isotime(self):
+        expected = datetime.datetime(2012, 10, 18, 10, 30, 15)
+        last_modified = glance.api.common.get_last_modified(
+                '2012-10-18T10:30:15.123456')
+        self.assertEqual(expected, last_modified)
+
+    def test_empty_or_invalid(self):
+        self.assertEqual(None, glance.api.common.get_last_modified(None))
+        self.assertEqual(None, glance.api.common.get_last_modified('never'))
+
+
+class TestMakeEtag(unittest.TestCase):
+
+    def test_stable(self):
+        self.assertEqual(glance.api.common.make_etag('a', [1, 2]),
+                         glance.api.common.make_etag('a', [1, 2]))
+
+    def test_parts_are_separated(self):
+        self.assertNotEqual(glance.api.common.make_etag('ab', 'c'),
+                            glance.api.common.make_etag('a', 'bc'))
+        self.assertNotEqual(glance.api.common.make_etag(['a', 'b']),
+                            glance.api.common.make_etag(['a'], 'b'))
@@ -60,7 +60,8 @@ class IsolatedUnitTest(StoreClearingUnitTest):
                     debug=False,
                     default_store='filesystem',
                     filesystem_store_datadir=os.path.join(self.test_dir),
-                    policy_file=policy_file)
+                    policy_file=policy_file,
+                    policy_file_check_interval=0)
         super(IsolatedUnitTest, self).setUp()
         stubs.stub_out_registry_and_store_server(self.stubs, self.test_dir)
 
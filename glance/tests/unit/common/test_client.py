@@ -0,0 +1,197 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+import threading
+import time
+
+import stubout
+
+from glance.common import client
+from glance.common import exception
+from glance.tests import utils as test_utils
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.sock = object()
+        self.closed = False
+
+    def close(self):
+        self.sock = None
+        self.closed = True
+
+
+class TestConnectionPool(test_utils.BaseTestCase):
+
+    def test_get_from_empty_pool(self):
+        pool = client.ConnectionPool()
+        self.assertEqual(None, pool.get('key'))
+
+    def test_put_and_get(self):
+        pool = client.ConnectionPool()
+        conn = FakeConnection()
+        pool.put('key', conn)
+        self.assertEqual(None, pool.get('other key'))
+        self.assertEqual(conn, pool.get('key'))
+        self.assertEqual(None, pool.get('key'))
+
+    def test_most_recently_used_first(self):
+        pool = client.ConnectionPool()
+        conns = [FakeConnection(), FakeConnection()]
+        for conn in conns:
+            pool.put('key', conn)
+        self.assertEqual(conns[1], pool.get('key'))
+        self.assertEqual(conns[0], pool.get('key'))
+
+    def test_max_size(self):
+        pool = client.ConnectionPool(max_size=1)
+        conns = [FakeConnection(), FakeConnection()]
+        for conn in conns:
+            pool.put('key', conn)
+        self.assertFalse(conns[0].closed)
+        self.assertTrue(conns[1].closed)
+        self.assertEqual(conns[0], pool.get('key'))
+        self.assertEqual(None, pool.get('key'))
+
+    def test_closed_connection_not_pooled(self):
+        pool = client.ConnectionPool()
+        conn = FakeConnection()
+        conn.close()
+        pool.put('key', conn)
+        self.assertEqual(None, pool.get('key'))
+
+    def test_idle_connections_evicted(self):
+        pool = client.ConnectionPool(idle_timeout=60)
+        conn = FakeConnection()
+        now = time.time()
+        stubs = stubout.StubOutForTesting()
+        try:
+            stubs.Set(time, 'time', lambda: now)
+            pool.put('key', conn)
+            stubs.Set(time, 'time', lambda: now + 61)
+            self.assertEqual(None, pool.get('key'))
+            self.assertTrue(conn.closed)
+        finally:
+            stubs.UnsetAll()
+
+    def test_clear(self):
+        pool = client.ConnectionPool()
+        conn = FakeConnection()
+        pool.put('key', conn)
+        pool.clear()
+        self.assertTrue(conn.closed)
+        self.assertEqual(None, pool.get('key'))
+
+
+class TestBaseClientConnectionPool(test_utils.BaseTestCase):
+
+    """
+    Tests BaseClient against a minimal HTTP/1.1 server that answers
+    a fixed number of requests on each connection before closing it
+    without warning, as a server dropping idle connections does.
+    """
+
+    def setUp(self):
+        super(TestBaseClientConnectionPool, self).setUp()
+        self.connections = 0
+        self.requests_per_connection = 3
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.server = threading.Thread(target=self._serve)
+        self.server.daemon = True
+        self.server.start()
+
+    def tearDown(self):
+        self.sock.close()
+        super(TestBaseClientConnectionPool, self).tearDown()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            handler = threading.Thread(target=self._handle, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def _handle(self, conn):
+        conn.settimeout(5)
+        f = conn.makefile('rb')
+        try:
+            for i in xrange(self.requests_per_connection):
+                line = f.readline()
+                if not line:
+                    break
+                while line not in ('\r\n', '\n', ''):
+                    line = f.readline()
+                conn.sendall('HTTP/1.1 200 OK\r\n'
+                             'Content-Length: 2\r\n\r\nok')
+        except socket.error:
+            pass
+        finally:
+            f.close()
+            conn.close()
+
+    def _client(self, pool):
+        return client.BaseClient('127.0.0.1', self.port, timeout=5,
+                                 auth_tok='token', connection_pool=pool)
+
+    def test_connection_reused(self):
+        pool = client.ConnectionPool()
+        for i in xrange(3):
+            res = self._client(pool).do_request('GET', '/images')
+            self.assertEqual('ok', res.read())
+        self.assertEqual(1, self.connections)
+
+    def test_connection_not_reused_without_pool(self):
+        for i in xrange(3):
+            res = self._client(None).do_request('GET', '/images')
+            self.assertEqual('ok', res.read())
+        self.assertEqual(3, self.connections)
+
+    def test_connection_not_reused_until_response_read(self):
+        pool = client.ConnectionPool()
+        self._client(pool).do_request('GET', '/images')
+        res = self._client(pool).do_request('GET', '/images')
+        self.assertEqual('ok', res.read())
+        self.assertEqual(2, self.connections)
+
+    def test_request_retried_on_stale_connection(self):
+        self.requests_per_connection = 1
+        pool = client.ConnectionPool()
+        for i in xrange(3):
+            res = self._client(pool).do_request('GET', '/images')
+            self.assertEqual('ok', res.read())
+        self.assertEqual(3, self.connections)
+
+    def test_post_not_retried_on_stale_connection(self):
+        self.requests_per_connection = 1
+        pool = client.ConnectionPool()
+        res = self._client(pool).do_request('POST', '/images', body='{}')
+        self.assertEqual('ok', res.read())
+        # The server may have created the image before dropping the
+        # connection, so the request must not be sent again
+        self.assertRaises(exception.ClientConnectionError,
+                          self._client(pool).do_request,
+                          'POST', '/images', body='{}')
+        self.assertEqual(1, self.connections)
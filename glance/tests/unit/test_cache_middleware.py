@@ -13,6 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import StringIO
+
+import eventlet
 import stubout
 import unittest
 import webob
@@ -21,6 +25,7 @@ import glance.api.middleware.cache
 from glance import context
 from glance import registry
 from glance.common import exception
+from glance.common import utils
 
 
 class TestCacheMiddlewareURLMatching(unittest.TestCase):
@@ -80,7 +85,8 @@ class TestCacheMiddlewareRequestStashCacheInfo(unittest.TestCase):
 class ChecksumTestCacheFilter(glance.api.middleware.cache.CacheFilter):
     def __init__(self):
         class DummyCache(object):
-            def get_caching_iter(self, image_id, image_checksum, app_iter):
+            def get_caching_iter(self, image_id, image_checksum, app_iter,
+                                 opened=None):
                 self.image_checksum = image_checksum
 
         self.cache = DummyCache()
@@ -113,6 +119,14 @@ class TestCacheMiddlewareChecksumVerification(unittest.TestCase):
 
         self.assertEqual(None, cache_filter.cache.image_checksum)
 
+    def test_partial_content_not_cached(self):
+        cache_filter = ChecksumTestCacheFilter()
+        headers = {"Content-MD5": "abcdefghi"}
+        resp = webob.Response(headers=headers, status=206)
+        cache_filter._process_GET_response(resp, None)
+
+        self.assertFalse(hasattr(cache_filter.cache, 'image_checksum'))
+
 
 class ProcessRequestTestCacheFilter(glance.api.middleware.cache.CacheFilter):
     def __init__(self):
@@ -123,7 +137,8 @@ class ProcessRequestTestCacheFilter(glance.api.middleware.cache.CacheFilter):
             def is_cached(self, image_id):
                 return True
 
-            def get_caching_iter(self, image_id, image_checksum, app_iter):
+            def get_caching_iter(self, image_id, image_checksum, app_iter,
+                                 opened=None):
                 pass
 
             def delete_cached_image(self, image_id):
@@ -132,6 +147,90 @@ class ProcessRequestTestCacheFilter(glance.api.middleware.cache.CacheFilter):
         self.cache = DummyCache()
 
 
+class RangeTestCacheFilter(glance.api.middleware.cache.CacheFilter):
+    def __init__(self, data):
+        class DummyCache(object):
+            def get_image_size(self, image_id):
+                return len(data)
+
+            @contextlib.contextmanager
+            def open_for_read(self, image_id):
+                yield StringIO.StringIO(data)
+
+        self.cache = DummyCache()
+
+
+class CacheFillTestCacheFilter(glance.api.middleware.cache.CacheFilter):
+    def __init__(self, app):
+        class DummyCache(object):
+            dedup = False
+
+            def __init__(self):
+                self.data = None
+
+            def is_cached(self, image_id):
+                return False
+
+            def get_caching_iter(self, image_id, image_checksum, app_iter,
+                                 opened=None):
+                def caching_iter():
+                    self.data = ''
+                    if opened:
+                        opened()
+                    for chunk in app_iter:
+                        self.data += chunk
+                        yield chunk
+
+                return caching_iter()
+
+            def get_following_iter(self, image_id):
+                def following_iter():
+                    yield self.data
+
+                if self.data is not None:
+                    return following_iter()
+
+        self.cache = DummyCache()
+        self.cache_fills = {}
+        self.application = app
+
+
+class DedupTestCacheFilter(glance.api.middleware.cache.CacheFilter):
+    def __init__(self, app, blobs):
+        class DummyCache(object):
+            dedup = True
+
+            def __init__(self):
+                self.cached = {}
+
+            def is_cached(self, image_id):
+                return image_id in self.cached
+
+            def link_image(self, image_id, checksum):
+                if checksum not in blobs:
+                    return False
+                self.cached[image_id] = blobs[checksum]
+                return True
+
+            def get_image_size(self, image_id):
+                return len(self.cached[image_id])
+
+            @contextlib.contextmanager
+            def open_for_read(self, image_id):
+                yield StringIO.StringIO(self.cached[image_id])
+
+            def get_caching_iter(self, image_id, image_checksum, app_iter,
+                                 opened=None):
+                return app_iter
+
+            def get_following_iter(self, image_id):
+                return None
+
+        self.cache = DummyCache()
+        self.cache_fills = {}
+        self.application = app
+
+
 class TestCacheMiddlewareProcessRequest(unittest.TestCase):
     def setUp(self):
         super(TestCacheMiddlewareProcessRequest, self).setUp()
@@ -178,3 +277,191 @@ class TestCacheMiddlewareProcessRequest(unittest.TestCase):
                        fake_process_v1_request)
         cache_filter.process_request(request)
         self.assertTrue(image_id in cache_filter.cache.deleted_images)
+
+    def test_process_v1_request_not_modified(self):
+        def fake_get_image_metadata(context, image_id):
+            return {'deleted': False, 'size': 19, 'checksum': 'abc123',
+                    'updated_at': '2012-05-16T15:27:36'}
+
+        image_id = 'test1'
+        cache_filter = RangeTestCacheFilter('chunk00000remainder')
+        opened = []
+        open_for_read = cache_filter.cache.open_for_read
+        cache_filter.cache.open_for_read = (
+                lambda image_id: opened.append(image_id) or
+                open_for_read(image_id))
+        self.stubs.Set(registry, 'get_image_metadata',
+                       fake_get_image_metadata)
+
+        for header, value in (('If-None-Match', '"abc123"'),
+                              ('If-Modified-Since',
+                               'Wed, 16 May 2012 15:27:36 GMT')):
+            request = webob.Request.blank('/v1/images/%s' % image_id)
+            request.context = context.RequestContext()
+            request.headers[header] = value
+            image_iterator = cache_filter.get_from_cache(image_id)
+            try:
+                cache_filter._process_v1_request(request, image_id,
+                                                 image_iterator)
+            except webob.exc.HTTPNotModified as e:
+                self.assertEqual('abc123', e.headers['ETag'])
+            else:
+                self.fail('%s did not result in HTTPNotModified' % header)
+        self.assertEqual([], opened)
+
+    def test_process_v2_request_with_range(self):
+        image_id = 'test1'
+        request = webob.Request.blank('/v2/images/%s/file' % image_id)
+        request.headers['Range'] = 'bytes=5-9'
+        cache_filter = RangeTestCacheFilter('chunk00000remainder')
+        image_iterator = cache_filter.get_from_cache(image_id)
+        response = cache_filter._process_v2_request(request, image_id,
+                                                    image_iterator)
+        self.assertEqual(206, response.status_int)
+        self.assertEqual('bytes 5-9/19', response.headers['Content-Range'])
+        self.assertEqual('5', response.headers['Content-Length'])
+        self.assertEqual('00000', response.body)
+
+    def test_process_v2_request_with_unsatisfiable_range(self):
+        image_id = 'test1'
+        request = webob.Request.blank('/v2/images/%s/file' % image_id)
+        request.headers['Range'] = 'bytes=50-'
+        cache_filter = RangeTestCacheFilter('chunk00000remainder')
+        image_iterator = cache_filter.get_from_cache(image_id)
+        self.assertRaises(webob.exc.HTTPRequestRangeNotSatisfiable,
+                          cache_filter._process_v2_request,
+                          request, image_id, image_iterator)
+
+    def test_process_v2_request_sendable(self):
+        image_id = 'test1'
+        request = webob.Request.blank('/v2/images/%s/file' % image_id)
+        cache_filter = RangeTestCacheFilter('chunk00000remainder')
+        image_iterator = cache_filter.get_from_cache(image_id)
+        response = cache_filter._process_v2_request(request, image_id,
+                                                    image_iterator)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual('19', response.headers['Content-Length'])
+        self.assertTrue(isinstance(response.app_iter, utils.FileWrapper))
+        self.assertEqual('chunk00000remainder', response.body)
+
+    def test_concurrent_cache_misses_fetch_once(self):
+        """
+        Test that of concurrent requests for an image that is not cached,
+        only the first fetches it, the others reading it from the cache
+        as the first request caches it
+        """
+        fetches = []
+
+        def fake_app(environ, start_response):
+            fetches.append(environ['PATH_INFO'])
+            # Let the other request arrive while this one fetches
+            eventlet.sleep(0)
+            start_response('200 OK', [])
+            return ['image data']
+
+        cache_filter = CacheFillTestCacheFilter(fake_app)
+
+        def download():
+            request = webob.Request.blank('/v2/images/test1/file')
+            return request.get_response(cache_filter)
+
+        first = eventlet.spawn(download)
+        second = eventlet.spawn(download)
+        self.assertEqual('image data', first.wait().body)
+        self.assertEqual('image data', second.wait().body)
+        self.assertEqual(['/v2/images/test1/file'], fetches)
+        self.assertEqual({}, cache_filter.cache_fills)
+
+    def _get_cache_fill_filter(self, fetches):
+        def fake_app(environ, start_response):
+            fetches.append(environ['PATH_INFO'])
+            start_response('200 OK', [])
+            return ['image data']
+
+        return CacheFillTestCacheFilter(fake_app)
+
+    def _get_cache_fill_request(self):
+        request = webob.Request.blank('/v2/images/test1/file')
+        request.environ['eventlet.posthooks'] = []
+        return request
+
+    def test_cache_miss_waits_for_caching_to_start(self):
+        """
+        Test that a request for an image that another request is about
+        to fetch waits until the image is being cached, which only
+        starts once the server reads the body of the other response
+        """
+        fetches = []
+        cache_filter = self._get_cache_fill_filter(fetches)
+        first = cache_filter(self._get_cache_fill_request())
+
+        second = eventlet.spawn(self._get_cache_fill_request().get_response,
+                                cache_filter)
+        eventlet.sleep(0)
+        self.assertEqual(['/v2/images/test1/file'], fetches)
+        self.assertEqual(['test1'], cache_filter.cache_fills.keys())
+
+        self.assertEqual('image data', first.body)
+        self.assertEqual('image data', second.wait().body)
+        self.assertEqual(['/v2/images/test1/file'], fetches)
+        self.assertEqual({}, cache_filter.cache_fills)
+
+    def test_cache_miss_woken_once_response_sent(self):
+        """
+        Test that the requests waiting for another request to cache an
+        image are woken once its response has been sent, even if the
+        image was not cached
+        """
+        fetches = []
+        cache_filter = self._get_cache_fill_filter(fetches)
+        request = self._get_cache_fill_request()
+        cache_filter(request)
+
+        second = eventlet.spawn(self._get_cache_fill_request().get_response,
+                                cache_filter)
+        eventlet.sleep(0)
+        self.assertEqual(1, len(fetches))
+
+        for hook, args, kwargs in request.environ['eventlet.posthooks']:
+            hook(request.environ, *args, **kwargs)
+        self.assertEqual('image data', second.wait().body)
+        self.assertEqual(2, len(fetches))
+        self.assertEqual({}, cache_filter.cache_fills)
+
+    def test_cache_miss_with_range_is_not_coalesced(self):
+        image_id = 'test1'
+        request = webob.Request.blank('/v2/images/%s/file' % image_id)
+        request.headers['Range'] = 'bytes=5-9'
+        cache_filter = CacheFillTestCacheFilter(None)
+        cache_filter.cache.data = 'image data'
+        self.assertEqual(None, cache_filter.process_request(request))
+        self.assertEqual({}, cache_filter.cache_fills)
+
+    def test_cache_miss_linked_by_checksum(self):
+        fetches = []
+
+        def fake_app(environ, start_response):
+            fetches.append(environ['PATH_INFO'])
+            start_response('200 OK', [])
+            return ['other data']
+
+        def fake_get_image_metadata(context, image_id):
+            checksums = {'test1': 'abc', 'test2': 'def'}
+            return {'deleted': False, 'checksum': checksums[image_id]}
+
+        self.stubs.Set(registry, 'get_image_metadata',
+                       fake_get_image_metadata)
+        cache_filter = DedupTestCacheFilter(fake_app, {'abc': 'image data'})
+
+        request = webob.Request.blank('/v2/images/test1/file')
+        request.context = context.RequestContext()
+        response = request.get_response(cache_filter)
+        self.assertEqual('image data', response.body)
+        self.assertEqual([], fetches)
+        self.assertTrue(cache_filter.cache.is_cached('test1'))
+
+        request = webob.Request.blank('/v2/images/test2/file')
+        request.context = context.RequestContext()
+        response = request.get_response(cache_filter)
+        self.assertEqual('other data', response.body)
+        self.assertEqual(['/v2/images/test2/file'], fetches)
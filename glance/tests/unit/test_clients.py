@@ -1008,6 +1008,35 @@ class TestRegistryClient(base.IsolatedUnitTest):
                           self.client.delete_image,
                           _gen_uuid())
 
+    def test_get_images_by_ids(self):
+        """Tests that many images are fetched in batches"""
+        self.client.BATCH_SIZE = 1
+        images = self.client.get_images_by_ids([UUID1, UUID2, _gen_uuid()])
+        self.assertEquals(set([UUID1, UUID2]), set(i['id'] for i in images))
+        image = [i for i in images if i['id'] == UUID1][0]
+        self.assertEquals({'type': 'kernel'}, image['properties'])
+
+    def test_update_images(self):
+        """Tests that the status of many images is updated"""
+        images = self.client.update_images([UUID1, UUID2],
+                                           {'status': 'killed'})
+        self.assertEquals(['killed', 'killed'], [i['status'] for i in images])
+        for image_id in (UUID1, UUID2):
+            self.assertEquals('killed',
+                              self.client.get_image(image_id)['status'])
+
+    def test_update_images_properties(self):
+        """Tests that properties cannot be updated on many images"""
+        self.assertRaises(exception.Invalid,
+                          self.client.update_images,
+                          [UUID1], {'properties': {'type': 'ramdisk'}})
+
+    def test_delete_images(self):
+        """Tests that many images are deleted"""
+        images = self.client.delete_images([UUID1, UUID2, _gen_uuid()])
+        self.assertEquals(set([UUID1, UUID2]), set(i['id'] for i in images))
+        self.assertEquals(0, len(self.client.get_images()))
+
     def test_get_image_members(self):
         """Tests getting image members"""
         memb_list = self.client.get_image_members(UUID2)
@@ -70,6 +70,25 @@ class TestStore(base.IsolatedUnitTest):
         self.assertEqual(expected_data, data)
         self.assertEqual(expected_num_chunks, num_chunks)
 
+    def test_get_range(self):
+        """Test retrieval of a byte range of an image"""
+        ChunkedFile.CHUNKSIZE = 4
+        image_id = uuidutils.generate_uuid()
+        file_contents = "chunk00000remainder"
+        image_file = StringIO.StringIO(file_contents)
+        self.store.add(image_id, image_file, len(file_contents))
+
+        uri = "file:///%s/%s" % (self.test_dir, image_id)
+        loc = get_location_from_uri(uri)
+
+        (image_file, range_size) = self.store.get_range(loc, 5, 5)
+        self.assertEqual(5, range_size)
+        self.assertEqual("00000", ''.join(image_file))
+
+        (image_file, range_size) = self.store.get_range(loc, 10)
+        self.assertEqual(9, range_size)
+        self.assertEqual("remainder", ''.join(image_file))
+
     def test_get_non_existing(self):
         """
         Test that trying to retrieve a file that doesn't exist
@@ -20,13 +20,17 @@ import hashlib
 import os
 import random
 import shutil
+import sqlite3
 import StringIO
 
+import eventlet
 import stubout
 
 from glance.common import exception
 from glance.common import utils
 from glance import image_cache
+from glance.image_cache.drivers import sqlite as sqlite_driver
+from glance.image_cache import eviction
 #NOTE(bcwaldon): This is imported to load the registry config options
 import glance.registry
 from glance.tests import utils as test_utils
@@ -86,6 +90,19 @@ class ImageCacheTestCase(object):
 
         self.assertEqual(FIXTURE_DATA, buff.getvalue())
 
+    @skip_if_disabled
+    def test_record_hit(self):
+        """
+        Test that hits on images read without opening their file are
+        counted as well
+        """
+        self._setup_fixture_file()
+
+        self.cache.driver.record_hit(1)
+
+        self.assertEqual(1, self.cache.get_hit_count(1))
+        self.assertEqual(1, self.cache.get_cached_images()[0]['hits'])
+
     @skip_if_disabled
     def test_get_image_size(self):
         """
@@ -185,6 +202,154 @@ class ImageCacheTestCase(object):
             self.assertTrue(self.cache.is_cached(x),
                             "Image %s was not cached!" % x)
 
+    def _setup_dedup(self):
+        self.config(image_cache_dedup=True)
+        self.cache = image_cache.ImageCache()
+        self.checksum = hashlib.md5(FIXTURE_DATA).hexdigest()
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file(1, FIXTURE_FILE))
+
+    def _cache_and_delete(self, image_id, data=FIXTURE_DATA):
+        FIXTURE_FILE = StringIO.StringIO(data)
+        self.assertTrue(self.cache.cache_image_file(image_id, FIXTURE_FILE))
+        self.cache.delete_cached_image(image_id)
+
+    @skip_if_disabled
+    def test_link_image(self):
+        """
+        Test that an image whose data was found to have the same checksum
+        as a cached image is cached again without writing its data
+        """
+        self._setup_dedup()
+        self.assertFalse(self.cache.link_image(2, self.checksum))
+        self._cache_and_delete(2)
+        self.assertFalse(self.cache.is_cached(2))
+        self.assertFalse(self.cache.link_image(2, 'nonexistent'))
+        self.assertFalse(self.cache.is_cached(2))
+
+        self.assertTrue(self.cache.link_image(2, self.checksum))
+        self.assertTrue(self.cache.is_cached(2))
+        self.assertFalse(self.cache.link_image(2, self.checksum))
+        with self.cache.open_for_read(2) as cache_file:
+            self.assertEqual(FIXTURE_DATA, cache_file.read())
+        self.assertEqual(1024, self.cache.get_cache_size())
+        inodes = [e['inode'] for e in self.cache.get_cached_images()]
+        self.assertNotEqual(None, inodes[0])
+        self.assertEqual([inodes[0]] * 2, inodes)
+
+        blob_path = self.cache.driver.get_blob_filepath(self.checksum)
+        self.cache.delete_cached_image(1)
+        self.assertTrue(os.path.exists(blob_path))
+        self.cache.delete_cached_image(2)
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertEqual(set(), self.cache.driver.get_blob_owners(
+                self.checksum))
+
+    @skip_if_disabled
+    def test_link_image_claiming_checksum(self):
+        """
+        Test that an image registered with the checksum of another image,
+        but other data, is not linked to the data of the other image
+        """
+        self._setup_dedup()
+        other_data = '+' * FIXTURE_LENGTH
+        self.assertFalse(self.cache.link_image(2, self.checksum))
+        self.assertFalse(self.cache.is_cached(2))
+
+        # Fetched from the store, the data does not match the checksum
+        caching_iter = self.cache.get_caching_iter(2, self.checksum,
+                                                   iter([other_data]))
+        self.assertRaises(exception.GlanceException, list, caching_iter)
+        self.assertFalse(self.cache.is_cached(2))
+        self.assertFalse(self.cache.link_image(2, self.checksum))
+
+        self._cache_and_delete(2, other_data)
+        self.assertFalse(self.cache.link_image(2, self.checksum))
+        self.assertFalse(self.cache.is_cached(2))
+
+    @skip_if_disabled
+    def test_link_image_disabled(self):
+        self._setup_dedup()
+        self.config(image_cache_dedup=False)
+        cache = image_cache.ImageCache()
+        self.assertFalse(cache.link_image(2, self.checksum))
+        self.assertFalse(cache.is_cached(2))
+
+    @skip_if_disabled
+    def test_prune_linked_images(self):
+        """
+        Test that pruning counts the data of linked images once, and
+        prunes it along with all the images linked to it
+        """
+        self._setup_dedup()
+        self.cache.policy = eviction.get_policy('lfu')
+        for x in xrange(2, 4):
+            self._cache_and_delete(x)
+            self.assertTrue(self.cache.link_image(x, self.checksum))
+        for x in xrange(4, 9):
+            FIXTURE_FILE = StringIO.StringIO(str(x) * FIXTURE_LENGTH)
+            self.assertTrue(self.cache.cache_image_file(x, FIXTURE_FILE))
+            with self.cache.open_for_read(x) as cache_file:
+                cache_file.read()
+
+        self.assertEqual(6 * 1024, self.cache.get_cache_size())
+        self.assertEqual((3, 1024), self.cache.prune())
+
+        for x in xrange(1, 4):
+            self.assertFalse(self.cache.is_cached(x),
+                             "Image %s was cached!" % x)
+        self.assertEqual(5 * 1024, self.cache.get_cache_size())
+        blob_path = self.cache.driver.get_blob_filepath(self.checksum)
+        self.assertFalse(os.path.exists(blob_path))
+
+    @skip_if_disabled
+    def test_prune_lfu(self):
+        """
+        Test that pruning the cache with the LFU policy keeps the
+        images that were read from the cache...
+        """
+        self.cache.policy = eviction.get_policy('lfu')
+        for x in xrange(0, 10):
+            FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+            self.assertTrue(self.cache.cache_image_file(x,
+                                                        FIXTURE_FILE))
+
+        # Only hit the images cached first, so they are also the least
+        # recently accessed ones
+        for x in xrange(0, 5):
+            with self.cache.open_for_read(x) as cache_file:
+                for chunk in cache_file:
+                    pass
+
+        self.assertEqual((5, 5 * 1024), self.cache.prune())
+
+        for x in xrange(0, 5):
+            self.assertTrue(self.cache.is_cached(x),
+                            "Image %s was not cached!" % x)
+
+        for x in xrange(5, 10):
+            self.assertFalse(self.cache.is_cached(x),
+                             "Image %s was cached!" % x)
+
+    @skip_if_disabled
+    def test_prune_saves_policy_state(self):
+        """
+        Test that the next prune, even by another process, starts with
+        the state an eviction policy learnt in the last one
+        """
+        self.config(image_cache_eviction_policy='arc')
+        self.cache.policy = eviction.get_policy('arc')
+        for x in xrange(0, 10):
+            FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+            self.assertTrue(self.cache.cache_image_file(x, FIXTURE_FILE))
+        self.assertEqual((5, 5 * 1024), self.cache.prune())
+        ghosts = self.cache.policy.recent_ghosts.keys()
+        self.assertEqual(5, len(ghosts))
+
+        cache = image_cache.ImageCache()
+        cache._load_policy_state()
+        self.assertEqual(ghosts, cache.policy.recent_ghosts.keys())
+
     @skip_if_disabled
     def test_prune_to_zero(self):
         """Test that an image_cache_max_size of 0 doesn't kill the pruner
@@ -371,6 +536,132 @@ class ImageCacheTestCase(object):
         self.assertFalse(os.path.exists(incomplete_file_path))
         self.assertTrue(os.path.exists(invalid_file_path))
 
+    @skip_if_disabled
+    def test_following_iter(self):
+        """
+        Test that an image can be read while it is being cached, the
+        reader waiting for the writer to finish
+        """
+        data = ['a' * 100, 'b' * 100, 'c' * 100]
+
+        def slow_backend():
+            for chunk in data:
+                yield chunk
+                eventlet.sleep(0.01)
+
+        image_id = '1'
+        self.assertEqual(None, self.cache.get_following_iter(image_id))
+
+        caching_iter = self.cache.get_caching_iter(image_id, None,
+                                                   slow_backend())
+        self.assertEqual(data[0], caching_iter.next())
+        following_iter = self.cache.get_following_iter(image_id)
+        writer = eventlet.spawn(list, caching_iter)
+
+        self.assertEqual(''.join(data), ''.join(following_iter))
+        self.assertEqual(data[1:], writer.wait())
+        self.assertTrue(self.cache.is_cached(image_id))
+
+    @skip_if_disabled
+    def test_following_iter_when_caching_fails(self):
+        """
+        Test that reading an image while it is being cached fails when
+        caching the image fails
+        """
+        def faulty_backend():
+            yield 'a' * 100
+            eventlet.sleep(0.01)
+            raise exception.GlanceException('Backend failure')
+
+        image_id = '1'
+        caching_iter = self.cache.get_caching_iter(image_id, None,
+                                                   faulty_backend())
+        caching_iter.next()
+        following_iter = self.cache.get_following_iter(image_id)
+
+        def consume():
+            self.assertRaises(exception.GlanceException, list, caching_iter)
+
+        writer = eventlet.spawn(consume)
+        self.assertRaises(exception.GlanceException, list, following_iter)
+        writer.wait()
+        self.assertFalse(self.cache.is_cached(image_id))
+
+    @skip_if_disabled
+    def test_following_iter_times_out(self):
+        """
+        Test that reading an image while it is being cached gives up
+        when no more data is written
+        """
+        self.config(image_cache_follow_timeout=0)
+        image_id = '1'
+        caching_iter = self.cache.get_caching_iter(image_id, None,
+                                                   iter(['a', 'b']))
+        caching_iter.next()
+        following_iter = self.cache.get_following_iter(image_id)
+        self.assertRaises(exception.GlanceException, list, following_iter)
+        caching_iter.close()
+
+    @skip_if_disabled
+    def test_following_iter_opened_after_caching(self):
+        """
+        Test that an image can be read in full when the request caching
+        it finishes before the reader starts reading
+        """
+        image_id = '1'
+        caching_iter = self.cache.get_caching_iter(image_id, None,
+                                                   iter(['a', 'b']))
+        caching_iter.next()
+        following_iter = self.cache.get_following_iter(image_id)
+        self.assertEqual(['b'], list(caching_iter))
+        self.assertTrue(self.cache.is_cached(image_id))
+        self.assertEqual('ab', ''.join(following_iter))
+
+    @skip_if_disabled
+    def test_caching_iter_opened(self):
+        """
+        Test that the caller of get_caching_iter() is told once the
+        image file can be followed
+        """
+        opened = []
+        image_id = '1'
+
+        def notify_opened():
+            opened.append(self.cache.driver.is_being_cached(image_id))
+
+        caching_iter = self.cache.get_caching_iter(image_id, None,
+                                                   iter(['a', 'b']),
+                                                   notify_opened)
+        self.assertEqual([], opened)
+        caching_iter.next()
+        self.assertEqual([True], opened)
+        list(caching_iter)
+        self.assertEqual([True], opened)
+
+        # The image is cached now, so it won't be cached again
+        opened = []
+        caching_iter = self.cache.get_caching_iter(image_id, None,
+                                                   iter(['a', 'b']),
+                                                   notify_opened)
+        self.assertEqual([False], opened)
+
+    @skip_if_disabled
+    def test_caching_iter_opened_when_open_fails(self):
+        opened = []
+
+        def fake_open_for_write(image_id):
+            raise IOError('Disk full')
+
+        stubs = stubout.StubOutForTesting()
+        stubs.Set(self.cache.driver, 'open_for_write', fake_open_for_write)
+        try:
+            caching_iter = self.cache.get_caching_iter(
+                '1', None, iter(['a', 'b']), lambda: opened.append(True))
+            self.assertEqual(['a', 'b'], list(caching_iter))
+        finally:
+            stubs.UnsetAll()
+        self.assertEqual([True], opened)
+
     def test_gate_caching_iter_good_checksum(self):
         image = "12345678990abcdefghijklmnop"
         image_id = 123
@@ -449,6 +740,44 @@ class TestImageCacheXattr(test_utils.BaseTestCase,
         if os.path.exists(self.cache_dir):
             shutil.rmtree(self.cache_dir)
 
+    @skip_if_disabled
+    def test_index_answers_without_stat(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        with self.cache.open_for_read('xxx') as cache_file:
+            cache_file.read()
+
+        def fake_stat(path):
+            self.fail("Cache directory scanned for %s" % path)
+
+        stubs = stubout.StubOutForTesting()
+        stubs.Set(os, 'stat', fake_stat)
+        try:
+            self.assertEqual(1024, self.cache.get_cache_size())
+            self.assertEqual(1, self.cache.get_hit_count('xxx'))
+            cached_images = self.cache.get_cached_images()
+            self.assertEqual(['xxx'], [i['image_id'] for i in cached_images])
+            self.assertEqual(('xxx', 1024),
+                             self.cache.driver.get_least_recently_accessed())
+        finally:
+            stubs.UnsetAll()
+
+        self.cache.delete_cached_image('xxx')
+        self.assertEqual(0, self.cache.get_cache_size())
+        self.assertEqual([], self.cache.get_cached_images())
+
+    @skip_if_disabled
+    def test_index_rescan(self):
+        # An image cached by another process is only seen once the
+        # cache directory is scanned again
+        with open(os.path.join(self.cache_dir, 'xxx'), 'wb') as cache_file:
+            cache_file.write(FIXTURE_DATA)
+        self.assertEqual(0, self.cache.get_cache_size())
+
+        self.config(image_cache_xattr_rescan_interval=0)
+        self.assertEqual(1024, self.cache.get_cache_size())
+        self.assertEqual(0, self.cache.get_hit_count('xxx'))
+
 
 class TestImageCacheSqlite(test_utils.BaseTestCase,
                            ImageCacheTestCase):
@@ -488,6 +817,229 @@ class TestImageCacheSqlite(test_utils.BaseTestCase,
         if os.path.exists(self.cache_dir):
             shutil.rmtree(self.cache_dir)
 
+    def _get_stored_hits(self, image_id):
+        conn = sqlite3.connect(self.cache.driver.db_path)
+        try:
+            cur = conn.execute("""SELECT hits FROM cached_images
+                               WHERE image_id = ?""", (image_id,))
+            return cur.fetchone()[0]
+        finally:
+            conn.close()
+
+    @skip_if_disabled
+    def test_link_image_accessed(self):
+        self._setup_dedup()
+        self._cache_and_delete(2)
+        self.assertTrue(self.cache.link_image(2, self.checksum))
+        cached_images = self.cache.get_cached_images()
+        self.assertNotEqual(0, cached_images[1]['last_accessed'])
+
+    @skip_if_disabled
+    def test_inode_column_added(self):
+        conn = sqlite3.connect(self.cache.driver.db_path)
+        try:
+            conn.executescript("""
+                DROP TABLE cached_images;
+                CREATE TABLE cached_images (
+                    image_id TEXT PRIMARY KEY,
+                    last_accessed REAL DEFAULT 0.0,
+                    last_modified REAL DEFAULT 0.0,
+                    size INTEGER DEFAULT 0,
+                    hits INTEGER DEFAULT 0,
+                    checksum TEXT
+                );
+                INSERT INTO cached_images (image_id) VALUES ('xxx');
+            """)
+        finally:
+            conn.close()
+
+        cache = image_cache.ImageCache()
+        self.assertEqual([None], [e['inode']
+                                  for e in cache.get_cached_images()])
+        # Databases with the column are left as they are
+        image_cache.ImageCache()
+
+    @skip_if_disabled
+    def test_get_db_rolls_back_on_error(self):
+        def insert_and_fail():
+            with self.cache.driver.get_db() as db:
+                db.execute("""INSERT INTO cached_images (image_id)
+                           VALUES ('xxx')""")
+                raise ValueError()
+
+        self.assertRaises(ValueError, insert_and_fail)
+        self.assertEqual([], self.cache.driver.get_cached_images())
+
+    @skip_if_disabled
+    def test_hits_are_batched(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        for x in xrange(3):
+            with self.cache.open_for_read('xxx') as cache_file:
+                cache_file.read()
+
+        self.assertEqual(0, self._get_stored_hits('xxx'))
+        self.cache.driver.flush_hits()
+        self.assertEqual(3, self._get_stored_hits('xxx'))
+        self.assertEqual(3, self.cache.get_hit_count('xxx'))
+
+    @skip_if_disabled
+    def test_hits_flushed_after_interval(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        scheduled = []
+        stubs = stubout.StubOutForTesting()
+        try:
+            stubs.Set(sqlite_driver, 'spawn_after',
+                      lambda *args: scheduled.append(args) or
+                      eventlet.spawn_after(*args))
+            for x in xrange(2):
+                with self.cache.open_for_read('xxx') as cache_file:
+                    cache_file.read()
+        finally:
+            stubs.UnsetAll()
+
+        # The first hit schedules a flush, which needs no later hit or
+        # listing to write both hits
+        self.assertEqual(1, len(scheduled))
+        self.assertEqual(10, scheduled[0][0])
+        self.assertEqual(0, self._get_stored_hits('xxx'))
+        scheduled[0][1]()
+        self.assertEqual(2, self._get_stored_hits('xxx'))
+
+    @skip_if_disabled
+    def test_hits_flushed_before_listing(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        with self.cache.open_for_read('xxx') as cache_file:
+            cache_file.read()
+
+        cached_images = self.cache.get_cached_images()
+        self.assertEqual(1, cached_images[0]['hits'])
+        self.assertTrue(cached_images[0]['last_accessed'] > 0)
+
+    @skip_if_disabled
+    def test_write_ahead_log(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        with self.cache.driver.get_db() as db:
+            mode = db.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual('wal', mode)
+
+        # The log files are not counted or deleted as cached images
+        self.assertEqual(1024, self.cache.get_cache_size())
+        self.assertEqual(1, self.cache.delete_all_cached_images())
+        self.assertTrue(os.path.exists(self.cache.driver.db_path))
+
+
+class TestImageCacheMemoryTier(test_utils.BaseTestCase):
+
+    """Tests image caching with the memory tier in front of the disk"""
+
+    def setUp(self):
+        super(TestImageCacheMemoryTier, self).setUp()
+        self.cache_dir = os.path.join("/", "tmp", "test.cache.%d" %
+                                      random.randint(0, 1000000))
+        utils.safe_mkdirs(self.cache_dir)
+        self.config(image_cache_dir=self.cache_dir,
+                    image_cache_driver='sqlite',
+                    image_cache_memory_size=4 * 1024,
+                    image_cache_memory_max_image_size=2 * 1024,
+                    image_cache_memory_promote_hits=2)
+        image_cache._MEMORY_CACHE = None
+        self.cache = image_cache.ImageCache()
+        self.stubs = stubout.StubOutForTesting()
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        image_cache._MEMORY_CACHE = None
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+        super(TestImageCacheMemoryTier, self).tearDown()
+
+    def _read(self, image_id):
+        with self.cache.open_for_read(image_id) as cache_file:
+            return cache_file.read()
+
+    def test_promote_after_disk_hits(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+
+        self.assertEqual(FIXTURE_DATA, self._read('xxx'))
+        self.assertFalse('xxx' in self.cache.memory)
+        self.assertEqual(FIXTURE_DATA, self._read('xxx'))
+        self.assertTrue('xxx' in self.cache.memory)
+
+        def fail_open_for_read(image_id):
+            self.fail("Image %s read from disk" % image_id)
+
+        self.stubs.Set(self.cache.driver, 'open_for_read', fail_open_for_read)
+        self.assertEqual(FIXTURE_DATA, self._read('xxx'))
+        self.assertEqual(1024, self.cache.get_image_size('xxx'))
+
+        cached_images = self.cache.get_cached_images()
+        self.assertEqual(3, cached_images[0]['hits'])
+        self.assertEqual(1, cached_images[0]['memory_hits'])
+
+    def test_deleted_by_other_process(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        self._read('xxx')
+        self._read('xxx')
+        self.assertTrue('xxx' in self.cache.memory)
+
+        # Another process shares the cache directory, but not the memory
+        self.cache.driver.delete_cached_image('xxx')
+
+        self.assertFalse(self.cache.is_cached('xxx'))
+        self.assertRaises(IOError, self._read, 'xxx')
+        self.assertFalse('xxx' in self.cache.memory)
+        self.assertEqual(0, self.cache.memory.get_stats()['size'])
+
+    def test_cached_again_by_other_process(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        self._read('xxx')
+        self._read('xxx')
+        self.assertTrue('xxx' in self.cache.memory)
+
+        # Another process shares the cache directory, but not the memory
+        self.cache.driver.delete_cached_image('xxx')
+        FIXTURE_FILE = StringIO.StringIO('+' * 512)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+
+        self.assertEqual('+' * 512, self._read('xxx'))
+        self.assertFalse('xxx' in self.cache.memory)
+
+    def test_memory_tier_shared_by_image_caches(self):
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        self._read('xxx')
+        self._read('xxx')
+
+        other_cache = image_cache.ImageCache()
+        self.assertTrue(other_cache.memory is self.cache.memory)
+        other_cache.delete_cached_image('xxx')
+        self.assertFalse(self.cache.is_cached('xxx'))
+        self.assertEqual(0, self.cache.memory.get_stats()['size'])
+
+    def test_large_images_not_promoted(self):
+        FIXTURE_FILE = StringIO.StringIO('*' * 3 * 1024)
+        self.assertTrue(self.cache.cache_image_file('xxx', FIXTURE_FILE))
+        for x in xrange(3):
+            self._read('xxx')
+        self.assertFalse('xxx' in self.cache.memory)
+
+    def test_memory_tier_disabled(self):
+        self.config(image_cache_memory_size=0)
+        image_cache._MEMORY_CACHE = None
+        cache = image_cache.ImageCache()
+        self.assertEqual(None, cache.memory)
+
+        FIXTURE_FILE = StringIO.StringIO(FIXTURE_DATA)
+        self.assertTrue(cache.cache_image_file('xxx', FIXTURE_FILE))
+        self.assertFalse('memory_hits' in cache.get_cached_images()[0])
+
 
 class TestImageCacheNoDep(test_utils.BaseTestCase):
 
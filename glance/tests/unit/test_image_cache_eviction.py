@@ -0,0 +1,155 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+from glance.image_cache import eviction
+from glance.tests import utils as test_utils
+
+
+def _entry(image_id, size, hits=0, last_accessed=0):
+    return {'image_id': image_id, 'size': size, 'hits': hits,
+            'last_accessed': last_accessed}
+
+
+class TestEvictionPolicies(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestEvictionPolicies, self).setUp()
+        # A large cold image accessed last, and small images accessed
+        # earlier but read from the cache several times
+        self.entries = [
+            _entry('small-1', 100, hits=5, last_accessed=1),
+            _entry('small-2', 100, hits=3, last_accessed=2),
+            _entry('small-3', 100, hits=0, last_accessed=3),
+            _entry('large', 1000, hits=1, last_accessed=4),
+        ]
+
+    def test_get_policy(self):
+        for name, policy_class in eviction.POLICIES.items():
+            self.assertTrue(isinstance(eviction.get_policy(name),
+                                       policy_class))
+
+    def test_get_unknown_policy(self):
+        policy = eviction.get_policy('random')
+        self.assertTrue(isinstance(policy, eviction.LRUPolicy))
+
+    def test_lru(self):
+        victims = eviction.LRUPolicy().select_victims(self.entries, 150)
+        self.assertEqual([('small-1', 100), ('small-2', 100)], victims)
+
+    def test_lfu(self):
+        victims = eviction.LFUPolicy().select_victims(self.entries, 150)
+        self.assertEqual([('small-3', 100), ('large', 1000)], victims)
+
+    def test_gdsf(self):
+        victims = eviction.GDSFPolicy().select_victims(self.entries, 150)
+        self.assertEqual([('large', 1000)], victims)
+
+    def test_gdsf_ages_out_unread_images(self):
+        policy = eviction.GDSFPolicy()
+        policy.select_victims(self.entries, 150)
+        self.assertAlmostEqual(2.0 / 1000, policy.inflation)
+        # small-3 is read often after large was pruned, so it now ranks
+        # above the images that have not been read since
+        entries = [e for e in self.entries if e['image_id'] != 'large']
+        entries[2] = _entry('small-3', 100, hits=5, last_accessed=5)
+        victims = policy.select_victims(entries, 100)
+        self.assertEqual([('small-2', 100)], victims)
+
+    def test_arc(self):
+        victims = eviction.ARCPolicy().select_victims(self.entries, 150)
+        self.assertEqual([('small-1', 100), ('small-2', 100)], victims)
+
+    def test_arc_adapts_to_recently_pruned_images(self):
+        policy = eviction.ARCPolicy()
+        entries = [
+            _entry('once-1', 100, last_accessed=1),
+            _entry('once-2', 100, last_accessed=2),
+            _entry('often-1', 100, hits=2, last_accessed=3),
+            _entry('often-2', 100, hits=2, last_accessed=4),
+        ]
+        self.assertEqual([('once-1', 100)],
+                         policy.select_victims(entries, 100))
+
+        # once-1 is cached again, so images read only once are given
+        # more room and an image read often is pruned instead
+        entries[0] = _entry('once-1', 100, last_accessed=5)
+        self.assertEqual([('often-1', 100)],
+                         policy.select_victims(entries, 100))
+
+    def test_state_restored(self):
+        entries = [
+            _entry('once-1', 100, last_accessed=1),
+            _entry('once-2', 100, last_accessed=2),
+            _entry('often-1', 100, hits=2, last_accessed=3),
+            _entry('often-2', 100, hits=2, last_accessed=4),
+        ]
+        for name in ('gdsf', 'arc'):
+            policy = eviction.get_policy(name)
+            victims = policy.select_victims(entries, 100)
+            state = json.loads(json.dumps(policy.get_state()))
+
+            # A new policy given the saved state makes the same choice
+            # as the policy that saved it
+            remaining = [e for e in entries if e['image_id'] != victims[0][0]]
+            remaining.append(_entry(victims[0][0], 100, last_accessed=5))
+            restored = eviction.get_policy(name)
+            restored.set_state(state)
+            self.assertEqual(policy.select_victims(remaining, 100),
+                             restored.select_victims(remaining, 100))
+            self.assertEqual(policy.get_state(), restored.get_state())
+
+    def test_stateless_policies(self):
+        for name in ('lru', 'lfu'):
+            self.assertEqual(None, eviction.get_policy(name).get_state())
+
+    def test_nothing_to_free(self):
+        for name in eviction.POLICIES:
+            policy = eviction.get_policy(name)
+            self.assertEqual([], policy.select_victims(self.entries, 0))
+
+    def test_free_more_than_cached(self):
+        for name in eviction.POLICIES:
+            policy = eviction.get_policy(name)
+            victims = policy.select_victims(self.entries, 10000)
+            self.assertEqual(4, len(victims))
+
+
+class TestSimulate(test_utils.BaseTestCase):
+
+    def test_simulate(self):
+        trace = [('a', 10), ('b', 10), ('a', 10), ('c', 10), ('a', 10),
+                 ('b', 10)]
+        result = eviction.simulate(eviction.LRUPolicy(), trace, 20)
+        self.assertEqual(6, result['reads'])
+        # a is hit twice, b is pruned when c is cached
+        self.assertEqual(2, result['hits'])
+        self.assertEqual(20, result['bytes_hit'])
+        self.assertAlmostEqual(2.0 / 6, result['hit_ratio'])
+
+    def test_simulate_size_aware(self):
+        trace = [('large', 100), ('small-1', 10), ('small-2', 10)] * 10
+        lru = eviction.simulate(eviction.LRUPolicy(), trace, 100)
+        gdsf = eviction.simulate(eviction.GDSFPolicy(), trace, 100)
+        self.assertEqual(0, lru['hits'])
+        self.assertTrue(gdsf['hit_ratio'] > lru['hit_ratio'])
+
+    def test_simulate_empty_trace(self):
+        result = eviction.simulate(eviction.LFUPolicy(), [], 100)
+        self.assertEqual(0, result['reads'])
+        self.assertEqual(0.0, result['hit_ratio'])
@@ -0,0 +1,96 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from glance.image_cache import memory
+from glance.tests import utils as test_utils
+
+
+class TestMemoryCache(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestMemoryCache, self).setUp()
+        self.cache = memory.MemoryCache(max_size=10, max_image_size=6,
+                                        promote_hits=2)
+
+    def test_get_miss(self):
+        self.assertEqual(None, self.cache.get('a', 1))
+        self.assertEqual(1, self.cache.get_stats()['misses'])
+
+    def test_put_and_get(self):
+        self.cache.put('a', 'aaaa', 1)
+        self.assertTrue('a' in self.cache)
+        self.assertEqual('aaaa', self.cache.get('a', 1))
+        self.assertEqual(4, self.cache.get_image_size('a'))
+        self.assertEqual(1, self.cache.get_hit_count('a'))
+        stats = self.cache.get_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['images'])
+        self.assertEqual(4, stats['size'])
+
+    def test_get_other_identity(self):
+        self.cache.put('a', 'aaaa', 1)
+        self.assertEqual(None, self.cache.get('a', 2))
+        self.assertFalse('a' in self.cache)
+        stats = self.cache.get_stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0, stats['size'])
+
+    def test_should_promote_after_promote_hits(self):
+        self.assertFalse(self.cache.should_promote('a', 4))
+        self.assertTrue(self.cache.should_promote('a', 4))
+
+    def test_should_not_promote_large_images(self):
+        for x in xrange(3):
+            self.assertFalse(self.cache.should_promote('a', 7))
+
+    def test_put_evicts_least_recently_used(self):
+        self.cache.put('a', 'aaaa', 1)
+        self.cache.put('b', 'bbbb', 1)
+        self.cache.get('a', 1)
+        self.cache.put('c', 'cccc', 1)
+        self.assertTrue('a' in self.cache)
+        self.assertFalse('b' in self.cache)
+        self.assertTrue('c' in self.cache)
+        stats = self.cache.get_stats()
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(8, stats['size'])
+
+    def test_put_too_large(self):
+        self.cache.put('a', 'a' * 11, 1)
+        self.assertFalse('a' in self.cache)
+        self.assertEqual(0, self.cache.get_stats()['size'])
+
+    def test_put_again_replaces(self):
+        self.cache.put('a', 'aaaa', 1)
+        self.cache.put('a', 'aa', 1)
+        self.assertEqual(2, self.cache.get_stats()['size'])
+
+    def test_delete(self):
+        self.cache.put('a', 'aaaa', 1)
+        self.cache.get('a', 1)
+        self.cache.delete('a')
+        self.assertFalse('a' in self.cache)
+        self.assertEqual(None, self.cache.get_image_size('a'))
+        self.assertEqual(0, self.cache.get_hit_count('a'))
+        self.assertEqual(0, self.cache.get_stats()['size'])
+
+    def test_clear(self):
+        self.cache.put('a', 'aaaa', 1)
+        self.cache.put('b', 'bbbb', 1)
+        self.cache.clear()
+        self.assertFalse('a' in self.cache)
+        self.assertEqual(0, self.cache.get_stats()['size'])
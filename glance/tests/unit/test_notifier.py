@@ -16,6 +16,13 @@
 #    under the License.
 
 import datetime
+import errno
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
 import kombu.entity
 import mox
 try:
@@ -28,6 +35,8 @@ import stubout
 from glance.common import exception
 from glance import notifier
 import glance.notifier.notify_kombu
+from glance.notifier import outbox
+from glance.notifier import strategy
 from glance.openstack.common import importutils
 import glance.openstack.common.log as logging
 from glance.tests import utils
@@ -52,6 +61,23 @@ class ImageRepoStub(object):
         return 'image_from_add'
 
 
+class RecordingStrategy(strategy.Strategy):
+    """Records the batches of messages it is asked to send"""
+
+    batches = []
+
+    def notify_batch(self, messages):
+        self.batches.append([msg['payload'] for msg in messages])
+        return len(messages)
+
+
+class FailingStrategy(strategy.Strategy):
+
+    def info(self, msg):
+        if msg['payload'] == 'fail':
+            raise Exception('meow')
+
+
 class TestNotifier(utils.BaseTestCase):
 
     def test_invalid_strategy(self):
@@ -66,6 +92,190 @@ class TestNotifier(utils.BaseTestCase):
         notifier.Notifier()
 
 
+class TestNotifierOutbox(utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestNotifierOutbox, self).setUp()
+        RecordingStrategy.batches = []
+        self.test_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.test_dir, 'journal')
+        self.stubs = stubout.StubOutForTesting()
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        notifier._OUTBOXES.clear()
+        shutil.rmtree(self.test_dir)
+        super(TestNotifierOutbox, self).tearDown()
+
+    def _message(self, payload, priority='INFO'):
+        return notifier.Notifier.generate_message('test_event', priority,
+                                                  payload)
+
+    def test_async_notifier(self):
+        self.config(notifier_async=True,
+                    notifier_strategy='glance.tests.unit.test_notifier.'
+                                      'RecordingStrategy')
+        notifier_ = notifier.Notifier()
+        notifier_.info('test_event', 'test_message')
+        self.assertEqual([], RecordingStrategy.batches)
+        self.assertTrue(notifier_.outbox.flush(1))
+        self.assertEqual([['test_message']], RecordingStrategy.batches)
+
+        self.assertTrue(notifier.Notifier().outbox is notifier_.outbox)
+        stats = notifier.get_outbox_stats()
+        self.assertEqual(1, stats['glance.tests.unit.test_notifier.'
+                                  'RecordingStrategy']['sent'])
+
+    def test_batches(self):
+        outbox_ = outbox.Outbox(RecordingStrategy, batch_size=2)
+        for i in xrange(5):
+            outbox_.put(self._message(i))
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([[0, 1], [2, 3], [4]], RecordingStrategy.batches)
+        self.assertEqual({'queued': 0, 'sent': 5, 'failed': 0,
+                          'dropped': 0, 'journaled': 0},
+                         outbox_.get_stats())
+
+    def test_drop_oldest(self):
+        outbox_ = outbox.Outbox(RecordingStrategy, max_size=2)
+        for i in xrange(3):
+            outbox_.put(self._message(i))
+        self.assertEqual(1, outbox_.get_stats()['dropped'])
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([[1, 2]], RecordingStrategy.batches)
+
+    def test_block(self):
+        outbox_ = outbox.Outbox(RecordingStrategy, max_size=1,
+                                overflow='block')
+        for i in xrange(3):
+            outbox_.put(self._message(i))
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([0, 1, 2], sum(RecordingStrategy.batches, []))
+        self.assertEqual(0, outbox_.get_stats()['dropped'])
+
+    def test_invalid_overflow(self):
+        self.assertRaises(exception.InvalidNotifierOutboxOverflow,
+                          outbox.Outbox, RecordingStrategy, overflow='meow')
+
+    def test_failures_counted(self):
+        outbox_ = outbox.Outbox(FailingStrategy)
+        outbox_.put(self._message('fail'))
+        outbox_.put(self._message('ok'))
+        self.assertTrue(outbox_.flush(1))
+        stats = outbox_.get_stats()
+        self.assertEqual(1, stats['sent'])
+        self.assertEqual(1, stats['failed'])
+
+    def test_journal(self):
+        outbox_ = outbox.Outbox(RecordingStrategy, max_size=2,
+                                journal_path=self.journal_path)
+        for i in xrange(5):
+            outbox_.put(self._message(i))
+        stats = outbox_.get_stats()
+        self.assertEqual(5, stats['queued'])
+        self.assertEqual(3, stats['journaled'])
+        self.assertEqual(0, stats['dropped'])
+
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([0, 1, 2, 3, 4], sum(RecordingStrategy.batches, []))
+        self.assertFalse(os.path.exists(outbox_.journal_file))
+
+    def test_journal_delivered_after_restart(self):
+        outbox_ = outbox.Outbox(RecordingStrategy, max_size=1,
+                                journal_path=self.journal_path)
+        for i in xrange(3):
+            outbox_.put(self._message(i))
+        outbox_._worker.kill()
+
+        # The first message was only held in memory
+        outbox_ = outbox.Outbox(RecordingStrategy, max_size=1,
+                                journal_path=self.journal_path)
+        self.assertEqual(0, outbox_.get_stats()['queued'])
+        outbox_.start()
+        self.assertEqual(2, outbox_.get_stats()['queued'])
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([1, 2], sum(RecordingStrategy.batches, []))
+
+    def test_journal_delivered_by_forked_process(self):
+        outbox_ = outbox.Outbox(RecordingStrategy, max_size=1,
+                                journal_path=self.journal_path)
+        for i in xrange(3):
+            outbox_.put(self._message(i))
+        outbox_._worker.kill()
+        pid = os.getpid()
+
+        self.stubs.Set(os, 'getpid', lambda: pid + 1)
+        outbox_.put(self._message(3))
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([0, 1, 2, 3], sum(RecordingStrategy.batches, []))
+
+    def test_journal_update_failure(self):
+        outbox_ = outbox.Outbox(RecordingStrategy, max_size=1,
+                                journal_path=self.journal_path)
+
+        def fake_unlink(path):
+            raise OSError(errno.EACCES, 'Permission denied')
+
+        self.stubs.Set(os, 'unlink', fake_unlink)
+        for i in xrange(2):
+            outbox_.put(self._message(i))
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([0], sum(RecordingStrategy.batches, []))
+        self.assertTrue(os.path.exists(outbox_.journal_file))
+
+        # The delivery thread survived, and the journal is retried
+        self.stubs.UnsetAll()
+        outbox_.put(self._message(2))
+        outbox_.put(self._message(3))
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([0, 2, 1, 3], sum(RecordingStrategy.batches, []))
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def test_journal_per_process(self):
+        outboxes = [outbox.Outbox(RecordingStrategy, max_size=1,
+                                  journal_path=self.journal_path)
+                    for i in xrange(2)]
+        # Two workers of a server, both still running
+        for pid, outbox_ in zip((os.getpid(), os.getppid()), outboxes):
+            self.stubs.Set(os, 'getpid', lambda: pid)
+            for i in xrange(3):
+                outbox_.put(self._message('%d-%d' % (pid, i)))
+            self.assertEqual(2, outbox_.get_stats()['journaled'])
+        self.assertNotEqual(outboxes[0].journal_file,
+                            outboxes[1].journal_file)
+
+        for outbox_ in outboxes:
+            self.assertTrue(outbox_.flush(1))
+            self.assertFalse(os.path.exists(outbox_.journal_file))
+        messages = sum(RecordingStrategy.batches, [])
+        self.assertEqual(6, len(messages))
+        self.assertEqual(6, len(set(messages)))
+
+    def test_orphaned_journals_claimed(self):
+        # The pid of a process that has exited
+        process = subprocess.Popen(['true'])
+        process.wait()
+        orphans = [self.journal_path,
+                   '%s.%d' % (self.journal_path, process.pid)]
+        for i, path in enumerate(orphans):
+            with open(path, 'w') as journal:
+                journal.write(json.dumps(self._message(i)) + '\n')
+        # A journal being claimed by a running process
+        claimed_path = '%s.%d.claimed' % (self.journal_path, os.getppid())
+        with open(claimed_path, 'w') as journal:
+            journal.write(json.dumps(self._message(2)) + '\n')
+
+        outbox_ = outbox.Outbox(RecordingStrategy,
+                                journal_path=self.journal_path)
+        outbox_.start()
+        self.assertEqual(2, outbox_.get_stats()['queued'])
+        self.assertTrue(outbox_.flush(1))
+        self.assertEqual([0, 1], sum(RecordingStrategy.batches, []))
+        for path in orphans + [outbox_.journal_file]:
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(claimed_path))
+
+
 class TestLoggingNotifier(utils.BaseTestCase):
     """Test the logging notifier is selected and works properly."""
 
@@ -173,6 +383,17 @@ class TestRabbitNotifier(utils.BaseTestCase):
         self.assertEquals("ERROR", self.called["message"]["priority"])
         self.assertEquals("fake_topic.error", self.called["routing_key"])
 
+    def test_notify_batch(self):
+        strategy = self.notifier.strategy
+        messages = [self.notifier.generate_message('test_event', priority,
+                                                   'test_message')
+                    for priority in ('WARN', 'INFO')]
+        self.sent = []
+        self.notify_kombu.RabbitStrategy._send_message = \
+            lambda rabbit_self, msg, routing_key: self.sent.append(routing_key)
+        self.assertEqual(2, strategy.notify_batch(messages))
+        self.assertEqual(['fake_topic.warn', 'fake_topic.info'], self.sent)
+
     def test_unknown_error_on_connect_raises(self):
         class MyException(Exception):
             pass
@@ -14,6 +14,9 @@
 #    under the License.
 
 import os.path
+import time
+
+import stubout
 
 import glance.api.policy
 from glance.common import exception
@@ -99,6 +102,65 @@ class TestPolicyEnforcer(base.IsolatedUnitTest):
         context = glance.context.RequestContext(roles=[])
         self.assertEqual(enforcer.check(context, 'get_image', {}), False)
 
+    def test_policy_file_checked_on_interval(self):
+        self.config(policy_file_check_interval=60)
+        self.set_policy_rules({"get_image": ''})
+        enforcer = glance.api.policy.Enforcer()
+        enforcer.enforce(glance.context.RequestContext(roles=[]),
+                         'get_image', {})
+
+        # Make sure the policy file's mtime changes
+        os.utime(enforcer.policy_path, (0, 0))
+        self.set_policy_rules({"get_image": '!'})
+        enforcer.enforce(glance.context.RequestContext(roles=[]),
+                         'get_image', {})
+
+        now = time.time()
+        stubs = stubout.StubOutForTesting()
+        try:
+            stubs.Set(time, 'time', lambda: now + 61)
+            self.assertRaises(exception.Forbidden, enforcer.enforce,
+                              glance.context.RequestContext(roles=[]),
+                              'get_image', {})
+        finally:
+            stubs.UnsetAll()
+
+    def test_rules_set_once_while_file_unchanged(self):
+        self.set_policy_rules({"get_image": ''})
+        enforcer = glance.api.policy.Enforcer()
+        rules = []
+        set_rules = enforcer.set_rules
+        enforcer.set_rules = lambda r: rules.append(r) or set_rules(r)
+        for i in xrange(3):
+            enforcer.enforce(glance.context.RequestContext(roles=[]),
+                             'get_image', {})
+        self.assertEqual(1, len(rules))
+
+    def test_decisions_memoized_per_context(self):
+        self.set_policy_rules({"get_image": '', "delete_image": '!'})
+        enforcer = glance.api.policy.Enforcer()
+        checks = []
+        check = glance.api.policy.policy.check
+        stubs = stubout.StubOutForTesting()
+        try:
+            stubs.Set(glance.api.policy.policy, 'check',
+                      lambda *args: checks.append(args) or check(*args))
+            context = glance.context.RequestContext(roles=[])
+            for i in xrange(2):
+                enforcer.enforce(context, 'get_image', {})
+                self.assertRaises(exception.Forbidden, enforcer.enforce,
+                                  context, 'delete_image', {})
+            self.assertEqual(2, len(checks))
+
+            enforcer.enforce(context, 'get_image', {'owner': 'me'})
+            self.assertEqual(3, len(checks))
+
+            enforcer.enforce(glance.context.RequestContext(roles=[]),
+                             'get_image', {})
+            self.assertEqual(4, len(checks))
+        finally:
+            stubs.UnsetAll()
+
 
 class TestPolicyEnforcerNoFile(test_utils.BaseTestCase):
     def test_policy_file_specified_but_not_found(self):
@@ -0,0 +1,176 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import stubout
+
+from glance.common import exception
+from glance import context
+from glance import notifier
+from glance import registry
+from glance.registry import cache
+from glance.tests import utils as test_utils
+
+
+class TestMetadataCache(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestMetadataCache, self).setUp()
+        self.stubs = stubout.StubOutForTesting()
+        self.cache = cache.MetadataCache(max_size=2, ttl=10)
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestMetadataCache, self).tearDown()
+
+    def _put(self, key, image_meta):
+        self.cache.put(key, image_meta, self.cache.generation)
+
+    def test_get_put(self):
+        self.assertEqual(None, self.cache.get(('1', False, 'a')))
+        self._put(('1', False, 'a'), {'id': '1'})
+        self.assertEqual({'id': '1'}, self.cache.get(('1', False, 'a')))
+        self.assertEqual(None, self.cache.get(('1', False, 'b')))
+        self.assertEqual({'hits': 1, 'misses': 2, 'size': 1},
+                         self.cache.get_stats())
+
+    def test_get_returns_copy(self):
+        self._put(('1', False, 'a'), {'id': '1', 'properties': {}})
+        self.cache.get(('1', False, 'a'))['properties']['foo'] = 'bar'
+        self.assertEqual({'id': '1', 'properties': {}},
+                         self.cache.get(('1', False, 'a')))
+
+    def test_least_recently_used_evicted(self):
+        self._put(('1', False, 'a'), {'id': '1'})
+        self._put(('2', False, 'a'), {'id': '2'})
+        self.cache.get(('1', False, 'a'))
+        self._put(('3', False, 'a'), {'id': '3'})
+        self.assertEqual(None, self.cache.get(('2', False, 'a')))
+        self.assertEqual({'id': '1'}, self.cache.get(('1', False, 'a')))
+        self.assertEqual({'id': '3'}, self.cache.get(('3', False, 'a')))
+
+    def test_expired_entries_not_returned(self):
+        now = time.time()
+        self.stubs.Set(time, 'time', lambda: now)
+        self._put(('1', False, 'a'), {'id': '1'})
+        self.stubs.Set(time, 'time', lambda: now + 11)
+        self.assertEqual(None, self.cache.get(('1', False, 'a')))
+        self.assertEqual(0, self.cache.get_stats()['size'])
+
+    def test_invalidate(self):
+        self._put(('1', False, 'a'), {'id': '1'})
+        self._put(('1', True, None), {'id': '1'})
+        self.cache.invalidate('1')
+        self.assertEqual(None, self.cache.get(('1', False, 'a')))
+        self.assertEqual(None, self.cache.get(('1', True, None)))
+
+    def test_put_after_invalidate_ignored(self):
+        generation = self.cache.generation
+        self.cache.invalidate('1')
+        self.cache.put(('1', False, 'a'), {'id': '1'}, generation)
+        self.assertEqual(None, self.cache.get(('1', False, 'a')))
+
+
+class TestRegistryMetadataCache(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestRegistryMetadataCache, self).setUp()
+        self.stubs = stubout.StubOutForTesting()
+        self.config(registry_metadata_cache_size=10)
+        registry.configure_registry_client()
+        self.context = context.RequestContext(tenant='tenant1')
+        self.get_image_calls = 0
+        test = self
+
+        class FakeRegistryClient(object):
+            def get_image(self, image_id):
+                test.get_image_calls += 1
+                if image_id == 'missing':
+                    raise exception.NotFound()
+                return {'id': image_id, 'name': 'image'}
+
+            def update_image(self, image_id, image_meta, purge_props):
+                return image_meta
+
+            def delete_image(self, image_id):
+                return {'id': image_id}
+
+        self.stubs.Set(registry, 'get_registry_client',
+                       lambda cxt: FakeRegistryClient())
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestRegistryMetadataCache, self).tearDown()
+        registry.configure_registry_client()
+
+    def test_metadata_cached(self):
+        for i in xrange(3):
+            image_meta = registry.get_image_metadata(self.context, '1')
+            self.assertEqual({'id': '1', 'name': 'image'}, image_meta)
+        self.assertEqual(1, self.get_image_calls)
+        self.assertEqual({'hits': 2, 'misses': 1, 'size': 1},
+                         registry.get_metadata_cache_stats())
+
+    def test_metadata_cached_per_owner(self):
+        other_context = context.RequestContext(tenant='tenant2')
+        registry.get_image_metadata(self.context, '1')
+        registry.get_image_metadata(other_context, '1')
+        self.assertEqual(2, self.get_image_calls)
+
+    def test_not_found_not_cached(self):
+        for i in xrange(2):
+            self.assertRaises(exception.NotFound,
+                              registry.get_image_metadata,
+                              self.context, 'missing')
+        self.assertEqual(2, self.get_image_calls)
+
+    def test_update_invalidates(self):
+        registry.get_image_metadata(self.context, '1')
+        registry.update_image_metadata(self.context, '1', {'name': 'new'})
+        registry.get_image_metadata(self.context, '1')
+        self.assertEqual(2, self.get_image_calls)
+
+    def test_delete_invalidates(self):
+        registry.get_image_metadata(self.context, '1')
+        registry.delete_image_metadata(self.context, '1')
+        registry.get_image_metadata(self.context, '1')
+        self.assertEqual(2, self.get_image_calls)
+
+    def test_notification_invalidates(self):
+        self.config(notifier_strategy='noop')
+        registry.get_image_metadata(self.context, '1')
+        notifier.Notifier().info('image.update', {'id': '1'})
+        registry.get_image_metadata(self.context, '1')
+        self.assertEqual(2, self.get_image_calls)
+
+    def test_notification_invalidation_disabled(self):
+        self.config(notifier_strategy='noop',
+                    registry_metadata_cache_use_notifications=False)
+        registry.configure_registry_client()
+        registry.get_image_metadata(self.context, '1')
+        notifier.Notifier().info('image.update', {'id': '1'})
+        registry.get_image_metadata(self.context, '1')
+        self.assertEqual(1, self.get_image_calls)
+
+    def test_cache_disabled(self):
+        self.config(registry_metadata_cache_size=0)
+        registry.configure_registry_client()
+        registry.get_image_metadata(self.context, '1')
+        registry.get_image_metadata(self.context, '1')
+        self.assertEqual(2, self.get_image_calls)
+        self.assertEqual(None, registry.get_metadata_cache_stats())
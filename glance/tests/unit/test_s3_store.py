@@ -90,13 +90,25 @@ def stub_out_s3(stubs):
         def get_file(self):
             return self.data
 
+        def open_read(self, headers=None):
+            data = self.bucket.keys[self.name].data.getvalue()
+            byte_range = (headers or {}).get('Range')
+            if byte_range:
+                start, end = byte_range[len('bytes='):].split('-')
+                data = data[int(start):int(end) + 1]
+                self.bucket.byte_ranges.append(byte_range)
+            self.read = StringIO.StringIO(data).read
+
     class FakeBucket:
         """
         Acts like a ``boto.s3.bucket.Bucket``
         """
+        key_class = FakeKey
+
         def __init__(self, name, keys=None):
             self.name = name
             self.keys = keys or {}
+            self.byte_ranges = []
 
         def __str__(self):
             return self.name
@@ -118,6 +130,36 @@ def stub_out_s3(stubs):
             self.keys[key_name] = new_key
             return new_key
 
+        def initiate_multipart_upload(self, key_name):
+            return FakeMultiPartUpload(self, key_name)
+
+    class FakeMultiPartUpload:
+        """
+        Acts like a ``boto.s3.multipart.MultiPartUpload``, assembling the
+        uploaded parts into a key when the upload is completed
+        """
+        uploads = []
+
+        def __init__(self, bucket, key_name):
+            self.bucket = bucket
+            self.key_name = key_name
+            self.parts = {}
+            self.completed = False
+            self.cancelled = False
+            self.uploads.append(self)
+
+        def upload_part_from_file(self, fp, part_num):
+            self.parts[part_num] = fp.read()
+
+        def complete_upload(self):
+            parts = [self.parts[i] for i in sorted(self.parts)]
+            key = self.bucket.new_key(self.key_name)
+            key.set_contents_from_file(StringIO.StringIO(''.join(parts)))
+            self.completed = True
+
+        def cancel_upload(self):
+            self.cancelled = True
+
     fixture_buckets = {'glance': FakeBucket('glance')}
     b = fixture_buckets['glance']
     k = b.new_key(FAKE_UUID)
@@ -139,6 +181,8 @@ def stub_out_s3(stubs):
     stubs.Set(boto.s3.connection.S3Connection,
               'get_bucket', fake_get_bucket)
 
+    return FakeMultiPartUpload
+
 
 def format_s3_location(user, key, authurl, bucket, obj):
     """
@@ -163,7 +207,7 @@ class TestStore(base.StoreClearingUnitTest):
         self.config(**S3_CONF)
         super(TestStore, self).setUp()
         self.stubs = stubout.StubOutForTesting()
-        stub_out_s3(self.stubs)
+        self.multipart_upload_class = stub_out_s3(self.stubs)
         self.store = Store()
 
     def tearDown(self):
@@ -186,6 +230,31 @@ class TestStore(base.StoreClearingUnitTest):
             data += chunk
         self.assertEqual(expected_data, data)
 
+    def test_get_with_read_ahead(self):
+        """
+        Test that an image can be retrieved by reading byte ranges of it
+        concurrently, and that its data is yielded in order
+        """
+        expected_s3_contents = ''.join(chr(i % 251) for i in xrange(FIVE_KB))
+        expected_image_id = uuidutils.generate_uuid()
+        self.config(s3_store_read_ahead_concurrency=3)
+        self.store = Store()
+        self.store.read_ahead_chunk_size = 1024
+        location, size, checksum = self.store.add(
+            expected_image_id, StringIO.StringIO(expected_s3_contents),
+            FIVE_KB)
+
+        loc = get_location_from_uri(location)
+        (image_s3, image_size) = self.store.get(loc)
+        self.assertEqual(image_size, FIVE_KB)
+        self.assertEqual(expected_s3_contents, ''.join(image_s3))
+
+        conn = boto.s3.connection.S3Connection(host='localhost:8080')
+        bucket = conn.get_bucket('glance')
+        self.assertEqual(['bytes=0-1023', 'bytes=1024-2047',
+                          'bytes=2048-3071', 'bytes=3072-4095',
+                          'bytes=4096-5119'], bucket.byte_ranges)
+
     def test_get_calling_format_path(self):
         """Test a "normal" retrieval of an image in chunks"""
         self.config(s3_store_bucket_url_format='path')
@@ -320,6 +389,65 @@ class TestStore(base.StoreClearingUnitTest):
                           self.store.add,
                           FAKE_UUID, image_s3, 0)
 
+    def test_add_multipart(self):
+        """Test that large images are streamed in a multipart upload"""
+        self.config(s3_store_large_object_size=1,
+                    s3_store_large_object_chunk_size=5)
+        self.store = Store()
+        expected_image_id = uuidutils.generate_uuid()
+        expected_s3_size = 11 * 1024 * 1024
+        expected_s3_contents = ''.join(chr(i % 251)
+                                       for i in xrange(expected_s3_size))
+        expected_checksum = hashlib.md5(expected_s3_contents).hexdigest()
+        image_s3 = StringIO.StringIO(expected_s3_contents)
+
+        location, size, checksum = self.store.add(expected_image_id,
+                                                  image_s3,
+                                                  expected_s3_size)
+
+        self.assertEquals(expected_s3_size, size)
+        self.assertEquals(expected_checksum, checksum)
+
+        uploads = self.multipart_upload_class.uploads
+        self.assertEquals(1, len(uploads))
+        self.assertTrue(uploads[0].completed)
+        self.assertEquals([5 * 1024 * 1024, 5 * 1024 * 1024, 1024 * 1024],
+                          [len(uploads[0].parts[i]) for i in (1, 2, 3)])
+
+        loc = get_location_from_uri(location)
+        (new_image_s3, new_image_size) = self.store.get(loc)
+        self.assertEquals(expected_s3_contents, ''.join(new_image_s3))
+
+    def test_add_unknown_size_uses_multipart(self):
+        """Test that images of unknown size are streamed to S3"""
+        expected_image_id = uuidutils.generate_uuid()
+        expected_s3_contents = "*" * FIVE_KB
+        expected_checksum = hashlib.md5(expected_s3_contents).hexdigest()
+        image_s3 = StringIO.StringIO(expected_s3_contents)
+
+        location, size, checksum = self.store.add(expected_image_id,
+                                                  image_s3, 0)
+
+        self.assertEquals(FIVE_KB, size)
+        self.assertEquals(expected_checksum, checksum)
+        uploads = self.multipart_upload_class.uploads
+        self.assertEquals(1, len(uploads))
+        self.assertEquals([1], uploads[0].parts.keys())
+
+    def test_add_multipart_failure_cancels_upload(self):
+        """Test that a failed part cancels the multipart upload"""
+        def fake_upload_part_from_file(*args, **kwargs):
+            raise IOError('connection reset')
+
+        self.stubs.Set(self.multipart_upload_class, 'upload_part_from_file',
+                       fake_upload_part_from_file)
+        image_s3 = StringIO.StringIO("*" * FIVE_KB)
+        self.assertRaises(IOError, self.store.add,
+                          uuidutils.generate_uuid(), image_s3, 0)
+        uploads = self.multipart_upload_class.uploads
+        self.assertTrue(uploads[0].cancelled)
+        self.assertFalse(uploads[0].completed)
+
     def _option_required(self, key):
         conf = S3_CONF.copy()
         conf[key] = None
@@ -40,6 +40,37 @@ class TestBasicSchema(test_utils.BaseTestCase):
         obj = {'eggs': 2}
         self.assertRaises(exception.InvalidObject, self.schema.validate, obj)
 
+    def test_validate_reuses_validator(self):
+        self.schema.validate({'ham': 'no'})
+        validator = self.schema._get_validator()
+        self.schema.validate({'eggs': 'fried'})
+        self.assertTrue(validator is self.schema._get_validator())
+
+    def test_validate_after_merge_properties(self):
+        self.schema.validate({'ham': 'no'})
+        self.schema.merge_properties({'bacon': {'type': 'string'}})
+        self.schema.validate({'bacon': 'crispy'})  # No exception raised
+        self.assertRaises(exception.InvalidObject,
+                          self.schema.validate, {'bacon': 2})
+
+    def test_validate_many(self):
+        objs = [{'ham': 'no'}, {'eggs': 'scrambled'}]
+        self.schema.validate_many(objs)  # No exception raised
+
+    def test_validate_many_fails_on_any_invalid_object(self):
+        objs = [{'ham': 'no'}, {'eggs': 2}]
+        self.assertRaises(exception.InvalidObject,
+                          self.schema.validate_many, objs)
+
+    def test_validate_many_names_invalid_object(self):
+        objs = [{'ham': 'no'}, None, {'eggs': 2}]
+        try:
+            self.schema.validate_many(objs)
+        except exception.InvalidObject as e:
+            self.assertTrue('object 2:' in unicode(e))
+        else:
+            self.fail('Invalid object did not raise InvalidObject')
+
     def test_filter_strips_extra_properties(self):
         obj = {'ham': 'virginia', 'eggs': 'scrambled', 'bacon': 'crispy'}
         filtered = self.schema.filter(obj)
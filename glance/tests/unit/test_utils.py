@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import StringIO
 import tempfile
 
@@ -103,3 +104,98 @@ class TestUtils(test_utils.BaseTestCase):
                 byte = reader.read(1)
 
         self.assertRaises(exception.ImageSizeLimitExceeded, _consume_all_read)
+
+    def test_chunkiter_with_length(self):
+        """Ensure chunkiter stops reading after length bytes"""
+        data = StringIO.StringIO("aaabbbcccddd")
+        chunks = list(utils.chunkiter(data, chunk_size=4, length=7))
+        self.assertEqual(['aaab', 'bbc'], chunks)
+        self.assertEqual('ccddd', data.read())
+
+    def test_chunkslice(self):
+        """Ensure chunkslice yields only the requested window"""
+        chunks = ['aaa', 'bbb', 'ccc', 'ddd']
+        self.assertEqual('abbbc',
+                         ''.join(utils.chunkslice(iter(chunks), 2, 5)))
+        self.assertEqual('cddd',
+                         ''.join(utils.chunkslice(iter(chunks), 8)))
+        self.assertEqual('', ''.join(utils.chunkslice(iter(chunks), 12)))
+
+    def test_file_wrapper(self):
+        """Ensure FileWrapper yields its byte range and then closes"""
+        exits = []
+
+        @contextlib.contextmanager
+        def opener():
+            yield StringIO.StringIO("aaabbbcccddd")
+            exits.append(True)
+
+        wrapper = utils.FileWrapper(opener, 2, 7)
+        wrapper.CHUNKSIZE = 3
+        self.assertEqual(['abb', 'bcc', 'c'], list(wrapper))
+        self.assertEqual(7, wrapper.bytes_sent)
+        self.assertEqual([True], exits)
+
+    def test_file_wrapper_lazy_open(self):
+        """Ensure FileWrapper opens the file only when it is needed"""
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write("aaabbbcccddd")
+            tmp.flush()
+            opened = []
+
+            def opener():
+                opened.append(True)
+                return open(tmp.name, 'rb')
+
+            wrapper = utils.FileWrapper(opener, 3)
+            self.assertEqual([], opened)
+            self.assertEqual(9, wrapper.length)
+            self.assertEqual([True], opened)
+            self.assertEqual("bbbcccddd", ''.join(wrapper))
+
+    def test_file_wrapper_closed_early(self):
+        """Ensure a partially sent FileWrapper is not exited cleanly"""
+        exits = []
+
+        @contextlib.contextmanager
+        def opener():
+            yield StringIO.StringIO("aaabbbcccddd")
+            exits.append(True)
+
+        wrapper = utils.FileWrapper(opener, 0, 12)
+        wrapper.CHUNKSIZE = 3
+        chunks = iter(wrapper)
+        self.assertEqual('aaa', chunks.next())
+        wrapper.close()
+        self.assertEqual([], exits)
+
+    def test_ordered_dict(self):
+        """Ensure OrderedDict keeps its keys in insertion order"""
+        d = utils.OrderedDict()
+        for key in 'cab':
+            d[key] = key.upper()
+        self.assertEqual(['c', 'a', 'b'], d.keys())
+        self.assertEqual(['C', 'A', 'B'], d.values())
+        self.assertEqual(3, len(d))
+        self.assertTrue('a' in d)
+        self.assertEqual('A', d['a'])
+        self.assertEqual(None, d.get('x'))
+
+        # Assigning leaves a key in place, popping and assigning moves it
+        d['c'] = 'CC'
+        self.assertEqual(['c', 'a', 'b'], d.keys())
+        d['c'] = d.pop('c')
+        self.assertEqual([('a', 'A'), ('b', 'B'), ('c', 'CC')], d.items())
+
+        self.assertEqual(('a', 'A'), d.popitem(last=False))
+        self.assertEqual(('c', 'CC'), d.popitem())
+        self.assertEqual(None, d.pop('x', None))
+        self.assertRaises(KeyError, d.pop, 'x')
+        del d['b']
+        self.assertEqual([], d.keys())
+        self.assertRaises(KeyError, d.popitem)
+
+        d['x'] = 'X'
+        d.clear()
+        self.assertFalse('x' in d)
+        self.assertEqual([], list(d))
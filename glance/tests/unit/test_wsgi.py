@@ -15,6 +15,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import os
+import StringIO
+import tempfile
+
+import eventlet
+from eventlet.green import httplib
+import eventlet.wsgi
 import webob
 
 from glance.common import exception
@@ -124,6 +132,88 @@ class ResourceTest(test_utils.BaseTestCase):
                           'index', 'on', pants='off')
 
 
+class HttpProtocolTest(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(HttpProtocolTest, self).setUp()
+        self.data = ''.join(chr(i % 256) for i in xrange(100000))
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, self.data)
+        os.close(fd)
+
+        self.sendfile_calls = 0
+        orig_sendfile = wsgi.sendfile.sendfile
+
+        def counting_sendfile(*args):
+            self.sendfile_calls += 1
+            return orig_sendfile(*args)
+
+        self.orig_sendfile = orig_sendfile
+        wsgi.sendfile.sendfile = counting_sendfile
+
+    def tearDown(self):
+        wsgi.sendfile.sendfile = self.orig_sendfile
+        os.unlink(self.path)
+        super(HttpProtocolTest, self).tearDown()
+
+    def _get(self, offset=0, length=None, content_length=True,
+             opener=None):
+        path = self.path
+        opener = opener or (lambda: open(path, 'rb'))
+
+        def app(environ, start_response):
+            body = utils.FileWrapper(opener, offset, length)
+            headers = []
+            if content_length:
+                headers.append(('Content-Length', str(body.length)))
+            start_response('200 OK', headers)
+            return body
+
+        sock = eventlet.listen(('127.0.0.1', 0))
+        server = eventlet.spawn(eventlet.wsgi.server, sock, app,
+                                protocol=wsgi.HttpProtocol,
+                                log=open(os.devnull, 'w'))
+        try:
+            conn = httplib.HTTPConnection('127.0.0.1',
+                                          sock.getsockname()[1])
+            conn.request('GET', '/')
+            return conn.getresponse().read()
+        finally:
+            server.kill()
+            sock.close()
+
+    def test_file_wrapper_sent_with_sendfile(self):
+        self.assertEqual(self.data, self._get())
+        self.assertTrue(self.sendfile_calls > 0)
+
+    def test_file_wrapper_range_sent_with_sendfile(self):
+        self.assertEqual(self.data[5000:95000], self._get(5000, 90000))
+        self.assertTrue(self.sendfile_calls > 0)
+
+    def test_in_memory_file_wrapper_not_sent_with_sendfile(self):
+        data = self.data
+
+        @contextlib.contextmanager
+        def opener():
+            yield StringIO.StringIO(data)
+
+        self.assertEqual(self.data, self._get(opener=opener))
+        self.assertEqual(0, self.sendfile_calls)
+
+    def test_small_file_wrapper_not_sent_with_sendfile(self):
+        self.assertEqual(self.data[:100], self._get(0, 100))
+        self.assertEqual(0, self.sendfile_calls)
+
+    def test_file_wrapper_without_content_length(self):
+        self.assertEqual(self.data, self._get(content_length=False))
+        self.assertEqual(0, self.sendfile_calls)
+
+    def test_use_sendfile_disabled(self):
+        self.config(use_sendfile=False)
+        self.assertEqual(self.data, self._get())
+        self.assertEqual(0, self.sendfile_calls)
+
+
 class JSONResponseSerializerTest(test_utils.BaseTestCase):
 
     def test_to_json(self):
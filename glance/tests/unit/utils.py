@@ -104,6 +104,11 @@ class FakeStoreAPI(object):
         except KeyError:
             raise exception.NotFound()
 
+    def get_range_from_backend(self, context, location, offset, length=None):
+        data, size = self.get_from_backend(context, location)
+        stop = size if length is None else offset + length
+        return data[offset:stop], len(data[offset:stop])
+
     def safe_delete_from_backend(self, uri, context, id, **kwargs):
         try:
             del self.data[uri]
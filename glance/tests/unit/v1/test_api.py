@@ -38,6 +38,7 @@ from glance.openstack.common import cfg
 from glance.openstack.common import timeutils
 from glance.openstack.common import uuidutils
 from glance.registry.api import v1 as rserver
+from glance.registry.api.v1 import images as rimages
 import glance.store.filesystem
 from glance.tests.unit import base
 from glance.tests import utils as test_utils
@@ -97,6 +98,32 @@ class TestRegistryDb(test_utils.BaseTestCase):
         self.stubs.UnsetAll()
 
 
+class TestMakeImageDict(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestMakeImageDict, self).setUp()
+        self.values = {'id': UUID1, 'name': 'image', 'status': 'active',
+                       'size': 13, 'is_public': True, 'owner': None,
+                       'created_at': timeutils.utcnow(),
+                       'updated_at': timeutils.utcnow(),
+                       'deleted_at': None, 'deleted': False}
+        self.expected = dict(self.values, properties={'type': 'kernel'})
+
+    def test_image_model(self):
+        image = db_models.Image(**self.values)
+        image.properties = [
+            db_models.ImageProperty(name='type', value='kernel',
+                                    deleted=False),
+            db_models.ImageProperty(name='arch', value='x86', deleted=True)]
+        self.assertEqual(self.expected, rimages.make_image_dict(image))
+
+    def test_image_dict(self):
+        image = dict(self.values, unknown='value', properties=[
+            {'name': 'type', 'value': 'kernel', 'deleted': False},
+            {'name': 'arch', 'value': 'x86', 'deleted': True}])
+        self.assertEqual(self.expected, rimages.make_image_dict(image))
+
+
 class TestRegistryAPI(base.IsolatedUnitTest):
     def setUp(self):
         """Establish a clean test environment"""
@@ -329,6 +356,58 @@ class TestRegistryAPI(base.IsolatedUnitTest):
         self.assertEquals(images[0]['id'], UUID5)
         self.assertEquals(images[1]['id'], UUID2)
 
+    def _walk_index_pages(self, query):
+        ids = []
+        marker = None
+        while True:
+            url = '/images?limit=1&%s' % query
+            if marker is not None:
+                url += '&marker=%s' % marker
+            res = webob.Request.blank(url).get_response(self.api)
+            self.assertEquals(res.status_int, 200)
+            images = json.loads(res.body)['images']
+            if not images:
+                return ids
+            marker = images[0]['id']
+            ids.append(marker)
+
+    def test_get_index_marker_pages(self):
+        """
+        Tests that walking the /images registry API a page at a time
+        returns every image once, in order, whether or not the next
+        page is selected with a row value comparison
+        """
+        created_at = timeutils.utcnow()
+        for size in (19, 20, 20):
+            extra_fixture = {'id': _gen_uuid(),
+                             'status': 'active',
+                             'is_public': True,
+                             'disk_format': 'vhd',
+                             'container_format': 'ovf',
+                             'name': 'new name! #123',
+                             'size': size,
+                             'checksum': None,
+                             'created_at': created_at}
+            db_api.image_create(self.context, extra_fixture)
+
+        for query in ('sort_key=size&sort_dir=asc',
+                      'sort_key=size&sort_dir=desc',
+                      'sort_key=name&sort_dir=asc',
+                      'sort_key=created_at&sort_dir=desc'):
+            req = webob.Request.blank('/images?%s' % query)
+            res = req.get_response(self.api)
+            expected = [i['id'] for i in json.loads(res.body)['images']]
+            self.assertEquals(4, len(expected))
+
+            self.assertEquals(expected, self._walk_index_pages(query))
+            stubs = stubout.StubOutForTesting()
+            try:
+                stubs.Set(db_api, '_supports_row_values',
+                          lambda query: False)
+                self.assertEquals(expected, self._walk_index_pages(query))
+            finally:
+                stubs.UnsetAll()
+
     def test_get_index_unknown_marker(self):
         """
         Tests that the /images registry API returns a 400
@@ -1447,6 +1526,63 @@ class TestRegistryAPI(base.IsolatedUnitTest):
         for image in images:
             self.assertEqual('v a', image['properties']['prop_123'])
 
+    def test_get_details_filter_multiple_properties(self):
+        """
+        Tests that the /images/detail registry API returns list of
+        public images that have all of several custom properties
+        """
+        UUID3 = _gen_uuid()
+        extra_fixture = {'id': UUID3,
+                         'status': 'active',
+                         'is_public': True,
+                         'disk_format': 'vhd',
+                         'container_format': 'ovf',
+                         'name': 'fake image #3',
+                         'size': 19,
+                         'checksum': None,
+                         'properties': {'prop_123': 'v a',
+                                        'prop_456': 'v b'}}
+
+        db_api.image_create(self.context, extra_fixture)
+
+        UUID4 = _gen_uuid()
+        extra_fixture = {'id': UUID4,
+                         'status': 'active',
+                         'is_public': True,
+                         'disk_format': 'ami',
+                         'container_format': 'ami',
+                         'name': 'fake image #4',
+                         'size': 19,
+                         'checksum': None,
+                         'properties': {'prop_123': 'v a',
+                                        'prop_456': 'v c'}}
+
+        db_api.image_create(self.context, extra_fixture)
+
+        req = webob.Request.blank('/images/detail?property-prop_123=v%20a'
+                                  '&property-prop_456=v%20b')
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, 200)
+        images = json.loads(res.body)['images']
+        self.assertEquals([UUID3], [image['id'] for image in images])
+
+        req = webob.Request.blank('/images/detail?property-prop_123=v%20a')
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, 200)
+        images = json.loads(res.body)['images']
+        self.assertEquals(set([UUID3, UUID4]),
+                          set([image['id'] for image in images]))
+
+        # Deleted properties do not match
+        db_api.image_update(self.context, UUID3,
+                            {'properties': {'prop_123': 'v a'}},
+                            purge_props=True)
+        req = webob.Request.blank('/images/detail?property-prop_123=v%20a'
+                                  '&property-prop_456=v%20b')
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, 200)
+        self.assertEquals([], json.loads(res.body)['images'])
+
     def test_get_details_filter_public_none(self):
         """
         Tests that the /images/detail registry API returns list of
@@ -1824,6 +1960,64 @@ class TestRegistryAPI(base.IsolatedUnitTest):
         self.assertEquals(res.status_int,
                           webob.exc.HTTPNotFound.code)
 
+    def _batch_request(self, action, method, body):
+        req = webob.Request.blank('/images/%s' % action)
+        req.method = method
+        req.content_type = 'application/json'
+        req.body = json.dumps(body)
+        return req.get_response(self.api)
+
+    def test_batch_get(self):
+        """Tests that the registry API returns many images at once"""
+        res = self._batch_request('batch_get', 'POST',
+                                  {'ids': [UUID1, UUID2, _gen_uuid()]})
+        self.assertEquals(res.status_int, 200)
+        images = json.loads(res.body)['images']
+        self.assertEquals(set([UUID1, UUID2]), set(i['id'] for i in images))
+
+    def test_batch_get_without_ids(self):
+        """Tests that batch requests must hold a list of image ids"""
+        for body in ({}, {'ids': UUID1}, {'ids': [1, 2]}):
+            res = self._batch_request('batch_get', 'POST', body)
+            self.assertEquals(res.status_int, webob.exc.HTTPBadRequest.code)
+
+    def test_batch_get_too_many_ids(self):
+        """Tests that batch requests may not exceed api_limit_max ids"""
+        self.config(api_limit_max=1)
+        res = self._batch_request('batch_get', 'POST',
+                                  {'ids': [UUID1, UUID2]})
+        self.assertEquals(res.status_int, webob.exc.HTTPBadRequest.code)
+
+    def test_batch_update(self):
+        """Tests that the registry API updates many images at once"""
+        res = self._batch_request('batch_update', 'PUT',
+                                  {'ids': [UUID1, UUID2],
+                                   'image': {'status': 'killed'}})
+        self.assertEquals(res.status_int, 200)
+        images = json.loads(res.body)['images']
+        self.assertEquals(['killed', 'killed'], [i['status'] for i in images])
+
+    def test_batch_update_with_bad_status(self):
+        """Tests that exception raised trying to set a bad status"""
+        res = self._batch_request('batch_update', 'PUT',
+                                  {'ids': [UUID2],
+                                   'image': {'status': 'invalid'}})
+        self.assertEquals(res.status_int, webob.exc.HTTPBadRequest.code)
+        self.assertTrue('Invalid image status' in res.body)
+
+    def test_batch_delete(self):
+        """Tests that the registry API deletes many images at once"""
+        res = self._batch_request('batch_delete', 'POST',
+                                  {'ids': [UUID1, UUID2]})
+        self.assertEquals(res.status_int, 200)
+        images = json.loads(res.body)['images']
+        self.assertEquals(set([UUID1, UUID2]), set(i['id'] for i in images))
+        self.assertTrue(all(i['deleted'] for i in images))
+
+        req = webob.Request.blank('/images')
+        res = req.get_response(self.api)
+        self.assertEquals([], json.loads(res.body)['images'])
+
     def test_get_image_members(self):
         """
         Tests members listing for existing images
@@ -2970,6 +3164,168 @@ class TestGlanceAPI(base.IsolatedUnitTest):
         self.assertEqual(res.content_type, 'application/octet-stream')
         self.assertEqual('chunk00000remainder', res.body)
 
+    def test_show_image_range(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.headers['Range'] = 'bytes=5-9'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 206)
+        self.assertEqual('bytes 5-9/19', res.headers['Content-Range'])
+        self.assertEqual('5', res.headers['Content-Length'])
+        self.assertEqual('00000', res.body)
+
+    def test_show_image_suffix_range(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.headers['Range'] = 'bytes=-9'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 206)
+        self.assertEqual('bytes 10-18/19', res.headers['Content-Range'])
+        self.assertEqual('remainder', res.body)
+
+    def test_show_image_multiple_ranges(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.headers['Range'] = 'bytes=0-4,10-'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 206)
+        self.assertTrue(res.content_type.startswith('multipart/byteranges'))
+        boundary = res.headers['Content-Type'].split('boundary=')[1]
+        self.assertEqual(len(res.body), int(res.headers['Content-Length']))
+        parts = res.body.split('--%s' % boundary)
+        self.assertEqual(4, len(parts))
+        self.assertTrue('Content-Range: bytes 0-4/19' in parts[1])
+        self.assertTrue(parts[1].endswith('\r\n\r\nchunk\r\n'))
+        self.assertTrue('Content-Range: bytes 10-18/19' in parts[2])
+        self.assertTrue(parts[2].endswith('\r\n\r\nremainder\r\n'))
+        self.assertEqual('--\r\n', parts[3])
+
+    def test_show_image_range_not_satisfiable(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.headers['Range'] = 'bytes=19-'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 416)
+        self.assertEqual('bytes */19', res.headers['Content-Range'])
+
+    def test_show_image_if_range_mismatch(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.headers['Range'] = 'bytes=5-9'
+        req.headers['If-Range'] = '"not-the-checksum"'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual('chunk00000remainder', res.body)
+
+    def _add_image_with_data(self, image_contents):
+        req = webob.Request.blank("/images")
+        req.method = 'POST'
+        req.headers['x-image-meta-store'] = 'file'
+        req.headers['x-image-meta-disk-format'] = 'vhd'
+        req.headers['x-image-meta-container-format'] = 'ovf'
+        req.headers['x-image-meta-name'] = 'fake image #3'
+        req.headers['Content-Type'] = 'application/octet-stream'
+        req.body = image_contents
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.CREATED)
+        return json.loads(res.body)['image']
+
+    def test_show_image_if_none_match(self):
+        image = self._add_image_with_data("chunk00000remainder")
+        req = webob.Request.blank("/images/%s" % image['id'])
+        req.headers['If-None-Match'] = '"%s"' % image['checksum']
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 304)
+        self.assertEqual(image['checksum'], res.headers['ETag'])
+        self.assertEqual('', res.body)
+
+    def test_show_image_if_none_match_mismatch(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.headers['If-None-Match'] = '"not-the-checksum"'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual('chunk00000remainder', res.body)
+
+    def test_image_meta_if_modified_since(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.method = 'HEAD'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+        last_modified = res.headers['Last-Modified']
+
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.method = 'HEAD'
+        req.headers['If-Modified-Since'] = last_modified
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 304)
+
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.method = 'HEAD'
+        req.headers['If-Modified-Since'] = 'Thu, 01 Jan 1970 00:00:00 GMT'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+
+    def test_image_meta_ignores_if_none_match(self):
+        """The checksum of an image does not cover its metadata"""
+        image = self._add_image_with_data("chunk00000remainder")
+        req = webob.Request.blank("/images/%s" % image['id'])
+        req.method = 'HEAD'
+        req.headers['If-None-Match'] = '"%s"' % image['checksum']
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+
+    def test_get_index_etag_made_once(self):
+        etags = []
+
+        def fake_get_images_etag(request, images_):
+            etags.append(images_)
+            return 'abc'
+
+        self.stubs.Set(images, 'get_images_etag', fake_get_images_etag)
+        for path in ('/images', '/images/detail'):
+            req = webob.Request.blank(path)
+            res = req.get_response(self.api)
+            self.assertEqual(res.status_int, 200)
+            self.assertEqual('"abc"', res.headers['ETag'])
+            self.assertEqual(['images'], json.loads(res.body).keys())
+        self.assertEqual(2, len(etags))
+
+    def test_get_index_if_none_match(self):
+        req = webob.Request.blank("/images")
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+        etag = res.headers['ETag']
+
+        req = webob.Request.blank("/images")
+        req.headers['If-None-Match'] = etag
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 304)
+        self.assertEqual(etag, res.headers['ETag'])
+        self.assertEqual('', res.body)
+
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.method = 'PUT'
+        req.headers['x-image-meta-name'] = 'renamed'
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+
+        req = webob.Request.blank("/images")
+        req.headers['If-None-Match'] = etag
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+        self.assertNotEqual(etag, res.headers['ETag'])
+
+    def test_get_details_if_none_match(self):
+        req = webob.Request.blank("/images/detail")
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+        etag = res.headers['ETag']
+
+        req = webob.Request.blank("/images/detail")
+        req.headers['If-None-Match'] = etag
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 304)
+
+        req = webob.Request.blank("/images/detail?name=fake")
+        req.headers['If-None-Match'] = etag
+        res = req.get_response(self.api)
+        self.assertEqual(res.status_int, 200)
+
     def test_show_non_exists_image(self):
         req = webob.Request.blank("/images/%s" % _gen_uuid())
         res = req.get_response(self.api)
@@ -69,6 +69,28 @@ class TestImagesController(base.StoreClearingUnitTest):
         }
         self.assertEqual(output_log, expected_log)
 
+    def test_download_range(self):
+        request = unit_test_utils.get_fake_request()
+        self.controller.upload(request, unit_test_utils.UUID2, 'ABCD', 4)
+        request = unit_test_utils.get_fake_request(method='GET')
+        request.headers['Range'] = 'bytes=1-2'
+        output = self.controller.download(request, unit_test_utils.UUID2)
+        self.assertEqual(set(['data', 'meta', 'partial_content']),
+                         set(output.keys()))
+        self.assertEqual('BC', output['data'])
+        self.assertEqual(2, output['partial_content']['size'])
+        self.assertEqual('bytes 1-2/4',
+                         output['partial_content']['headers']['Content-Range'])
+
+    def test_download_range_not_satisfiable(self):
+        request = unit_test_utils.get_fake_request()
+        self.controller.upload(request, unit_test_utils.UUID2, 'ABCD', 4)
+        request = unit_test_utils.get_fake_request(method='GET')
+        request.headers['Range'] = 'bytes=10-'
+        self.assertRaises(webob.exc.HTTPRequestRangeNotSatisfiable,
+                          self.controller.download,
+                          request, unit_test_utils.UUID2)
+
     def test_upload_non_existent_image(self):
         request = unit_test_utils.get_fake_request()
         self.assertRaises(webob.exc.HTTPNotFound, self.controller.upload,
@@ -227,6 +249,29 @@ class TestImageDataSerializer(test_utils.BaseTestCase):
         self.assertEqual('application/octet-stream',
                          response.headers['Content-Type'])
 
+    def test_download_partial_content(self):
+        request = webob.Request.blank('/')
+        request.environ = {}
+        response = webob.Response()
+        response.request = request
+        checksum = '0745064918b49693cca64d6b6a13d28a'
+        fixture = {
+            'data': 'Z',
+            'meta': {'size': 3, 'id': 'asdf', 'checksum': checksum},
+            'partial_content': {
+                'headers': {'Content-Range': 'bytes 1-1/3',
+                            'Content-Type': 'application/octet-stream'},
+                'size': 1,
+            },
+        }
+        self.serializer.download(response, fixture)
+        self.assertEqual(206, response.status_int)
+        self.assertEqual('Z', response.body)
+        self.assertEqual('1', response.headers['Content-Length'])
+        self.assertEqual('bytes 1-1/3', response.headers['Content-Range'])
+        self.assertEqual('bytes', response.headers['Accept-Ranges'])
+        self.assertFalse('Content-MD5' in response.headers)
+
     def test_upload(self):
         request = webob.Request.blank('/')
         request.environ = {}
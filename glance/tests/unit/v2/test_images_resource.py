@@ -16,9 +16,11 @@
 import datetime
 import json
 
+import stubout
 import webob
 
 import glance.api.v2.images
+from glance.db.sqlalchemy import api as db_api
 from glance.openstack.common import cfg
 from glance.openstack.common import uuidutils
 import glance.schema
@@ -308,6 +310,19 @@ class TestImagesController(test_utils.BaseTestCase):
         output = self.controller.index(request)
         self.assertEqual([], output['images'])
 
+    def test_index_if_none_match(self):
+        request = unit_test_utils.get_fake_request(method='GET')
+        output = self.controller.index(request)
+        etag = glance.api.v2.images.get_images_etag(request, output['images'])
+        self.assertEqual(etag, output['etag'])
+        request.headers['If-None-Match'] = '"%s"' % etag
+        self.assertRaises(webob.exc.HTTPNotModified,
+                          self.controller.index, request)
+
+        self.controller.delete(request, UUID2)
+        output = self.controller.index(request)
+        self.assertEqual(2, len(output['images']))
+
     def test_show(self):
         request = unit_test_utils.get_fake_request()
         output = self.controller.show(request, image_id=UUID2)
@@ -344,6 +359,32 @@ class TestImagesController(test_utils.BaseTestCase):
         self.assertRaises(webob.exc.HTTPNotFound,
                           self.controller.show, request, UUID1)
 
+    def test_show_if_none_match(self):
+        request = unit_test_utils.get_fake_request(method='GET')
+        output = self.controller.show(request, image_id=UUID1)
+        etag = glance.api.v2.images.get_image_etag(output)
+        request.headers['If-None-Match'] = '"%s"' % etag
+        self.assertRaises(webob.exc.HTTPNotModified,
+                          self.controller.show, request, UUID1)
+
+    def test_show_if_none_match_tags_changed(self):
+        request = unit_test_utils.get_fake_request(method='GET')
+        output = self.controller.show(request, image_id=UUID1)
+        etag = glance.api.v2.images.get_image_etag(output)
+        self.db.image_tag_set_all(None, UUID1, ['ping'])
+        request.headers['If-None-Match'] = '"%s"' % etag
+        output = self.controller.show(request, image_id=UUID1)
+        self.assertEqual(['ping'], output['tags'])
+
+    def test_show_if_modified_since(self):
+        request = unit_test_utils.get_fake_request(method='GET')
+        request.headers['If-Modified-Since'] = 'Fri, 01 Jan 2038 00:00:00 GMT'
+        self.assertRaises(webob.exc.HTTPNotModified,
+                          self.controller.show, request, UUID1)
+        request.headers['If-Modified-Since'] = 'Thu, 01 Jan 1970 00:00:00 GMT'
+        output = self.controller.show(request, image_id=UUID1)
+        self.assertEqual(UUID1, output['id'])
+
     def test_create(self):
         request = unit_test_utils.get_fake_request()
         image = {'name': 'image-1'}
@@ -657,6 +698,55 @@ class TestImagesController(test_utils.BaseTestCase):
                           self.controller.index, request, marker=fake_uuid)
 
 
+class TestImagesControllerQueries(test_utils.BaseTestCase):
+
+    """Counts the database queries made by the controller"""
+
+    def setUp(self):
+        super(TestImagesControllerQueries, self).setUp()
+        self.stubs = stubout.StubOutForTesting()
+        self.statements = []
+        test_utils.stub_out_sqlalchemy_db(self.stubs, self.statements)
+
+        context = unit_test_utils.get_fake_request(is_admin=True).context
+        self.image_ids = []
+        for i in xrange(5):
+            image = db_api.image_create(context, {'owner': TENANT1,
+                                                  'status': 'active'})
+            db_api.image_tag_set_all(context, image['id'], ['ping', str(i)])
+            self.image_ids.append(image['id'])
+
+        self.controller = glance.api.v2.images.ImagesController(
+                db_api,
+                unit_test_utils.FakePolicyEnforcer(),
+                unit_test_utils.FakeNotifier(),
+                unit_test_utils.FakeStoreAPI())
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestImagesControllerQueries, self).tearDown()
+
+    def test_index_fetches_tags_in_one_query(self):
+        request = unit_test_utils.get_fake_request(is_admin=True)
+        del self.statements[:]
+        output = self.controller.index(request)
+        self.assertEqual(5, len(output['images']))
+        for image in output['images']:
+            i = self.image_ids.index(image['id'])
+            self.assertEqual(set(['ping', str(i)]), set(image['tags']))
+        tag_queries = [s for s in self.statements if 'image_tags' in s]
+        self.assertEqual(1, len(tag_queries))
+
+    def test_index_query_count_independent_of_page_size(self):
+        request = unit_test_utils.get_fake_request(is_admin=True)
+        del self.statements[:]
+        self.controller.index(request, limit=1)
+        single_image_queries = len(self.statements)
+        del self.statements[:]
+        self.controller.index(request, limit=5)
+        self.assertEqual(single_image_queries, len(self.statements))
+
+
 class TestImagesControllerPolicies(base.IsolatedUnitTest):
 
     def setUp(self):
@@ -1158,6 +1248,19 @@ class TestImagesDeserializerWithExtendedSchema(test_utils.BaseTestCase):
                           self.deserializer.update,
                           request)
 
+    def test_update_bad_data_names_operation(self):
+        request = unit_test_utils.get_fake_request()
+        request.content_type = 'application/openstack-images-v2.0-json-patch'
+        request.body = json.dumps([{'add': '/pants', 'value': 'off'},
+                                   {'remove': '/socks'},
+                                   {'replace': '/pants', 'value': 'cutoffs'}])
+        try:
+            self.deserializer.update(request)
+        except webob.exc.HTTPBadRequest as e:
+            self.assertTrue('object 2:' in e.explanation)
+        else:
+            self.fail('Invalid update did not result in HTTPBadRequest')
+
 
 class TestImagesDeserializerWithAdditionalProperties(test_utils.BaseTestCase):
 
@@ -1301,6 +1404,34 @@ class TestImagesSerializer(test_utils.BaseTestCase):
         self.assertEqual(expected, json.loads(response.body))
         self.assertEqual('application/json', response.content_type)
 
+    def test_index_streamed(self):
+        request = webob.Request.blank('/v2/images')
+        response = webob.Response(request=request)
+        result = {'images': self.fixtures, 'next_marker': UUID2}
+        self.serializer.index(response, result)
+        self.assertEqual(None, response.content_length)
+        chunks = list(response.app_iter)
+        # One chunk for each image, plus the opening and closing ones
+        self.assertEqual(4, len(chunks))
+        output = json.loads(''.join(chunks))
+        self.assertEqual([UUID1, UUID2], [i['id'] for i in output['images']])
+        self.assertEqual('/v2/images?marker=%s' % UUID2, output['next'])
+
+    def test_index_zero_images_streamed(self):
+        request = webob.Request.blank('/v2/images')
+        response = webob.Response(request=request)
+        self.serializer.index(response, {'images': []})
+        output = json.loads(''.join(response.app_iter))
+        self.assertEqual([], output['images'])
+        self.assertEqual('/v2/images', output['first'])
+
+    def test_index_etag(self):
+        request = webob.Request.blank('/v2/images')
+        response = webob.Response(request=request)
+        self.serializer.index(response, {'images': self.fixtures,
+                                         'etag': 'abc'})
+        self.assertEqual('"abc"', response.headers['ETag'])
+
     def test_index_next_marker(self):
         request = webob.Request.blank('/v2/images')
         response = webob.Response(request=request)
@@ -1346,6 +1477,14 @@ class TestImagesSerializer(test_utils.BaseTestCase):
         self.assertEqual(expected, json.loads(response.body))
         self.assertEqual('application/json', response.content_type)
 
+    def test_show_etag_and_last_modified(self):
+        response = webob.Response()
+        self.serializer.show(response, self.fixtures[0])
+        etag = glance.api.v2.images.get_image_etag(self.fixtures[0])
+        self.assertEqual('"%s"' % etag, response.headers['ETag'])
+        self.assertEqual('Wed, 16 May 2012 15:27:36 GMT',
+                         response.headers['Last-Modified'])
+
     def test_show_minimal_fixture(self):
         expected = {
             'id': UUID2,
@@ -27,11 +27,15 @@ import subprocess
 import unittest
 
 import nose.plugins.skip
+import sqlalchemy
+import sqlalchemy.orm
 
 from glance.common import config
 from glance.common import utils
 from glance.common import wsgi
 from glance import context
+from glance.db.sqlalchemy import api as db_api
+from glance.db.sqlalchemy import models as db_models
 from glance.openstack.common import cfg
 
 CONF = cfg.CONF
@@ -82,6 +86,32 @@ class BaseTestCase(unittest.TestCase):
             CONF.set_override(k, v, group)
 
 
+def stub_out_sqlalchemy_db(stubs, statements=None):
+    """
+    Point the sqlalchemy db api at a new, empty in-memory sqlite database.
+
+    :param stubs: stubout instance used to replace the api's engine and
+                  session maker
+    :param statements: optional list that the SQL of every statement
+                       executed against the database is appended to
+    :retval the engine of the new database
+    """
+    engine = sqlalchemy.create_engine('sqlite://')
+    db_models.register_models(engine)
+    maker = sqlalchemy.orm.sessionmaker(bind=engine, autocommit=True,
+                                        expire_on_commit=False)
+    stubs.Set(db_api, '_ENGINE', engine)
+    stubs.Set(db_api, '_MAKER', maker)
+
+    if statements is not None:
+        def _count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                                _count_statement)
+    return engine
+
+
 class skip_test(object):
     """Decorator that skips a test."""
     def __init__(self, msg):
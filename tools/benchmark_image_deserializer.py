@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+"""
+Time the v2 API's parsing and validation of image create and update
+requests against a large image schema.
+
+The custom image properties are read from SCHEMA_FILE
+(etc/schema-image.json by default), and PROPERTIES more string properties
+with a pattern are added to them (200 by default). Each create request
+sets every property, and each update request replaces every property.
+
+    benchmark_image_deserializer.py [SCHEMA_FILE [PROPERTIES]]
+"""
+
+import gettext
+import json
+import sys
+import time
+
+gettext.install('glance', unicode=1)
+
+import glance.api.v2.images
+from glance.common import config
+from glance.common import wsgi
+
+REPEAT = 200
+
+UUID = 'c80a1a6c-bd1f-41c5-90ee-81afedb1d58d'
+
+
+def get_custom_properties(path, count):
+    with open(path) as schema_file:
+        properties = json.load(schema_file)
+    for i in xrange(count):
+        properties['property_%d' % i] = {
+            'type': 'string',
+            'pattern': '^[0-9a-f-]{36}$',
+            'description': 'Generated property %d' % i,
+        }
+    return properties
+
+
+def get_values(properties):
+    values = {}
+    for name, prop in properties.items():
+        if prop.get('type') == 'string':
+            values[name] = UUID
+    return values
+
+
+def time_request(func, body, content_type=None):
+    start = time.time()
+    for i in xrange(REPEAT):
+        request = wsgi.Request.blank('/')
+        request.method = 'POST'
+        if content_type:
+            request.content_type = content_type
+        request.body = body
+        func(request)
+    return (time.time() - start) / REPEAT * 1000
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 or '-h' in sys.argv[1:]:
+        print __doc__
+        sys.exit(1)
+
+    schema_file = sys.argv[1] if len(sys.argv) > 1 else 'etc/schema-image.json'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    config.parse_args(args=[])
+    properties = get_custom_properties(schema_file, count)
+    deserializer = glance.api.v2.images.RequestDeserializer(
+            glance.api.v2.images.get_schema(properties))
+
+    values = get_values(properties)
+    create_body = json.dumps(values)
+    update_body = json.dumps([{'replace': '/%s' % name, 'value': value}
+                              for name, value in values.items()])
+
+    print '%-8s %12s %12s' % ('request', 'properties', 'ms')
+    print '%-8s %12d %12.3f' % ('create', len(values),
+                                time_request(deserializer.create,
+                                             create_body))
+    print '%-8s %12d %12.3f' % ('update', len(values),
+                                time_request(deserializer.update,
+                                             update_body,
+                                             'application/openstack-images-'
+                                             'v2.0-json-patch'))
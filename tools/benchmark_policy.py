@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+"""
+Measure the cost of a single policy check made through the API's policy
+enforcer, with the rules in POLICY_FILE (etc/policy.json by default).
+
+Each check is timed once for a new request context, as for the first
+check of a request, and once repeated within the same context, for each
+policy file check interval given (0 and the default by default).
+
+    benchmark_policy.py [POLICY_FILE [ACTION [INTERVAL ...]]]
+"""
+
+import gettext
+import os
+import sys
+import time
+
+gettext.install('glance', unicode=1)
+
+import glance.api.policy
+from glance import context
+from glance.openstack.common import cfg
+
+CONF = cfg.CONF
+
+REPEAT = 20000
+
+
+def time_checks(enforcer, action, new_context):
+    ctx = context.RequestContext(roles=['member'], user='user',
+                                 tenant='tenant')
+    target = {'owner': 'tenant'}
+    start = time.time()
+    for i in xrange(REPEAT):
+        if new_context:
+            ctx = context.RequestContext(roles=['member'], user='user',
+                                         tenant='tenant')
+        enforcer.check(ctx, action, target)
+    return (time.time() - start) / REPEAT * 1000000
+
+
+if __name__ == "__main__":
+    if '-h' in sys.argv[1:]:
+        print __doc__
+        sys.exit(1)
+
+    policy_file = sys.argv[1] if len(sys.argv) > 1 else 'etc/policy.json'
+    action = sys.argv[2] if len(sys.argv) > 2 else 'get_image'
+    intervals = [int(i) for i in sys.argv[3:]]
+
+    CONF(args=[], project='glance')
+    CONF.set_override('policy_file', os.path.abspath(policy_file))
+    if not intervals:
+        intervals = [0, CONF.policy_file_check_interval]
+
+    print '%-8s %16s %16s' % ('interval', 'new context us', 'same context us')
+    for interval in intervals:
+        CONF.set_override('policy_file_check_interval', interval)
+        enforcer = glance.api.policy.Enforcer()
+        print '%-8d %16.2f %16.2f' % (interval,
+                                      time_checks(enforcer, action, True),
+                                      time_checks(enforcer, action, False))
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+"""
+Time listing images filtered on their properties against a registry
+database holding a large number of image properties.
+
+The images and their properties are bulk loaded into the database given
+by SQL_CONNECTION, which must be empty, before the listing is timed. By
+default an in-memory sqlite database is loaded with 10000 images of 100
+properties each, i.e. a million properties.
+
+    benchmark_property_filters.py [SQL_CONNECTION [IMAGES [PROPERTIES]]]
+"""
+
+import gettext
+import sys
+import time
+
+gettext.install('glance', unicode=1)
+
+from glance import context
+import glance.db.sqlalchemy.api as db_api
+from glance.db.sqlalchemy import models
+from glance.openstack.common import cfg
+from glance.openstack.common import timeutils
+
+CONF = cfg.CONF
+
+BATCH_SIZE = 10000
+REPEAT = 10
+
+
+def load(engine, image_count, property_count):
+    now = timeutils.utcnow()
+    images = models.Image.__table__
+    properties = models.ImageProperty.__table__
+    rows = []
+    for i in xrange(image_count):
+        image_id = 'image-%08d' % i
+        engine.execute(images.insert(), id=image_id, status='active',
+                       is_public=True, created_at=now, deleted=False)
+        for j in xrange(property_count):
+            rows.append({'image_id': image_id,
+                         'name': 'property-%d' % j,
+                         'value': 'value-%d' % ((i + j) % 100),
+                         'created_at': now,
+                         'deleted': False})
+        if len(rows) >= BATCH_SIZE:
+            engine.execute(properties.insert(), rows)
+            rows = []
+    if rows:
+        engine.execute(properties.insert(), rows)
+
+
+def time_filters(ctx, properties):
+    start = time.time()
+    for i in xrange(REPEAT):
+        images = db_api.image_get_all(ctx, filters={'properties': properties})
+    return len(images), (time.time() - start) / REPEAT
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 4 or '-h' in sys.argv[1:]:
+        print __doc__
+        sys.exit(1)
+
+    sql_connection = sys.argv[1] if len(sys.argv) > 1 else 'sqlite://'
+    image_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    property_count = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    CONF(args=[], project='glance')
+    CONF.set_override('sql_connection', sql_connection)
+    CONF.set_override('db_auto_create', True)
+    db_api.configure_db()
+
+    start = time.time()
+    load(db_api.get_session().get_bind(), image_count, property_count)
+    print 'loaded %d images with %d properties in %.2fs' % (
+        image_count, image_count * property_count, time.time() - start)
+
+    ctx = context.RequestContext(is_admin=True)
+    cases = [('one', {'property-0': 'value-0'}),
+             ('two', {'property-0': 'value-0', 'property-1': 'value-1'}),
+             ('none', {'property-0': 'value-0', 'property-1': 'value-0'})]
+
+    print '%-8s %12s %12s' % ('filters', 'images', 'seconds')
+    for name, properties in cases:
+        matched, elapsed = time_filters(ctx, properties)
+        print '%-8s %12d %12.4f' % (name, matched, elapsed)
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+"""
+Profile the registry's conversion of image models into the dicts it
+serializes in its responses.
+
+IMAGES synthetic images (10000 by default), each with PROPERTIES image
+properties (10 by default), are loaded into an in-memory sqlite database
+and fetched as models, as the registry's index and detail calls do. The
+time taken by make_image_dict over all of them is printed, followed by
+the profile of the conversion.
+
+    profile_make_image_dict.py [IMAGES [PROPERTIES]]
+"""
+
+import cProfile
+import gettext
+import pstats
+import sys
+import time
+
+gettext.install('glance', unicode=1)
+
+from glance import context
+import glance.db.sqlalchemy.api as db_api
+from glance.db.sqlalchemy import models
+from glance.openstack.common import cfg
+from glance.openstack.common import timeutils
+from glance.registry.api.v1 import images
+
+CONF = cfg.CONF
+
+
+def load(engine, image_count, property_count):
+    now = timeutils.utcnow()
+    image_rows = []
+    property_rows = []
+    for i in xrange(image_count):
+        image_id = 'image-%08d' % i
+        image_rows.append({'id': image_id,
+                           'name': 'image %d' % i,
+                           'status': 'active',
+                           'is_public': True,
+                           'disk_format': 'qcow2',
+                           'container_format': 'bare',
+                           'size': 1024 * i,
+                           'checksum': '%032x' % i,
+                           'created_at': now,
+                           'deleted': False})
+        for j in xrange(property_count):
+            property_rows.append({'image_id': image_id,
+                                  'name': 'property-%d' % j,
+                                  'value': 'value-%d' % j,
+                                  'created_at': now,
+                                  'deleted': False})
+    engine.execute(models.Image.__table__.insert(), image_rows)
+    if property_rows:
+        engine.execute(models.ImageProperty.__table__.insert(),
+                       property_rows)
+
+
+def convert(image_refs):
+    return [images.make_image_dict(image_ref) for image_ref in image_refs]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 or '-h' in sys.argv[1:]:
+        print __doc__
+        sys.exit(1)
+
+    image_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    property_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    CONF(args=[], project='glance')
+    CONF.set_override('sql_connection', 'sqlite://')
+    CONF.set_override('db_auto_create', True)
+    db_api.configure_db()
+    load(db_api.get_session().get_bind(), image_count, property_count)
+
+    ctx = context.RequestContext(is_admin=True)
+    image_refs = db_api.image_get_all(ctx)
+
+    start = time.time()
+    convert(image_refs)
+    print 'converted %d images in %.3fs' % (len(image_refs),
+                                            time.time() - start)
+
+    profile = cProfile.Profile()
+    profile.runcall(convert, image_refs)
+    stats = pstats.Stats(profile)
+    stats.sort_stats('cumulative').print_stats(15)
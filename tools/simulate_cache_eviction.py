@@ -0,0 +1,46 @@
+#!/usr/bin/python
+
+"""
+Replay a trace of image reads against each image cache eviction policy
+and compare their hit ratios.
+
+The trace has one line for each read of an image, in the order they
+happened, with the image ID and the size of the image in bytes separated
+by whitespace, e.g. as extracted from the access logs of an API server.
+
+    simulate_cache_eviction.py TRACE_FILE MAX_CACHE_SIZE [POLICY ...]
+"""
+
+import gettext
+import sys
+
+gettext.install('glance', unicode=1)
+
+from glance.image_cache import eviction
+
+
+def read_trace(path):
+    with open(path) as trace_file:
+        for line in trace_file:
+            fields = line.split()
+            if len(fields) >= 2:
+                yield fields[0], int(fields[1])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print __doc__
+        sys.exit(1)
+
+    trace = list(read_trace(sys.argv[1]))
+    max_size = int(sys.argv[2])
+    names = sys.argv[3:] or sorted(eviction.POLICIES)
+
+    print '%-8s %12s %12s %10s %10s' % (
+        'policy', 'reads', 'hits', 'hit ratio', 'byte ratio')
+    for name in names:
+        result = eviction.simulate(eviction.get_policy(name), trace, max_size)
+        print '%-8s %12d %12d %10.4f %10.4f' % (name, result['reads'],
+                                                result['hits'],
+                                                result['hit_ratio'],
+                                                result['byte_hit_ratio'])